@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+piecewise_signal_benchmark.py:
+
+   Query-time evaluation of MultiVariablePiecewiseSignal over a scripted
+   actuator profile with 10^6 query points. Also checks that a vectorized
+   query gives the same result as querying the points one by one.
+
+   Run with:
+       python3 piecewise_signal_benchmark.py [n_queries]
+"""
+
+import sys
+import os
+# Add the src directory to the system path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import time
+import numpy as np
+from smarc_modelling.lib.gnc import MultiVariablePiecewiseSignal
+
+
+def actuator_profile():
+    """
+    VBS, LCG, stern, rudder and rpm profile over 0-600 s with all piece
+    types and out-of-range modes.
+    """
+    vbs = [
+        {"interval": (0, 100), "name": "constant", "params": {"val": 50}},
+        {"interval": (100, 200), "name": "ramp", "params": {"start_val": 50, "end_val": 80}, "continuity": True},
+        {"interval": (200, 500), "name": "data", "params": {"data_points": [(200, 80), (300, 20), (400, 60), (500, 50)],
+                                                            "interp_method": "pchip"}, "out_of_range": "continue"},
+    ]
+    lcg = [
+        {"interval": (0, 300), "name": "sin", "params": {"freq": 0.01, "amp": 30}},
+        {"interval": (300, 500), "name": "custom", "params": {"formula": "50 + 10*cos(t/20)"}, "time_mode": "relative",
+         "out_of_range": "function"},
+    ]
+    stern = [
+        {"interval": (10, 500), "name": "square", "params": {"period": 20, "upper": 0.1, "lower": -0.1},
+         "out_of_range": "zero"},
+    ]
+    rudder = [
+        {"interval": (0, 250), "name": "cos", "params": {"freq": 0.05, "amp": 0.12}},
+        {"interval": (300, 500), "name": "ramp", "params": {"start_val": 0, "slope": 0.001}, "out_of_range": "continue"},
+    ]
+    rpm = [
+        {"interval": (0, 500), "name": "constant", "params": {"val": 1000}, "out_of_range": "continue"},
+    ]
+    return MultiVariablePiecewiseSignal(np.linspace(0, 500, 501), [vbs, lcg, stern, rudder, rpm])
+
+
+def run_benchmark(n_queries=10**6):
+    signal = actuator_profile()
+    t = np.random.default_rng(0).uniform(-10, 600, n_queries)
+
+    start = time.perf_counter()
+    values = signal(t)
+    elapsed = time.perf_counter() - start
+
+    # Point-wise queries, incl. the interval boundaries
+    t_check = np.concatenate([t[:200], [0, 10, 100, 200, 250, 300, 500]])
+    pointwise = np.array([[v[0] for v in signal([tq])] for tq in t_check]).T
+    vectorized = np.array(signal(t_check))
+    err = np.max(np.abs(pointwise - vectorized))
+
+    print(f"{n_queries} queries x {len(values)} variables: {elapsed*1e3:8.1f} ms "
+          f"({elapsed/n_queries*1e9:.1f} ns/query)")
+    print(f"Max deviation vectorized vs point-wise: {err:.3e}")
+
+
+if __name__ == "__main__":
+    n_queries = int(sys.argv[1]) if len(sys.argv) > 1 else 10**6
+    run_benchmark(n_queries)
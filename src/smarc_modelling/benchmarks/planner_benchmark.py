@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+planner_benchmark.py:
+
+   Headless and reproducible batch benchmark of the motion planner, built on
+   the trial loop of StatisticalAnalysis.runStatisticalAnalysis.
+
+   For every seed and complexity class (MapGeneration.evaluateComplexityMap)
+   the same random map is generated with MapGeneration.generateMapOfComplexity,
+   and every planner configuration of CONFIGS is run on it. Each trial runs in
+   its own process (several in parallel), the primitives are generated within
+   that process. Per trial one JSON line is written to the results file with
+   wall time, expansions, generated nodes, dynamics (RHS) evaluations, peak
+   memory and the success / failing notes.
+
+   Run with:
+       python3 planner_benchmark.py run results.jsonl [--seeds 0 1 2] [--complexities 0 1 2 3]
+                                                     [--configs heading adaptive] [--processes N]
+       python3 planner_benchmark.py report results.jsonl [more_results.jsonl ...]
+
+   The report compares the configurations (and result files) trial by trial.
+"""
+
+import sys
+import os
+# Add the src directory to the system path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import io
+import json
+import time
+import argparse
+import resource
+import contextlib
+import multiprocessing
+import numpy as np
+
+# Planner configurations: search ("auto": single tree for complexity 0, double tree otherwise, "anytime"),
+# cost function (1-Astar 2-AdaptiveAstar 3-HeadingConstraint), dec and the time budget of the anytime search
+CONFIGS = {
+    "heading":  {"search": "auto", "typeFunction": 3, "dec": 0.5},
+    "adaptive": {"search": "auto", "typeFunction": 2, "dec": 0.5},
+    "astar":    {"search": "auto", "typeFunction": 1, "dec": 0.5},
+    "anytime":  {"search": "anytime", "typeFunction": 1, "dec": 0.5, "time_budget": 60},
+}
+
+
+def run_trial(trial):
+    """
+    Run one (seed, complexity, configuration) trial, it returns the record of the results file
+    """
+    seed, complexity, name, config = trial
+
+    stats = {"expansions": 0, "nodes": 0, "rhs_evaluations": 0}
+    search = config["search"]
+    if search == "auto":
+        search = "single" if complexity == 0 else "double"
+
+    log = io.StringIO()
+    start = time.perf_counter()
+    try:
+        # Imported in the trial, s.t. a failing import is recorded as the error of the trial
+        import matplotlib
+        matplotlib.use("Agg")
+        import smarc_modelling.motion_planning.MotionPrimitives.MapGeneration as MapGen
+        from smarc_modelling.motion_planning.MotionPrimitives.GenerationTree import a_star_search, double_a_star_search
+        from smarc_modelling.motion_planning.MotionPrimitives.AnytimeSearch import anytime_a_star_search
+
+        map_instance = MapGen.generateMapOfComplexity(complexity, seed)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(log):
+            if search == "single":
+                trajectory, success, notes = a_star_search(None, None, map_instance, False, config["typeFunction"], config["dec"], usePool=False, stats=stats)
+            elif search == "double":
+                trajectory, success, notes = double_a_star_search(None, None, map_instance, False, config["typeFunction"], config["dec"], usePool=False, stats=stats)
+            else:
+                trajectory, success, notes = anytime_a_star_search(map_instance, config["typeFunction"], config["dec"], config["time_budget"], usePool=False, stats=stats)
+    except Exception as error:
+        trajectory, success, notes = [], 0, f"error: {error!r}"
+    wall_time = time.perf_counter() - start
+
+    return {"config": name, "seed": seed, "complexity": complexity, "search": search,
+            "success": bool(success), "notes": notes, "wall_time": wall_time,
+            "expansions": stats["expansions"], "nodes": stats["nodes"], "rhs_evaluations": stats["rhs_evaluations"],
+            "peak_memory_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "trajectory_length": len(trajectory)}
+
+
+def run(path, seeds, complexities, configs, processes=None):
+    trials = [(seed, complexity, name, CONFIGS[name]) for seed in seeds for complexity in complexities for name in configs]
+    print(f"{len(trials)} trials ({len(seeds)} seeds x {len(complexities)} complexities x {len(configs)} configurations)")
+
+    # One process per trial (maxtasksperchild=1), s.t. the peak memory is the one of the trial
+    with multiprocessing.Pool(processes, maxtasksperchild=1) as pool, open(path, "a") as f:
+        for record in pool.imap_unordered(run_trial, trials):
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            print(f"{record['config']:>10} seed {record['seed']:>4} complexity {record['complexity']}: "
+                  f"{record['notes']:<22} {record['wall_time']:8.1f} s {record['expansions']:6d} expansions")
+
+
+def load(paths):
+    """
+    Records of the results files, the config name is prefixed with the file if there is more than one
+    """
+    records = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                if len(paths) > 1:
+                    record["config"] = f"{os.path.basename(path)}:{record['config']}"
+                records.append(record)
+    return records
+
+
+def report(paths):
+    records = load(paths)
+    configs = list(dict.fromkeys(record["config"] for record in records))
+    by_trial = {(r["config"], r["seed"], r["complexity"]): r for r in records}
+    baseline = configs[0]
+
+    print(f"{'configuration':>30} {'trials':>6} {'success':>8} {'time [s]':>9} {'expansions':>10} {'nodes':>9} {'RHS evals':>11} {'memory [MB]':>11} {'time vs ' + baseline:>20}")
+    for config in configs:
+        rows = [r for r in records if r["config"] == config]
+        median = lambda key: np.median([r[key] for r in rows])
+
+        # Time relative to the baseline on the trials that both solved
+        ratios = [r["wall_time"] / by_trial[(baseline, r["seed"], r["complexity"])]["wall_time"] for r in rows
+                  if r["success"] and by_trial.get((baseline, r["seed"], r["complexity"]), {}).get("success")]
+        ratio = f"{np.exp(np.mean(np.log(ratios))):.2f}x" if ratios else "-"
+
+        print(f"{config:>30} {len(rows):6d} {np.mean([r['success'] for r in rows]):8.0%} {median('wall_time'):9.1f} "
+              f"{median('expansions'):10.0f} {median('nodes'):9.0f} {median('rhs_evaluations'):11.0f} {median('peak_memory_mb'):11.0f} {ratio:>20}")
+
+    # Failing notes
+    print()
+    for config in configs:
+        notes = [r["notes"] for r in records if r["config"] == config and not r["success"]]
+        if notes:
+            counts = {note: notes.count(note) for note in dict.fromkeys(notes)}
+            print(f"{config}: " + ", ".join(f"{note} ({count})" for note, count in counts.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch benchmark of the motion planner")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser_run = subparsers.add_parser("run", help="run the trials and append them to the results file")
+    parser_run.add_argument("results")
+    parser_run.add_argument("--seeds", type=int, nargs="+", default=list(range(10)))
+    parser_run.add_argument("--complexities", type=int, nargs="+", default=[0, 1, 2, 3])
+    parser_run.add_argument("--configs", nargs="+", default=["heading"], choices=list(CONFIGS))
+    parser_run.add_argument("--processes", type=int, default=None)
+    parser_report = subparsers.add_parser("report", help="compare the configurations of one or more results files")
+    parser_report.add_argument("results", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args.results, args.seeds, args.complexities, args.configs, args.processes)
+    else:
+        report(args.results)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+primitive_rollout_benchmark.py:
+
+   Time of one planner expansion: all primitives of get_neighbors rolled out
+   one by one with curvePrimitives compared to a single
+   curvePrimitives_batch call. Also checks that both give the same
+   primitives, costs and masks.
+
+   Run with:
+       python3 primitive_rollout_benchmark.py [n_repeat]
+"""
+
+import sys
+import os
+# Add the src directory to the system path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import time
+import numpy as np
+from smarc_modelling.motion_planning.MotionPrimitives.MotionPrimitives import SAM_PRIMITIVES
+from smarc_modelling.motion_planning.MotionPrimitives.GenerationTree import primitive_input_pairs
+from smarc_modelling.motion_planning.MotionPrimitives.ObstacleChecker import calculate_angle_velocityGoal
+
+
+def test_map():
+    """
+    10 x 10 x 5 m tank with the goal 4 m ahead of the start.
+    """
+    return {"TileSize": 0.5, "x_min": 0, "y_min": 0, "z_min": 0, "x_max": 10, "y_max": 10, "z_max": 5,
+            "start_pos": (2, 5, 2.5), "goal_pixel": (6, 5, 2.5), "obstacleDict": set()}
+
+
+def run_benchmark(n_repeat=3):
+    sim = SAM_PRIMITIVES()
+    map_instance = test_map()
+    input_pairs = primitive_input_pairs()
+
+    x0 = np.zeros(19)
+    x0[0:3] = map_instance["start_pos"]
+    x0[3] = 1.0
+    x0[7] = 0.5
+    x0[13:15] = 50
+    alpha = calculate_angle_velocityGoal(x0, map_instance, 1)
+
+    start = time.perf_counter()
+    for _ in range(n_repeat):
+        single = [sim.curvePrimitives(x0, inputs[:5], inputs[5:], map_instance, alpha, 1) for inputs in input_pairs]
+    t_single = (time.perf_counter() - start) / n_repeat
+
+    start = time.perf_counter()
+    for _ in range(n_repeat):
+        data, costs, inObs, arrived = sim.curvePrimitives_batch(x0, input_pairs, map_instance, alpha, 1)
+    t_batch = (time.perf_counter() - start) / n_repeat
+
+    # Compare the valid primitives
+    err = 0.0
+    for ii, (data_ii, cost_ii, inObs_ii, arrived_ii, _) in enumerate(single):
+        assert inObs_ii == inObs[ii]
+        if not inObs_ii:
+            assert arrived_ii == arrived[ii]
+            err = max(err, np.max(np.abs(data_ii - data[ii])), abs(cost_ii - costs[ii]))
+
+    print(f"{len(input_pairs)} primitives, {np.count_nonzero(~inObs)} valid, {np.count_nonzero(arrived)} arrived")
+    print(f"curvePrimitives (loop):   {t_single*1e3:8.1f} ms per expansion")
+    print(f"curvePrimitives_batch:    {t_batch*1e3:8.1f} ms per expansion ({t_single/t_batch:.1f}x)")
+    print(f"Max deviation batch vs loop: {err:.3e}")
+
+
+if __name__ == "__main__":
+    n_repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    run_benchmark(n_repeat)
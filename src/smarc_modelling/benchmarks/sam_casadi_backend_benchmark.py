@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sam_casadi_backend_benchmark.py:
+
+   Latency of SAM.dynamics() with the NumPy and the CasADi backend, both
+   interpreted and compiled, and throughput of the mapped batch evaluation.
+   The deviation from the NumPy model is reported as well, it should be at
+   the level of the floating point round-off.
+
+   Run with:
+       python3 sam_casadi_backend_benchmark.py [n_calls]
+"""
+
+import sys
+import os
+# Add the src directory to the system path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import numpy as np
+from smarc_modelling.vehicles.SAM import SAM
+from smarc_modelling.benchmarks.sam_rhs_benchmark import random_states, time_per_call
+
+
+def run_benchmark(n_calls=2000):
+    sam = SAM(dt=0.02)
+    X, U = random_states(1000)
+    reference = sam.dynamics_batch(X, U)
+
+    x, u = X[0], U[0]
+    t_numpy = time_per_call(lambda: sam.dynamics(x, u), n_calls)
+    print(f"{'numpy':>16}: {t_numpy:8.2f} us/call")
+
+    for compile in (False, True):
+        sam.set_backend("casadi", compile=compile, n_threads=os.cpu_count())
+        name = "casadi compiled" if compile else "casadi"
+
+        err = np.max(np.abs(sam.dynamics_batch(X, U) - reference) / (1 + np.abs(reference)))
+        t = time_per_call(lambda: sam.dynamics(x, u), n_calls)
+        t_batch = time_per_call(lambda: sam.dynamics_batch(X, U), max(n_calls // 100, 1)) / len(X)
+        print(f"{name:>16}: {t:8.2f} us/call, {t_batch:8.2f} us/sample batched, "
+              f"max rel. deviation {err:.2e}")
+
+    sam.set_backend("numpy")
+
+
+if __name__ == "__main__":
+    n_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    run_benchmark(n_calls)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sam_mass_table_benchmark.py:
+
+   Accuracy and speed of the SAM mass property cache (MassPropertyTable)
+   compared to the analytic computation in calculate_cg, update_inertias and
+   calculate_M. For the interpolated table the error is reported for
+   different grid resolutions, and the batch throughput, where its lookup
+   is vectorized.
+
+   Run with:
+       python3 sam_mass_table_benchmark.py [n_calls]
+"""
+
+import sys
+import os
+# Add the src directory to the system path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import timeit
+import numpy as np
+from smarc_modelling.vehicles.SAM import SAM
+from smarc_modelling.benchmarks.sam_rhs_benchmark import random_states
+
+
+def max_relative_error(sam, X, U, reference):
+    """
+    Max error of dynamics() relative to the reference derivatives.
+    """
+    x_dot = np.array([sam.dynamics(x, u) for x, u in zip(X, U)])
+    return np.max(np.abs(x_dot - reference) / (1 + np.abs(reference)))
+
+
+def run_benchmark(n_calls=2000):
+    sam = SAM(dt=0.02)
+    X, U = random_states(200)
+    reference = np.array([sam.dynamics(x, u) for x, u in zip(X, U)])
+
+    x, u = X[0], U[0]
+    t_analytic = min(timeit.repeat(lambda: sam.dynamics(x, u), number=n_calls, repeat=3)) / n_calls * 1e6
+    print(f"{'analytic':>24}: {t_analytic:8.2f} us/call")
+
+    for n_grid in (11, 26, 51, 101):
+        sam.use_mass_table("interpolate", n_vbs=n_grid, n_lcg=n_grid)
+        err = max_relative_error(sam, X, U, reference)
+        t = min(timeit.repeat(lambda: sam.dynamics(x, u), number=n_calls, repeat=3)) / n_calls * 1e6
+        print(f"{f'interpolate {n_grid}x{n_grid}':>24}: {t:8.2f} us/call, max rel. error {err:.2e}")
+
+    for decimals in (None, 1):
+        sam.use_mass_table("memoize", decimals=decimals)
+        err = max_relative_error(sam, X, U, reference)
+        t = min(timeit.repeat(lambda: sam.dynamics(x, u), number=n_calls, repeat=3)) / n_calls * 1e6
+        print(f"{f'memoize decimals={decimals}':>24}: {t:8.2f} us/call, max rel. error {err:.2e}")
+
+    sam.use_mass_table(None)
+    t_batch = min(timeit.repeat(lambda: sam.dynamics_batch(X, U), number=n_calls // 100 + 1, repeat=3)) / (n_calls // 100 + 1) / len(X) * 1e6
+    print(f"{'analytic batch':>24}: {t_batch:8.2f} us/sample")
+
+    sam.use_mass_table("interpolate")
+    t_batch = min(timeit.repeat(lambda: sam.dynamics_batch(X, U), number=n_calls // 100 + 1, repeat=3)) / (n_calls // 100 + 1) / len(X) * 1e6
+    print(f"{'interpolate batch':>24}: {t_batch:8.2f} us/sample")
+
+    sam.use_mass_table(None)
+
+
+if __name__ == "__main__":
+    n_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    run_benchmark(n_calls)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sam_rhs_benchmark.py:
+
+   Micro-benchmark for the single-state SAM right-hand side. Compares the
+   latency of SAM.dynamics (instance based) against SAM.dynamics_rhs
+   (stateless, writes into a preallocated buffer) and checks that both
+   return the same derivative.
+
+   Run with:
+       python3 sam_rhs_benchmark.py [n_calls]
+"""
+
+import sys
+import os
+# Add the src directory to the system path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import timeit
+import numpy as np
+from smarc_modelling.vehicles.SAM import SAM
+
+
+def random_states(n, seed=0):
+    """
+    Random, but physically plausible, states and inputs for SAM.
+    """
+    rng = np.random.default_rng(seed)
+    X = np.zeros((n, 19))
+    X[:, 0:3] = rng.normal(size=(n, 3))
+    q = rng.normal(size=(n, 4))
+    X[:, 3:7] = q / np.linalg.norm(q, axis=1, keepdims=True)
+    X[:, 7:13] = 0.5 * rng.normal(size=(n, 6))
+    X[:, 13:15] = rng.uniform(0, 100, (n, 2))
+    X[:, 15:17] = rng.uniform(-0.12, 0.12, (n, 2))
+    X[:, 17:19] = rng.uniform(-1500, 1500, (n, 2))
+
+    U = np.zeros((n, 6))
+    U[:, 0:2] = rng.uniform(0, 100, (n, 2))
+    U[:, 2:4] = rng.uniform(-0.12, 0.12, (n, 2))
+    U[:, 4:6] = rng.uniform(-1500, 1500, (n, 2))
+    return X, U
+
+
+def time_per_call(fun, n_calls, repeat=5):
+    """
+    Best-of-repeat latency of fun() in microseconds.
+    """
+    return min(timeit.repeat(fun, number=n_calls, repeat=repeat)) / n_calls * 1e6
+
+
+def run_benchmark(n_calls=10000):
+    sam = SAM(dt=0.02, V_current=0.2, beta_current=30)
+    X, U = random_states(100)
+
+    # Correctness check
+    x_dot = np.empty(19)
+    err = max(np.max(np.abs(sam.dynamics_rhs(x, u, x_dot) - sam.dynamics(x, u)))
+              for x, u in zip(X, U))
+
+    x, u = X[0], U[0]
+    t_dynamics = time_per_call(lambda: sam.dynamics(x, u), max(n_calls // 10, 1))
+    t_rhs = time_per_call(lambda: sam.dynamics_rhs(x, u, x_dot), n_calls)
+
+    print(f"Max abs deviation dynamics_rhs vs dynamics: {err:.3e}")
+    print(f"SAM.dynamics:     {t_dynamics:8.2f} us/call")
+    print(f"SAM.dynamics_rhs: {t_rhs:8.2f} us/call")
+    print(f"Speedup:          {t_dynamics/t_rhs:8.1f}x")
+    print(f"RK4 step (4 RHS): {4*t_rhs:8.2f} us")
+
+    return t_dynamics, t_rhs
+
+
+if __name__ == "__main__":
+    n_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    run_benchmark(n_calls)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tree_intersection_benchmark.py:
+
+   Time of the double-tree intersection while both trees grow: a KDTree
+   rebuilt from all the nodes at every iteration (previous
+   find_tree_intersection) compared to the incremental TreeConnector.
+   Also checks that both find the same pairs.
+
+   Run with:
+       python3 tree_intersection_benchmark.py [n_iterations] [nodes_per_iteration]
+"""
+
+import sys
+import os
+# Add the src directory to the system path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import time
+import numpy as np
+from scipy.spatial import KDTree
+from smarc_modelling.motion_planning.MotionPrimitives.SpatialIndex import TreeConnector
+from smarc_modelling.lib.quaternion import relative_angle
+from smarc_modelling.motion_planning.MotionPrimitives.SearchGraph import SearchGraph
+
+
+class ExactLattice():
+    """
+    One node per position (no duplicates among random states)
+    """
+    def key(self, state):
+        return (state[0], state[1], state[2])
+
+
+def random_states(rng, n, center):
+    states = np.zeros((n, 19))
+    states[:, :3] = center + rng.normal(0, 2.0, (n, 3))
+    q = rng.normal(0, 1, (n, 4))
+    states[:, 3:7] = q / np.linalg.norm(q, axis=1, keepdims=True)
+    return states
+
+
+def rebuild_pairs(states1, states2, distance, angle):
+    """
+    All pairs within distance and angle, with a KDTree rebuilt from scratch
+    """
+    found = KDTree(states1[:, :3]).query_ball_point(states2[:, :3], distance)
+    pairs = set()
+    for id2, ids in enumerate(found):
+        for id1 in ids:
+            if relative_angle(states1[id1, 3:7], states2[id2, 3:7], degrees=True) < angle:
+                pairs.add((id1, id2))
+    return pairs
+
+
+def run_benchmark(n_iterations=100, nodes_per_iteration=200, distance=1.0, angle=50):
+    rng = np.random.default_rng(0)
+    graph1 = SearchGraph(ExactLattice())
+    graph2 = SearchGraph(ExactLattice())
+    connector = TreeConnector(graph1, graph2)
+    states1 = np.zeros((0, 19))
+    states2 = np.zeros((0, 19))
+    t_rebuild = 0.0
+    t_incremental = 0.0
+    n_incremental = 0
+    for it in range(n_iterations):
+        new1 = random_states(rng, nodes_per_iteration, np.array([0, 0, 0]))
+        new2 = random_states(rng, nodes_per_iteration, np.array([4, 0, 0]))
+        connector.add_nodes(1, [graph1.set_node(s, -1, 0) for s in new1])
+        connector.add_nodes(2, [graph2.set_node(s, -1, 0) for s in new2])
+        states1 = np.vstack([states1, new1])
+        states2 = np.vstack([states2, new2])
+
+        start = time.perf_counter()
+        n_incremental += len(connector.connections(distance, angle))
+        t_incremental += time.perf_counter() - start
+
+        # The rebuild is only timed on a few iterations (it is the slow part)
+        if it % 10 == 9:
+            start = time.perf_counter()
+            rebuild_pairs(states1, states2, distance, angle)
+            t_rebuild += (time.perf_counter() - start) * 10
+
+    pairs = rebuild_pairs(states1, states2, distance, angle)
+    assert len(pairs) == n_incremental, (len(pairs), n_incremental)
+    print(f"{n_iterations} iterations, {len(states1)} + {len(states2)} nodes, {n_incremental} pairs")
+    print(f"KDTree rebuilt every iteration: {t_rebuild:8.2f} s (estimated)")
+    print(f"TreeConnector (incremental):    {t_incremental:8.2f} s ({t_rebuild/t_incremental:.1f}x)")
+
+
+if __name__ == "__main__":
+    n_iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    nodes_per_iteration = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    run_benchmark(n_iterations, nodes_per_iteration)
@@ -4,6 +4,8 @@ from smarc_modelling.vehicles import *
 from smarc_modelling.lib import *
 from smarc_modelling.vehicles.BlueROV import BlueROV
 from smarc_modelling.vehicles.SAM import SAM
+from smarc_modelling.lib.integrators import rk4
+from smarc_modelling.lib.trajectory_writer import load_trajectory
 
 import matplotlib
 import matplotlib.pyplot as plt
@@ -45,21 +47,15 @@ class Sol():
         self.t = t
         self.y = data
 
-        
-def rk4(x, u, dt, fun):
-    k1 = fun(x, u)
-    k2 = fun(x+dt/2*k1, u)
-    k3 = fun(x+dt/2*k2, u)
-    k4 = fun(x+dt*k3, u)
-
-    x_t = x + dt/6 * (k1 + 2*k2 + 2*k3 + k4)
-
-    return x_t
 
 # FIXME: consider removing the dynamics wrapper and just call the dynamics straight away.
-def run_simulation(t_span, x0, dt, blueROV):
+def run_simulation(t_span, x0, dt, blueROV, writer=None):
     """
     Run BlueROV simulation using RK4.
+
+    writer: Optional TrajectoryWriter with 1 + 13 + 6 columns. The rows
+        [t, x, u] are streamed to it and only the current state is kept in
+        memory. The returned solution is read back memory-mapped.
     """
     u = np.zeros(6)
     u[0] =  20  # force in x-direction
@@ -75,39 +71,53 @@ def run_simulation(t_span, x0, dt, blueROV):
     # Run integration
     print(f" Start simulation")
 
-    data = np.empty((nx + nu, n_sim))
+    # When streaming, only the current and the next state are kept
+    n_columns = n_sim if writer is None else 2
+    data = np.empty((nx + nu, n_columns))
     data[:nx,0] = x0
     data[nx:,0] = u
+    if writer is not None:
+        writer.append(np.concatenate([[t_eval[0]], data[:,0]]))
 
     in_ENU = False
     frame_message_printed = False
 
     for i in range(n_sim-1):
+        k, k_next = i % n_columns, (i+1) % n_columns
         if in_ENU is True:
             if not frame_message_printed:
                 print("You provide x0 and u in ENU")
                 print("You get x and u in ENU")
                 frame_message_printed = True
 
-            pos_ned, quat_ned= enu_to_ned(data[:3,i], data[3:7,i])
+            pos_ned, quat_ned= enu_to_ned(data[:3,k], data[3:7,k])
             u_NED = u_enu_to_ned(u)
 
-            x_NED = np.concatenate((pos_ned, quat_ned, data[7:nx,i]))
+            x_NED = np.concatenate((pos_ned, quat_ned, data[7:nx,k]))
 
             x_new_NED = rk4(x_NED, u_NED, dt, blueROV.dynamics)
             pos_enu, quat_enu = ned_to_enu(x_new_NED[:3], x_new_NED[3:7])
-            data[:3,i+1] = pos_enu
-            data[3:7,i+1] = quat_enu
-            data[7:nx,i+1] = x_new_NED[7:nx]
-            data[nx:,i+1] = u
+            data[:3,k_next] = pos_enu
+            data[3:7,k_next] = quat_enu
+            data[7:nx,k_next] = x_new_NED[7:nx]
+            data[nx:,k_next] = u
         else:
             if not frame_message_printed:
                 print("You provide x0 and u in NED (default)")
                 print("You get x and u in NED (default)")
                 frame_message_printed = True
-            data[:nx,i+1] = rk4(data[:nx,i], u, dt, blueROV.dynamics)
-            data[nx:,i+1] = u
-    sol = Sol(t_eval,data)
+            data[:nx,k_next] = rk4(data[:nx,k], u, dt, blueROV.dynamics)
+            data[nx:,k_next] = u
+
+        if writer is not None:
+            writer.append(np.concatenate([[t_eval[i+1]], data[:,k_next]]))
+
+    if writer is None:
+        sol = Sol(t_eval,data)
+    else:
+        writer.close()
+        trajectory = load_trajectory(writer.path)
+        sol = Sol(trajectory[:,0], trajectory[:,1:].T)
     print(f" Simulation complete!")
 
     return sol
@@ -3,6 +3,7 @@ from acados_template import AcadosOcp, AcadosOcpSolver, AcadosSimSolver, AcadosM
 import numpy as np
 import casadi as ca
 import os
+from smarc_modelling.lib.acados_cache import cached_solver
 
 
 #The original NMPC class. Uses hard constraints.
@@ -12,7 +13,8 @@ class NMPC:
         :param casadi_model: The casadi model to be used
         :param Ts: Sampling interval
         :param N_horizon: Control horizon
-        :param update_solver_settings: If True, the solver will be updated with the new settings.
+        :param update_solver_settings: If True, the solver is built again even if it is in the solver cache
+            (the cache already rebuilds it when the model or the settings change, see lib/acados_cache.py).
         '''
         self.ocp   = AcadosOcp()
         self.model = self.export_dynamics_model(casadi_model)
@@ -161,18 +163,8 @@ class NMPC:
         self.ocp.solver_options.globalization = 'MERIT_BACKTRACKING'
         self.ocp.solver_options.regularize_method = 'NO_REGULARIZE'
 
-        # Define the folder path for the .json and c_generated code inside the home directory
-        home_dir = os.path.expanduser("~")
-        save_dir = os.path.join(home_dir, "acados_generated_code")
-        self.ocp.code_export_directory = save_dir
-
-        # Make sure the directory exists
-        os.makedirs(save_dir, exist_ok=True)
-
-        # Setup the solver
-        solver_json = os.path.join(save_dir, 'acados_ocp_' + self.model.name + '.json')
-
-        acados_ocp_solver = AcadosOcpSolver(self.ocp, json_file = solver_json, generate=self.update_solver, build=self.update_solver)
+        # Setup the solver, built once per OCP content (see lib/acados_cache.py)
+        acados_ocp_solver = cached_solver(AcadosOcpSolver, self.ocp, rebuild=self.update_solver)
 
         # Simulation object based on OCP model.
         sim = AcadosSim()
@@ -182,9 +174,7 @@ class NMPC:
         sim.solver_options.T = 0.1
         sim.solver_options.integrator_type = 'IRK'
 
-        sim_json = os.path.join(save_dir, 'acados_sim_' + self.model.name + '.json')
-
-        acados_integrator = AcadosSimSolver(sim, json_file = sim_json, generate=self.update_solver, build=self.update_solver)
+        acados_integrator = cached_solver(AcadosSimSolver, sim, rebuild=self.update_solver)
 
         return acados_ocp_solver, acados_integrator
     
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ensemble_sim.py:
+
+   Monte Carlo ensemble simulation for SAM and the BlueROV. Initial states,
+   inputs, currents and model parameters are drawn from distributions and
+   the rollouts are spread over a process pool. Within a process the SAM
+   rollouts are integrated together with SAM.dynamics_batch where possible.
+   All trajectories are written into one memory-mapped .npy file, s.t. the
+   ensemble never has to fit into RAM and can be read back with
+   np.load(path, mmap_mode="r").
+
+   Distributions are given as
+       value                       constant, scalar or array
+       ("uniform", low, high)      element-wise uniform
+       ("normal", mean, std)       element-wise normal
+       callable(rng, n)            returns n samples
+
+   Model parameters are attributes of the vehicle, in the units of the
+   attribute (e.g. beta_c in rad, not degrees as in the constructor).
+
+   Run with:
+       python3 ensemble_sim.py [n_runs]
+"""
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from smarc_modelling.lib.integrators import rk4
+from smarc_modelling.vehicles.SAM import SAM
+from smarc_modelling.vehicles.BlueROV import BlueROV
+
+# SAM attributes that broadcast over the samples of dynamics_batch. If only
+# these vary, the runs of one chunk are integrated as a single batch.
+BATCH_PARAMETERS = ("V_c", "beta_c", "inertia_factor", "B")
+
+
+def sample(spec, rng, n):
+    """
+    Draw n samples from a distribution spec, see the module docstring.
+    Returns an array with the samples along the first axis.
+    """
+    if callable(spec):
+        return np.asarray(spec(rng, n), dtype=float)
+    if isinstance(spec, tuple) and isinstance(spec[0], str):
+        kind, a, b = spec
+        a = np.asarray(a, dtype=float)
+        b = np.asarray(b, dtype=float)
+        if kind == "uniform":
+            return rng.uniform(a, b, (n,) + a.shape)
+        if kind == "normal":
+            return rng.normal(a, b, (n,) + a.shape)
+        raise ValueError(f"Unknown distribution: {kind}")
+    value = np.asarray(spec, dtype=float)
+    return np.broadcast_to(value, (n,) + value.shape).copy()
+
+
+def create_vehicle(vehicle, dt):
+    if vehicle == "SAM":
+        return SAM(dt)
+    if vehicle == "BlueROV":
+        return BlueROV(dt)
+    raise ValueError(f"Unknown vehicle: {vehicle}")
+
+
+def run_chunk(vehicle, dt, n_steps, out_path, start, x0, u, parameters):
+    """
+    Integrate the runs start:start+len(x0) and write them into the
+    memory-mapped output. Module level s.t. it can be sent to a worker.
+    """
+    out = np.lib.format.open_memmap(out_path, mode="r+")
+    model = create_vehicle(vehicle, dt)
+    n_runs = len(x0)
+    stop = start + n_runs
+
+    if vehicle == "SAM" and all(name in BATCH_PARAMETERS for name in parameters):
+        for name, values in parameters.items():
+            setattr(model, name, values)
+
+        x = x0
+        out[start:stop, 0] = x
+        for k in range(1, n_steps):
+            x = rk4(x, u, dt, model.dynamics_batch)
+            out[start:stop, k] = x
+    else:
+        for i in range(n_runs):
+            for name, values in parameters.items():
+                setattr(model, name, values[i])
+
+            x = x0[i]
+            out[start+i, 0] = x
+            for k in range(1, n_steps):
+                x = rk4(x, u[i], dt, model.dynamics)
+                out[start+i, k] = x
+
+    out.flush()
+    return n_runs
+
+
+class EnsembleSimulator():
+    """
+    EnsembleSimulator(vehicle="SAM")
+
+    Parameters:
+        vehicle (str): "SAM" or "BlueROV"
+        dt (float): Integration step (RK4)
+        t_end (float): Duration of each run
+        n_workers (int): Processes, None for all cores. 1 runs in this process.
+        chunk_size (int): Runs per task. SAM runs of one chunk are integrated
+            as one batch.
+    """
+
+    def __init__(self, vehicle="SAM", dt=0.01, t_end=10, n_workers=None, chunk_size=64):
+        if vehicle not in ("SAM", "BlueROV"):
+            raise ValueError(f"Unknown vehicle: {vehicle}")
+
+        self.vehicle = vehicle
+        self.dt = dt
+        self.t_end = t_end
+        self.n_steps = int(t_end/dt) + 1
+        self.n_workers = n_workers if n_workers is not None else os.cpu_count()
+        self.chunk_size = chunk_size
+
+    def run(self, n_runs, x0, u, V_c=0, beta_c=0, parameters=None, out_path=None, seed=0):
+        """
+        Simulate n_runs rollouts with constant inputs.
+
+        Args:
+            n_runs: Number of rollouts
+            x0, u: Distributions of the initial state and the input
+            V_c, beta_c: Distributions of the current speed and direction (rad)
+            parameters: Dict of vehicle attribute name -> distribution
+            out_path: .npy file for the trajectories, a temporary file if None
+            seed: Seed of the random generator
+
+        Returns:
+            trajectories: Read-only memory map of shape (n_runs, n_steps, nx)
+            samples: Dict with the sampled x0, u and parameters per run
+        """
+        rng = np.random.default_rng(seed)
+        samples = {"x0": sample(x0, rng, n_runs), "u": sample(u, rng, n_runs)}
+
+        # Quaternions have to stay normalized
+        q = samples["x0"][:, 3:7]
+        samples["x0"][:, 3:7] = q / np.linalg.norm(q, axis=1, keepdims=True)
+
+        model_parameters = {"V_c": V_c, "beta_c": beta_c}
+        model_parameters.update(parameters or {})
+        for name, spec in model_parameters.items():
+            samples[name] = sample(spec, rng, n_runs)
+
+        if out_path is None:
+            out_path = os.path.join(tempfile.mkdtemp(prefix="ensemble_"), "trajectories.npy")
+        nx = samples["x0"].shape[1]
+        np.lib.format.open_memmap(out_path, mode="w+", dtype=float,
+                                  shape=(n_runs, self.n_steps, nx)).flush()
+
+        tasks = []
+        for start in range(0, n_runs, self.chunk_size):
+            stop = min(start + self.chunk_size, n_runs)
+            chunk_parameters = {name: samples[name][start:stop] for name in model_parameters}
+            tasks.append((self.vehicle, self.dt, self.n_steps, out_path, start,
+                          samples["x0"][start:stop], samples["u"][start:stop], chunk_parameters))
+
+        if self.n_workers == 1:
+            for task in tasks:
+                run_chunk(*task)
+        else:
+            with ProcessPoolExecutor(self.n_workers) as pool:
+                futures = [pool.submit(run_chunk, *task) for task in tasks]
+                for future in futures:
+                    future.result()
+
+        return np.load(out_path, mmap_mode="r"), samples
+
+
+if __name__ == "__main__":
+    import sys
+    n_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+
+    # SAM cruising with 1000 rpm, uncertain heading, currents and inertia
+    x0_low = np.zeros(19)
+    x0_high = np.zeros(19)
+    x0_low[3] = x0_high[3] = 1.0
+    x0_low[6], x0_high[6] = -0.2, 0.2
+    x0_low[13:15] = x0_high[13:15] = 50
+
+    ensemble = EnsembleSimulator("SAM", dt=0.01, t_end=10)
+    trajectories, samples = ensemble.run(
+        n_runs,
+        x0=("uniform", x0_low, x0_high),
+        u=np.array([50, 50, 0, 0, 1000, 1000]),
+        V_c=("uniform", 0, 0.3),
+        beta_c=("uniform", -np.pi, np.pi),
+        parameters={"inertia_factor": ("normal", 2, 0.2)})
+
+    final_position = trajectories[:, -1, 0:3]
+    print(f" Final position mean: {final_position.mean(axis=0)}, std: {final_position.std(axis=0)}")
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of the built acados solvers.
+
+The code generation and the C build of an acados solver take tens of
+seconds, while loading a built solver takes a fraction of a second. The
+solvers are stored in a directory named after a hash of everything that is
+compiled into them: the CasADi expressions of the model (dynamics, costs,
+constraints), the cost, the constraints and the solver options. A solver is
+generated and built when its hash is not in the cache, and loaded from the
+cache otherwise. Changing the model or an option gives a new hash, so a
+stale solver is never loaded.
+
+    cached_solver(AcadosOcpSolver, ocp)     Built or loaded OCP solver
+    cached_solver(AcadosSimSolver, sim)     Built or loaded integrator
+    content_hash(problem)                   Hash of an AcadosOcp / AcadosSim
+
+Values that the caller overwrites at every solve (e.g. the initial state)
+can be left out of the hash with ignore, so that they do not cause a
+rebuild. The cache directory is ~/.cache/smarc_modelling/acados, or the
+SMARC_ACADOS_CACHE environment variable.
+"""
+
+import os
+import re
+import json
+import fcntl
+import hashlib
+import numpy as np
+import casadi as ca
+
+CACHE_DIR = os.environ.get("SMARC_ACADOS_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "smarc_modelling", "acados"))
+
+# Fields that do not change the built solver
+PATH_FIELDS = {"code_export_directory", "json_file"}
+BUILT_FILE = "built"
+
+
+def field_name(key):
+    """
+    Attribute name without the name mangling of the acados classes (_AcadosOcpCost__W -> W)
+    """
+    return re.sub(r"^_[A-Za-z]\w*?__", "", key)
+
+
+def content(value, ignore, seen):
+    """
+    JSON-serializable content of an acados object, the CasADi expressions are serialized
+    with their whole graph (including the called functions)
+    """
+    if isinstance(value, (ca.SX, ca.MX, ca.DM, ca.Function)):
+        try:
+            return value.serialize()
+        except Exception:
+            return str(value)
+    if isinstance(value, np.ndarray):
+        return content(value.tolist(), ignore, seen)
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return repr(value)
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [content(item, ignore, seen) for item in value]
+    if isinstance(value, dict):
+        return {str(key): content(item, ignore, seen) for key, item in sorted(value.items(), key=lambda item: str(item[0]))}
+    if hasattr(value, "__dict__"):
+        if id(value) in seen:
+            return type(value).__name__
+        seen.add(id(value))
+        fields = {}
+        for key, item in vars(value).items():
+            name = field_name(key)
+            if name in PATH_FIELDS or name in ignore:
+                continue
+            fields[name] = content(item, ignore, seen)
+        return {"class": type(value).__name__, "fields": dict(sorted(fields.items()))}
+
+    # Without memory addresses, the hash must not change between the runs
+    return re.sub(r" at 0x[0-9a-fA-F]+", "", repr(value))
+
+
+def content_hash(problem, ignore=()):
+    """
+    SHA-256 of the content of an AcadosOcp / AcadosSim, without the fields in ignore
+    """
+    data = json.dumps(content(problem, set(ignore), set()), sort_keys=True, allow_nan=False)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def cached_solver(solver_class, problem, ignore=(), cache_dir=None, rebuild=False):
+    """
+    Solver of solver_class (AcadosOcpSolver or AcadosSimSolver) for problem, loaded from the cache
+    or generated and built into it.
+
+    ignore: names of the fields set at runtime, left out of the hash (e.g. ("x0", "lbx_0", "ubx_0"))
+    cache_dir: cache directory, CACHE_DIR by default
+    rebuild: generate and build even if the solver is in the cache
+    """
+    kind = "ocp" if "Ocp" in solver_class.__name__ else "sim"
+    key = content_hash(problem, ignore)
+    solver_dir = os.path.join(cache_dir or CACHE_DIR, f"{problem.model.name}_{kind}_{key[:16]}")
+    json_file = os.path.join(solver_dir, f"acados_{kind}.json")
+    built_file = os.path.join(solver_dir, BUILT_FILE)
+    os.makedirs(solver_dir, exist_ok=True)
+    problem.code_export_directory = solver_dir
+
+    # One build per directory, also between processes
+    with open(solver_dir + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        build = rebuild or not os.path.exists(built_file)
+        if build:
+            print(f"acados {kind} solver not in the cache, building {solver_dir}")
+        solver = solver_class(problem, json_file=json_file, generate=build, build=build)
+        if build:
+            with open(built_file, "w") as f:
+                f.write(key)
+
+    return solver
@@ -16,6 +16,7 @@ import math
 from sympy import symbols, lambdify
 from scipy.interpolate import PchipInterpolator, CubicSpline, interp1d
 from scipy.spatial.transform import Rotation as R
+from smarc_modelling.lib.quaternion import quaternion_to_dcm as _quaternion_to_dcm, quaternion_to_euler as _quaternion_to_euler
 
 #------------------------------------------------------------------------------
 
@@ -253,11 +254,7 @@ def quaternion_to_dcm(q):
         numpy array: 3x3 Direction Cosine Matrix (DCM)
     """
 
-    # "Normal" version
-    rot = R.from_quat(q, scalar_first=True)
-    dcm = rot.as_matrix()
-
-    return dcm
+    return _quaternion_to_dcm(q)
 # ------------------------------------------------------------------------------
 
 
@@ -275,10 +272,25 @@ def quaternion_to_angles(q):
         tuple: Euler angles (psi, theta, phi) in radians, that is phi=roll, theta=pitch, psi=yaw)
     """
 
-    rot = R.from_quat(q, scalar_first=True)
-    rot_euler = rot.as_euler('xyz')
-    phi, theta, psi = rot_euler
+    phi, theta, psi = _quaternion_to_euler(q)
+
+    return psi, theta, phi
+# ------------------------------------------------------------------------------
+
+def quaternion_to_dcm_batch(q):
+    """
+    Vectorized quaternion_to_dcm() for an (N, 4) array of quaternions
+    [q0, q1, q2, q3], with scalar part q0. Returns an (N, 3, 3) array.
+    """
+    return _quaternion_to_dcm(q)
+
 
+def quaternion_to_angles_batch(q):
+    """
+    Vectorized quaternion_to_angles() for an (N, 4) array of quaternions
+    [q0, q1, q2, q3]. Returns the tuple (psi, theta, phi) of (N,) arrays.
+    """
+    phi, theta, psi = _quaternion_to_euler(q)
     return psi, theta, phi
 # ------------------------------------------------------------------------------
 
@@ -363,6 +375,39 @@ def m2c(M, nu):
     return C
 #------------------------------------------------------------------------------
 
+def Smtrx_batch(a):
+    """
+    S = Smtrx_batch(a) stacks the skew-symmetric matrices Smtrx(a_i) of an
+    (N, 3) array of vectors into an (N, 3, 3) array.
+    """
+    S = np.zeros(a.shape[:-1] + (3, 3))
+    S[..., 0, 1] = -a[..., 2]
+    S[..., 0, 2] = a[..., 1]
+    S[..., 1, 0] = a[..., 2]
+    S[..., 1, 2] = -a[..., 0]
+    S[..., 2, 0] = -a[..., 1]
+    S[..., 2, 1] = a[..., 0]
+    return S
+#------------------------------------------------------------------------------
+
+def m2c_batch(M, nu):
+    """
+    C = m2c_batch(M,nu) vectorized 6-DOF version of m2c() for (N, 6, 6) mass
+    matrices and (N, 6) velocities. Returns an (N, 6, 6) array.
+    """
+    M = 0.5 * (M + np.swapaxes(M, -1, -2))
+
+    dt_dnu = np.einsum('nij,nj->ni', M, nu)
+    S1 = Smtrx_batch(dt_dnu[:, 0:3])
+
+    C = np.zeros(M.shape)
+    C[:, 0:3, 3:6] = -S1
+    C[:, 3:6, 0:3] = -S1
+    C[:, 3:6, 3:6] = -Smtrx_batch(dt_dnu[:, 3:6])
+
+    return C
+#------------------------------------------------------------------------------
+
 def Hoerner(B,T):
     """
     CY_2D = Hoerner(B,T)
@@ -592,6 +637,78 @@ def gvect(W,B,theta,phi,r_bg,r_bb):
     return g
 
 
+def gvect_batch(W,B,theta,phi,r_bg,r_bb):
+    """
+    g = gvect_batch(W,B,theta,phi,r_bg,r_bb) vectorized version of gvect().
+    W, B, theta and phi are scalars or (N,) arrays, r_bg and r_bb are (3,)
+    or (N, 3) arrays. Returns an (N, 6) array.
+    """
+    sth  = np.sin(theta)
+    cth  = np.cos(theta)
+    sphi = np.sin(phi)
+    cphi = np.cos(phi)
+
+    r_bg = np.atleast_2d(r_bg)
+    r_bb = np.atleast_2d(r_bb)
+    Wg = r_bg * np.reshape(W, (-1, 1))
+    Bb = r_bb * np.reshape(B, (-1, 1))
+    dx, dy, dz = (Wg - Bb).T
+
+    g = np.stack(np.broadcast_arrays(
+        (W-B) * sth,
+        -(W-B) * cth * sphi,
+        -(W-B) * cth * cphi,
+        -dy * cth * cphi + dz * cth * sphi,
+        dz * sth         + dx * cth * cphi,
+        -dx * cth * sphi - dy * sth
+        ), axis=-1)
+
+    return g
+
+
+def block_diag_solve(M, f):
+    """
+    nu_dot = block_diag_solve(M,f) solves M nu_dot = f for a 6-DOF mass
+    matrix M = blkdiag(diag(m11, m22, m33), M22) with a symmetric 3x3
+    rotational block M22, as used for SAM where the CG offset is not in MRB.
+    The translational part is a division, the rotational part is solved
+    in closed form with the adjugate of M22 (Cramer's rule). No dense
+    inverse is formed.
+
+    M is (6, 6) or (N, 6, 6), f is (6,) or (N, 6). Returns an array of the
+    shape of f.
+    """
+    Mxx = M[..., 3, 3]
+    Myy = M[..., 4, 4]
+    Mzz = M[..., 5, 5]
+    Mxy = M[..., 3, 4]
+    Mxz = M[..., 3, 5]
+    Myz = M[..., 4, 5]
+
+    # Adjugate of the symmetric rotational block
+    c00 = Myy*Mzz - Myz*Myz
+    c01 = Mxz*Myz - Mxy*Mzz
+    c02 = Mxy*Myz - Mxz*Myy
+    c11 = Mxx*Mzz - Mxz*Mxz
+    c12 = Mxy*Mxz - Mxx*Myz
+    c22 = Mxx*Myy - Mxy*Mxy
+    det = Mxx*c00 + Mxy*c01 + Mxz*c02
+
+    f3 = f[..., 3]
+    f4 = f[..., 4]
+    f5 = f[..., 5]
+
+    x = np.empty(np.broadcast_shapes(M.shape[:-1], f.shape))
+    x[..., 0] = f[..., 0] / M[..., 0, 0]
+    x[..., 1] = f[..., 1] / M[..., 1, 1]
+    x[..., 2] = f[..., 2] / M[..., 2, 2]
+    x[..., 3] = (c00*f3 + c01*f4 + c02*f5) / det
+    x[..., 4] = (c01*f3 + c11*f4 + c12*f5) / det
+    x[..., 5] = (c02*f3 + c12*f4 + c22*f5) / det
+
+    return x
+
+
 def calculate_dcm(order, angles):
     """
     Calculates the Direction Cosine Matrix (DCM) for a given rotation order and angles.
@@ -917,10 +1034,12 @@ class MultiVariablePiecewiseSignal:
         Evaluates the signals at the given time points `t`.
 
         Query-Time Logic:
-        - For each queried time and each variable, determine which piece interval it falls into.
+        - The query times are sorted once. For each piece, the queries in its interval are found with `np.searchsorted` on the piece boundaries.
+        - Each piece is evaluated with a single vectorized `_evaluate_function` call over all of its query times.
+        - If pieces overlap, a query time belongs to the first piece that contains it.
         - If it's a function-based piece (sin, cos, square, ramp, constant, custom), directly compute using stored piece params and offset.
         - If it's a data-based piece, interpolate using that piece's data and interpolation method.
-        - If the query time is out-of-range, apply the final piece's out_of_range rules.
+        - Query times before the first interval are zero. All other query times that are not in any piece apply the final piece's out_of_range rules.
 
         The `method` parameter is retained for interface compatibility but isn't used to override per-piece interpolation methods.
 
@@ -928,70 +1047,52 @@ class MultiVariablePiecewiseSignal:
         - A list of arrays, one per variable, with the evaluated signals at the queried times.
         """
         t = np.array(t, dtype=float)
+        t_flat = t.ravel()
+        order = np.argsort(t_flat, kind="stable")
+        t_sorted = t_flat[order]
         results = []
 
-        for var_idx, var_info in enumerate(self.variable_info):
-            var_results = np.zeros_like(t, dtype=float)
+        for var_info in self.variable_info:
+            values_sorted = np.zeros_like(t_sorted)
+            assigned = np.zeros(t_sorted.shape, dtype=bool)
 
-            # The last piece defines out-of-range rules for times beyond the last interval
-            last_piece = var_info[-1]
+            for idx, piece in enumerate(var_info):
+                start = piece["start"]
+                end = piece["end"]
 
-            for i, query_time in enumerate(t):
-                piece_found = False
-                # Determine which piece this query time belongs to
-                for idx, piece in enumerate(var_info):
-                    start = piece["start"]
-                    end = piece["end"]
-                    name = piece["name"]
-                    params = piece["params"]
-                    time_mode = piece["time_mode"]
-                    offset = piece["offset"]
-                    out_of_range = piece["out_of_range"]
-                    last_val_piece = piece["last_value"]
-
-                    # Check if query_time falls into this interval.
-                    # If the start matches previous piece's end, start is exclusive for this piece.
-                    if idx > 0 and np.isclose(start, var_info[idx-1]["end"], atol=1e-15):
-                        in_interval = (query_time > start) and (query_time <= end)
-                    else:
-                        in_interval = (query_time >= start) and (query_time <= end)
-
-                    if in_interval:
-                        # Evaluate directly for function-based, or interpolate if data-based
-                        t_input = query_time - start if time_mode == "relative" else query_time
-                        t_input = np.array([t_input])
-                        val = self._evaluate_function(name, params, t_input, start, end, offset)[0]
-                        var_results[i] = val
-                        piece_found = True
-                        break
-
-                if not piece_found:
-                    # If not found in any piece, it's out-of-range
-                    first_piece = var_info[0]
-                    if query_time < first_piece["start"]:
-                        # Before the first interval: default to zero
-                        var_results[i] = 0
-                    else:
-                        # Beyond the last interval
-                        start = last_piece["start"]
-                        end = last_piece["end"]
-                        name = last_piece["name"]
-                        params = last_piece["params"]
-                        offset = last_piece["offset"]
-                        out_of_range = last_piece["out_of_range"]
-                        last_val_piece = last_piece["last_value"]
-
-                        if out_of_range == "zero":
-                            var_results[i] = 0
-                        elif out_of_range == "continue":
-                            var_results[i] = last_val_piece
-                        elif out_of_range == "function":
-                            t_input = np.array([query_time - end])
-                            val = self._evaluate_function(name, params, t_input, start, end, offset)[0]
-                            var_results[i] = val
-                        else:
-                            var_results[i] = 0
-
-            results.append(var_results)
+                # If the start matches previous piece's end, start is exclusive for this piece.
+                if idx > 0 and np.isclose(start, var_info[idx-1]["end"], atol=1e-15):
+                    lo = np.searchsorted(t_sorted, start, side="right")
+                else:
+                    lo = np.searchsorted(t_sorted, start, side="left")
+                hi = np.searchsorted(t_sorted, end, side="right")
+                if lo >= hi:
+                    continue
+
+                # Only query times that no earlier piece has claimed
+                sel = lo + np.flatnonzero(~assigned[lo:hi])
+                if sel.size == 0:
+                    continue
+
+                t_input = t_sorted[sel] - start if piece["time_mode"] == "relative" else t_sorted[sel]
+                values_sorted[sel] = self._evaluate_function(piece["name"], piece["params"], t_input,
+                                                             start, end, piece["offset"])
+                assigned[sel] = True
+
+            # Out-of-range: zero before the first interval, else the rules of the last piece
+            last_piece = var_info[-1]
+            out_of_range = ~assigned & (t_sorted >= var_info[0]["start"])
+            if out_of_range.any():
+                if last_piece["out_of_range"] == "continue":
+                    values_sorted[out_of_range] = last_piece["last_value"]
+                elif last_piece["out_of_range"] == "function":
+                    t_input = t_sorted[out_of_range] - last_piece["end"]
+                    values_sorted[out_of_range] = self._evaluate_function(
+                        last_piece["name"], last_piece["params"], t_input,
+                        last_piece["start"], last_piece["end"], last_piece["offset"])
+
+            var_results = np.empty_like(t_flat)
+            var_results[order] = values_sorted
+            results.append(var_results.reshape(t.shape))
 
         return results
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Integrators shared by the simulators and the motion planner.
+
+All single-step functions use the signature of the former per-script rk4:
+x_next = method(x, u, dt, fun) with x_dot = fun(x, u), u held constant over
+the step.
+
+    euler(x, u, dt, fun)            Forward Euler
+    rk4(x, u, dt, fun)              Classical Runge-Kutta 4
+    semi_implicit_euler(x, u, dt, fun, jac=None)
+                                    Linearly implicit Euler, stable for the
+                                    stiff actuator dynamics
+    dopri5(x, u, dt, fun, k1=None)  Dormand-Prince 5(4) step with error
+                                    estimate, used by Integrator
+
+Integrator(fun, method) wraps these into fixed-step or adaptive integration
+with dense output into preallocated buffers.
+
+Reference: E. Hairer, S. P. Norsett, G. Wanner (1993). Solving Ordinary
+Differential Equations I. 2nd Edition, Springer. Section II.4-II.6.
+"""
+
+import numpy as np
+
+
+def euler(x, u, dt, fun):
+    return x + dt * fun(x, u)
+
+
+def rk4(x, u, dt, fun):
+    k1 = fun(x, u)
+    k2 = fun(x+dt/2*k1, u)
+    k3 = fun(x+dt/2*k2, u)
+    k4 = fun(x+dt*k3, u)
+
+    x_t = x + dt/6 * (k1 + 2*k2 + 2*k3 + k4)
+
+    return x_t
+
+
+def finite_difference_jacobian(x, u, fun, f0=None, eps=1e-6):
+    """
+    Forward difference approximation of df/dx. Used when no analytic
+    Jacobian is given.
+    """
+    if f0 is None:
+        f0 = fun(x, u)
+    A = np.empty((len(f0), len(x)))
+    for i in range(len(x)):
+        h = eps * max(1.0, abs(x[i]))
+        x_h = np.array(x, dtype=float)
+        x_h[i] += h
+        A[:, i] = (fun(x_h, u) - f0) / h
+    return A
+
+
+def semi_implicit_euler(x, u, dt, fun, jac=None):
+    """
+    Linearly implicit Euler: x_next = x + dt (I - dt A)^-1 f(x, u).
+    One linear solve instead of Newton iterations. Stable for stiff linear
+    parts such as the actuator dynamics that divide by the vehicle dt.
+
+    jac: Optional callable jac(x, u) returning df/dx. Falls back to finite
+        differences.
+    """
+    f0 = fun(x, u)
+    A = jac(x, u) if jac is not None else finite_difference_jacobian(x, u, fun, f0)
+    return x + dt * np.linalg.solve(np.eye(len(x)) - dt * A, f0)
+
+
+# Dormand-Prince 5(4) tableau
+DP_C = np.array([0, 1/5, 3/10, 4/5, 8/9, 1])
+DP_A = [
+    np.array([]),
+    np.array([1/5]),
+    np.array([3/40, 9/40]),
+    np.array([44/45, -56/15, 32/9]),
+    np.array([19372/6561, -25360/2187, 64448/6561, -212/729]),
+    np.array([9017/3168, -355/33, 46732/5247, 49/176, -5103/18656]),
+]
+DP_B = np.array([35/384, 0, 500/1113, 125/192, -2187/6784, 11/84])
+# Difference between the 5th and embedded 4th order solution, incl. the FSAL stage
+DP_E = np.array([-71/57600, 0, 71/16695, -71/1920, 17253/339200, -22/525, 1/40])
+# Continuous extension of order 4 (Hairer et al.), coefficients of theta^1..theta^4
+DP_P = np.array([
+    [1, -8048581381/2820520608, 8663915743/2820520608, -12715105075/11282082432],
+    [0, 0, 0, 0],
+    [0, 131558114200/32700410799, -68118460800/10900136933, 87487479700/32700410799],
+    [0, -1754552775/470086768, 14199869525/1410260304, -10690763975/1880347072],
+    [0, 127303824393/49829197408, -318862633887/49829197408, 701980252875/199316789632],
+    [0, -282668133/205662961, 2019193451/616988883, -1453857185/822651844],
+    [0, 40617522/29380423, -110615467/29380423, 69997945/29380423],
+])
+
+
+def dopri5(x, u, dt, fun, k1=None):
+    """
+    Single Dormand-Prince 5(4) step.
+
+    Args:
+        k1: fun(x, u), if already known (first same as last).
+
+    Returns:
+        x_next: 5th order solution
+        err: Estimated local error
+        K: (7, n) stages, K[6] = fun(x_next, u). Used for dense output.
+    """
+    K = np.empty((7, len(x)))
+    K[0] = fun(x, u) if k1 is None else k1
+    for i in range(1, 6):
+        K[i] = fun(x + dt * (DP_A[i] @ K[:i]), u)
+
+    x_next = x + dt * (DP_B @ K[:6])
+    K[6] = fun(x_next, u)
+    err = dt * (DP_E @ K)
+
+    return x_next, err, K
+
+
+def dopri5_dense(x, dt, K, theta):
+    """
+    Dense output of a dopri5 step of length dt starting at x, evaluated at
+    the fraction theta in [0, 1] of the step.
+    """
+    p = np.cumprod(np.full(4, theta))
+    return x + dt * (K.T @ (DP_P @ p))
+
+
+class Integrator():
+    """
+    Integrator(fun, method="rk4")
+
+    Parameters:
+        fun: x_dot = fun(x, u)
+        method (str): "euler", "rk4", "semi_implicit" (fixed step) or "rk45"
+            (Dormand-Prince with step size control and dense output)
+        rtol, atol (float): Error tolerances of "rk45"
+        dt_min, dt_max (float): Step size limits of "rk45"
+        jac: Optional jac(x, u) -> df/dx for "semi_implicit"
+    """
+
+    METHODS = ("euler", "rk4", "semi_implicit", "rk45")
+
+    def __init__(self, fun, method="rk4", rtol=1e-6, atol=1e-8, dt_min=1e-6, dt_max=np.inf, jac=None):
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown integration method: {method}")
+
+        self.fun = fun
+        self.method = method
+        self.rtol = rtol
+        self.atol = atol
+        self.dt_min = dt_min
+        self.dt_max = dt_max
+        self.jac = jac
+
+        # Last accepted step size of rk45, reused as first guess
+        self.h = None
+
+        # Number of states evaluated by fun (each row of a batched call counts)
+        self.n_evaluations = 0
+
+    def evaluate(self, x, u):
+        """
+        x_dot = fun(x, u), counted in n_evaluations
+        """
+        self.n_evaluations += len(x) if np.ndim(x) == 2 else 1
+        return self.fun(x, u)
+
+    def step(self, x, u, dt):
+        """
+        Advance x by dt with constant input u. "rk45" takes as many adaptive
+        sub-steps as needed.
+        """
+        if self.method == "euler":
+            return euler(x, u, dt, self.evaluate)
+        if self.method == "rk4":
+            return rk4(x, u, dt, self.evaluate)
+        if self.method == "semi_implicit":
+            return semi_implicit_euler(x, u, dt, self.evaluate, self.jac)
+
+        out = np.empty((len(x), 2))
+        self.integrate(x, u, np.array([0.0, dt]), out)
+        return out[:, 1]
+
+    def integrate(self, x0, u, t_eval, out=None):
+        """
+        Integrate from t_eval[0] and return the states at all t_eval.
+
+        Args:
+            x0: Initial state at t_eval[0]
+            u: Constant input or callable u(t) evaluated at the start of each
+                step
+            t_eval: Increasing output times
+            out: Optional preallocated (n, len(t_eval)) buffer
+
+        Returns:
+            out: (n, len(t_eval)) states. Fixed-step methods step from one
+                output time to the next, "rk45" chooses its own steps and
+                fills out by dense output.
+        """
+        t_eval = np.asarray(t_eval, dtype=float)
+        if out is None:
+            out = np.empty((len(x0), len(t_eval)))
+        out[:, 0] = x0
+        u_fun = u if callable(u) else (lambda t: u)
+
+        if self.method != "rk45":
+            for i in range(len(t_eval) - 1):
+                out[:, i+1] = self.step(out[:, i], u_fun(t_eval[i]), t_eval[i+1] - t_eval[i])
+            return out
+
+        t = t_eval[0]
+        t_end = t_eval[-1]
+        x = np.array(x0, dtype=float)
+        i_out = 1
+        h = self.h if self.h is not None else self.initial_step(x, u_fun(t), t_end - t)
+        k1 = None
+
+        while i_out < len(t_eval):
+            u_t = u_fun(t)
+            if k1 is None:
+                k1 = self.evaluate(x, u_t)
+            h = min(max(h, self.dt_min), self.dt_max, t_end - t)
+
+            x_next, err, K = dopri5(x, u_t, h, self.evaluate, k1)
+            scale = self.atol + self.rtol * np.maximum(np.abs(x), np.abs(x_next))
+            err_norm = np.sqrt(np.mean((err / scale)**2))
+
+            if err_norm > 1 and h > self.dt_min:
+                h *= max(0.2, 0.9 * err_norm**(-1/5))
+                continue
+
+            # Dense output for all requested times within the accepted step
+            last_step = h >= t_end - t
+            while i_out < len(t_eval) and (last_step or t_eval[i_out] <= t + h):
+                out[:, i_out] = dopri5_dense(x, h, K, min((t_eval[i_out] - t) / h, 1.0))
+                i_out += 1
+
+            t = t_end if last_step else t + h
+            x = x_next
+            # FSAL is only valid if the input is constant
+            k1 = K[6] if not callable(u) else None
+            self.h = h
+            h *= min(10, 0.9 * err_norm**(-1/5)) if err_norm > 0 else 10
+
+        return out
+
+    def initial_step(self, x, u, span):
+        """
+        Initial step size guess (Hairer et al., II.4).
+        """
+        f0 = self.evaluate(x, u)
+        scale = self.atol + self.rtol * np.abs(x)
+        d0 = np.sqrt(np.mean((x / scale)**2))
+        d1 = np.sqrt(np.mean((f0 / scale)**2))
+        h = 1e-6 if d0 < 1e-5 or d1 < 1e-5 else 0.01 * d0 / d1
+        return min(h, span, self.dt_max)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Quaternion and frame-transform kernels shared by the simulators and the
+motion planner.
+
+All functions work directly on arrays of quaternions [q0, q1, q2, q3] with
+scalar part q0 (the convention of the state vectors), of shape (4,) or
+(N, 4), and return arrays of the matching shape. The quaternions do not need
+to be normalized. No scipy Rotation objects are built, which makes the
+single-quaternion calls of the rollout and cost loops cheap as well.
+
+    normalize(q)                    Unit quaternions
+    quaternion_to_dcm(q)            Body to world rotation matrices (..., 3, 3)
+    rotate(q, v)                    Body frame vectors v (..., 3) in world frame
+    forward_vector(q)               World frame body x-axis (longitudinal axis)
+    relative_angle(q1, q2)          Angle of the rotation between q1 and q2 (rad)
+    quaternion_to_euler(q)          (roll, pitch, yaw), 3-2-1 sequence (rad)
+    pitch(q)                        Pitch angle (rad)
+"""
+
+import numpy as np
+
+
+def normalize(q):
+    """
+    Unit quaternions of an (..., 4) array
+    """
+    q = np.asarray(q, dtype=float)
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+
+def quaternion_to_dcm(q):
+    """
+    Direction Cosine Matrix (body to world) of an (..., 4) array of
+    quaternions, it returns an (..., 3, 3) array
+    """
+    q0, q1, q2, q3 = np.moveaxis(normalize(q), -1, 0)
+
+    dcm = np.stack([
+        np.stack([1 - 2*(q2**2 + q3**2), 2*(q1*q2 - q0*q3),     2*(q1*q3 + q0*q2)], axis=-1),
+        np.stack([2*(q1*q2 + q0*q3),     1 - 2*(q1**2 + q3**2), 2*(q2*q3 - q0*q1)], axis=-1),
+        np.stack([2*(q1*q3 - q0*q2),     2*(q2*q3 + q0*q1),     1 - 2*(q1**2 + q2**2)], axis=-1)], axis=-2)
+
+    return dcm
+
+
+def rotate(q, v):
+    """
+    Rotate body frame vectors v (..., 3) to the world frame with the
+    quaternions q (..., 4). Broadcasting applies, e.g. one quaternion and
+    several vectors
+    """
+    q = normalize(q)
+    v = np.asarray(v, dtype=float)
+    q0 = q[..., :1]
+    qv = q[..., 1:]
+
+    # v + 2 q0 (qv x v) + 2 qv x (qv x v)
+    t = 2 * np.cross(qv, v)
+    return v + q0 * t + np.cross(qv, t)
+
+
+def forward_vector(q):
+    """
+    Unit longitudinal axis (body x-axis) in world frame, the first column of
+    the DCM. It returns an (..., 3) array
+    """
+    q0, q1, q2, q3 = np.moveaxis(normalize(q), -1, 0)
+
+    return np.stack([q0**2 + q1**2 - q2**2 - q3**2,
+                     2*(q1*q2 + q0*q3),
+                     2*(q1*q3 - q0*q2)], axis=-1)
+
+
+def relative_angle(q1, q2, degrees=False):
+    """
+    Angle of the relative rotation q2 * q1^-1 (in [0, pi]) between (..., 4)
+    arrays of quaternions
+    """
+    q1 = normalize(q1)
+    q2 = normalize(q2)
+
+    # Scalar and vector part of q2 * conj(q1)
+    w = np.sum(q1 * q2, axis=-1)
+    v = q1[..., :1] * q2[..., 1:] - q2[..., :1] * q1[..., 1:] - np.cross(q2[..., 1:], q1[..., 1:])
+    angle = 2 * np.arctan2(np.linalg.norm(v, axis=-1), np.abs(w))
+
+    return np.rad2deg(angle) if degrees else angle
+
+
+def quaternion_to_euler(q):
+    """
+    Euler angles (roll, pitch, yaw) of the 3-2-1 sequence, same as the scipy
+    Rotation.as_euler('xyz'). It returns three (...,) arrays
+    """
+    q0, q1, q2, q3 = np.moveaxis(normalize(q), -1, 0)
+
+    roll = np.arctan2(2*(q0*q1 + q2*q3), 1 - 2*(q1**2 + q2**2))
+    pitch = np.arcsin(np.clip(2*(q0*q2 - q1*q3), -1.0, 1.0))
+    yaw = np.arctan2(2*(q0*q3 + q1*q2), 1 - 2*(q2**2 + q3**2))
+
+    return roll, pitch, yaw
+
+
+def pitch(q):
+    """
+    Pitch angle (rad) of an (..., 4) array of quaternions
+    """
+    q0, q1, q2, q3 = np.moveaxis(normalize(q), -1, 0)
+
+    return np.arcsin(np.clip(2*(q0*q2 - q1*q3), -1.0, 1.0))
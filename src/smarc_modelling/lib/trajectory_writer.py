@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming trajectory output for long simulations.
+
+TrajectoryWriter appends rows (e.g. [t, x, u] per time step) to a file in
+fixed-size chunks instead of keeping the whole history in RAM. Everything
+that has been flushed is a valid file, so partial results survive a crash.
+
+Formats:
+    .npy    Append-only 2D float64 array. The header has a fixed length and
+            its shape is rewritten on every flush.
+    .h5     HDF5 dataset "trajectory" with an unlimited first axis. Needs
+            h5py.
+
+load_trajectory(path) reads the result back memory-mapped (.npy) or as an
+h5py dataset (.h5), both can be sliced without loading everything.
+"""
+
+import os
+import struct
+import numpy as np
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+# Total length of the .npy header incl. magic string, must be a multiple of 64
+NPY_HEADER_LEN = 128
+
+
+class TrajectoryWriter():
+    """
+    TrajectoryWriter(path, n_columns)
+
+    Parameters:
+        path (str): Output file, .npy or .h5/.hdf5
+        n_columns (int): Length of each row
+        chunk_size (int): Rows buffered before they are written
+        decimation (int): Only every decimation-th appended row is kept
+    """
+
+    def __init__(self, path, n_columns, chunk_size=1000, decimation=1):
+        self.path = path
+        self.n_columns = n_columns
+        self.chunk_size = chunk_size
+        self.decimation = decimation
+
+        self.buffer = np.empty((chunk_size, n_columns))
+        self.n_buffered = 0
+        self.n_appended = 0
+        self.n_written = 0
+
+        self.hdf5 = os.path.splitext(path)[1] in (".h5", ".hdf5")
+        if self.hdf5:
+            if h5py is None:
+                raise ImportError("h5py is required to write HDF5 trajectories")
+            self.file = h5py.File(path, "w")
+            self.dataset = self.file.create_dataset(
+                "trajectory", shape=(0, n_columns), maxshape=(None, n_columns),
+                chunks=(chunk_size, n_columns), dtype="f8")
+        else:
+            self.file = open(path, "wb")
+            self.write_npy_header()
+
+    def append(self, row):
+        """
+        Append a single row, e.g. np.concatenate([[t], x, u]).
+        """
+        keep = self.n_appended % self.decimation == 0
+        self.n_appended += 1
+        if not keep:
+            return
+
+        self.buffer[self.n_buffered] = row
+        self.n_buffered += 1
+        if self.n_buffered == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered rows and update the row count on disk.
+        """
+        if self.n_buffered == 0:
+            return
+
+        rows = self.buffer[:self.n_buffered]
+        if self.hdf5:
+            self.dataset.resize(self.n_written + self.n_buffered, axis=0)
+            self.dataset[self.n_written:] = rows
+        else:
+            self.file.seek(0, os.SEEK_END)
+            self.file.write(np.ascontiguousarray(rows, dtype="<f8").tobytes())
+
+        self.n_written += self.n_buffered
+        self.n_buffered = 0
+
+        if not self.hdf5:
+            self.write_npy_header()
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write_npy_header(self):
+        """
+        (Re)write the .npy version 1.0 header for the rows written so far.
+        It is padded to NPY_HEADER_LEN, s.t. the data offset never changes.
+        """
+        header = "{'descr': '<f8', 'fortran_order': False, 'shape': (%d, %d), }" \
+                 % (self.n_written, self.n_columns)
+        header = header.ljust(NPY_HEADER_LEN - 10 - 1) + "\n"
+        self.file.seek(0)
+        self.file.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1"))
+
+
+def load_trajectory(path):
+    """
+    Read a trajectory written by TrajectoryWriter without loading it into
+    memory. Returns a read-only memory map (.npy) or an h5py dataset (.h5).
+    """
+    if os.path.splitext(path)[1] in (".h5", ".hdf5"):
+        if h5py is None:
+            raise ImportError("h5py is required to read HDF5 trajectories")
+        return h5py.File(path, "r")["trajectory"]
+    return np.load(path, mmap_mode="r")
@@ -0,0 +1,173 @@
+import heapq
+import time
+import numpy as np
+from smarc_modelling.motion_planning.MotionPrimitives.MotionPrimitives import SAM_PRIMITIVES
+from smarc_modelling.motion_planning.MotionPrimitives.PrimitiveWorkers import PrimitiveWorkerPool
+from smarc_modelling.motion_planning.MotionPrimitives.HeuristicField import get_heuristic_field
+from smarc_modelling.motion_planning.MotionPrimitives.SearchGraph import SearchGraph
+from smarc_modelling.motion_planning.MotionPrimitives.SearchContext import SearchContext
+from smarc_modelling.motion_planning.MotionPrimitives.GenerationTree import StateLattice, primitive_input_pairs, get_neighbors, set_goal_node, pop_open_node, update_open_set, update_stats, heuristic_batch, calculate_f_batch, reconstruct_path
+from smarc_modelling.motion_planning.MotionPrimitives.trm_colors import *
+
+# Inflation factors of the heuristic, one search each (the last one should be 1, i.e. plain A star)
+DEFAULT_INFLATIONS = (3.0, 2.0, 1.5, 1.2, 1.0)
+
+# Cost function of the searches: f = g + inflation * h (normal A star, see calculate_f)
+ANYTIME_TYPEF = 1
+
+def peek_open_f(open_set, graph):
+    """
+    Lowest f_cost of the open set (np.inf if empty), outdated entries on top are dropped
+    """
+
+    while open_set:
+        f_cost, g, node = open_set[0]
+        if graph.closed[node] or g > graph.g[node]:
+            heapq.heappop(open_set)
+            continue
+        return f_cost
+
+    return np.inf
+
+def reinflate_open_set(open_set, inconsistent, graph, map_instance, dec, typeF_function, heuristic_field, inflation):
+    """
+    Open set of the next ARA* search: the open nodes and the inconsistent ones, with the f_cost of the new inflation.
+    The closed flags are cleared
+    """
+
+    nodes = {node for _, g, node in open_set if not graph.closed[node] and g <= graph.g[node]}
+    nodes.update(inconsistent)
+    inconsistent.clear()
+    open_set.clear()
+    graph.closed[:graph.size] = False
+    if not nodes:
+        return
+
+    nodes = np.array(sorted(nodes))
+    states = graph.states[nodes]
+    g = graph.g[nodes]
+    heuristic_cost = inflation * heuristic_batch(states, map_instance, 1, heuristic_field)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f_costs = calculate_f_batch(states, map_instance, g, heuristic_cost, dec, typeF_function, 1)
+
+    # The start node has g = 0
+    f_costs = np.where(g > 0, f_costs, 0)
+    graph.f[nodes] = f_costs
+    open_set.extend(zip(f_costs, g, nodes))
+    heapq.heapify(open_set)
+
+def anytime_a_star_iter(map_instance, typeF_function, dec, time_budget, inflations=DEFAULT_INFLATIONS, pool=None, library=None, lattice=None, usePool=True, stats=None):
+    """
+    Anytime (ARA*) version of a_star_search.
+
+    A sequence of searches is run with decreasing inflation factors of the heuristic, reusing the tree of the
+    previous ones. Each search ends when the best path found is within its inflation of the optimum (or the open
+    set is empty), the next one only re-expands the nodes whose cost improved. The first paths come quickly,
+    then they are refined while time remains.
+
+    The bound holds on the lattice of the primitives as long as h is a lower bound of the remaining cost: the
+    straight line, or the HeuristicField on maps with obstacles (see there). It also needs f = g + inflation * h
+    (ANYTIME_TYPEF), the searches always use it: typeF_function is not used, a different one is reported.
+
+    time_budget: wall-clock time (seconds) for the whole search, the pool start and the optimizations included.
+        An improved path is only optimized (reconstruct_path) if the longest optimization so far still fits in the
+        budget, otherwise the search ends. The first path is always optimized, it can exceed the budget by one optimization
+    inflations: decreasing inflation factors, see DEFAULT_INFLATIONS
+    pool, library, lattice, usePool, stats: see a_star_search
+
+    This function is a generator, it yields (trajectory, totalCost, inflation) every time a cheaper path is found
+    """
+
+    deadline = time.time() + time_budget
+    sim = SAM_PRIMITIVES()
+    if pool is not None or not usePool:
+        yield from anytime_a_star_loop(map_instance, typeF_function, dec, sim, pool, library, lattice, deadline, inflations, stats)
+        return
+
+    # Start the primitive workers once for the whole search
+    with PrimitiveWorkerPool(sim, map_instance, primitive_input_pairs()) as pool:
+        yield from anytime_a_star_loop(map_instance, typeF_function, dec, sim, pool, library, lattice, deadline, inflations, stats)
+
+def anytime_a_star_loop(map_instance, typeF_function, dec, sim, pool, library, lattice, deadline, inflations, stats=None):
+    """
+    Main loop of the anytime search, see anytime_a_star_iter
+    """
+
+    if typeF_function != ANYTIME_TYPEF:
+        print(f"{bcolors.WARNING}anytime search: f = g + inflation * h is used instead of typeF {typeF_function}{bcolors.ENDC}")
+    typeF_function = ANYTIME_TYPEF
+    if lattice is None:
+        lattice = StateLattice()
+    heuristic_field = get_heuristic_field(map_instance, 1)
+    context = SearchContext()   # arrivals of this search
+
+    # Tree variables, shared by all the searches
+    x0 = map_instance["initial_state"]
+    graph = SearchGraph(lattice)
+    start = graph.set_node(x0, -1, 0)
+    open_set = [(0, 0, start)]      # (f_cost, g_cost, node id)
+    inconsistent = set()            # closed nodes whose cost improved
+    best_cost = np.inf
+    optimization_time = 0.0         # longest reconstruct_path (with the optimization) so far
+    expansions = 0
+
+    for ii, inflation in enumerate(inflations):
+        print(f"{bcolors.HEADER}>> ARA* search with inflation {inflation:.2f}{bcolors.ENDC}")
+        if ii > 0:
+            reinflate_open_set(open_set, inconsistent, graph, map_instance, dec, typeF_function, heuristic_field, inflation)
+
+        while time.time() < deadline:
+
+            # The best path is within the inflation of the optimum
+            if peek_open_f(open_set, graph) >= best_cost:
+                break
+
+            current_node = pop_open_node(open_set, graph)
+            reached_states, last_states, _, final = get_neighbors(graph.states[current_node], sim, map_instance, 1, pool, library, context)
+            update_open_set(graph, current_node, reached_states, last_states, open_set, map_instance, dec, typeF_function, 1, heuristic_field, inflation, inconsistent)
+            expansions += 1
+            update_stats(stats, sim, expansions, graph)
+
+            if not context.arrived[1]:
+                continue
+            context.reset(1)
+            if graph.g[current_node] + final[1] >= best_cost:
+                continue
+            goal_node = set_goal_node(graph, current_node, reached_states, final)
+
+            # Cheaper path, reconstruct and optimize it if there is time left
+            if best_cost < np.inf and time.time() + optimization_time >= deadline:
+                print(f"{bcolors.WARNING}time budget exhausted, no time to optimize the path with cost {graph.g[goal_node]:.3f}{bcolors.ENDC}")
+                return
+            start_optimization = time.time()
+            path, successfulSearch = reconstruct_path(graph, goal_node, map_instance, None, None)
+            optimization_time = max(optimization_time, time.time() - start_optimization)
+            if successfulSearch:
+                best_cost = graph.g[goal_node]
+                print(f"{bcolors.OKGREEN}[ OK ]{bcolors.ENDC} path with cost {best_cost:.3f} (inflation {inflation:.2f})")
+                yield path, best_cost, inflation
+
+        if time.time() >= deadline:
+            print(f"{bcolors.WARNING}time budget exhausted{bcolors.ENDC}")
+            return
+
+def anytime_a_star_search(map_instance, typeF_function, dec, time_budget, callback=None, inflations=DEFAULT_INFLATIONS, pool=None, library=None, lattice=None, usePool=True, stats=None):
+    """
+    Run anytime_a_star_iter until the time budget is over (or the path is optimal).
+    callback(trajectory, totalCost, inflation) is called for every improved path.
+
+    This function returns the best (trajectory, successfulSearch, failingNotes), like a_star_search.
+    Without a path failingNotes is "maxTime" if the budget ran out, "maxIterations" if the open set did
+    """
+
+    start_time = time.time()
+    result = None
+    for path, totalCost, inflation in anytime_a_star_iter(map_instance, typeF_function, dec, time_budget, inflations, pool, library, lattice, usePool, stats):
+        result = (path, 1, "success")
+        if callback is not None:
+            callback(path, totalCost, inflation)
+
+    if result is None:
+        result = ([], 0, "maxTime" if time.time() - start_time >= time_budget else "maxIterations")
+
+    return result
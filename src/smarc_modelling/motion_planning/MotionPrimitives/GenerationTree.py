@@ -4,15 +4,18 @@ import heapq
 import numpy as np
 import sys
 import random
-from joblib import Parallel, delayed
 from threading import Lock
-from scipy.spatial.transform import Rotation as R
-from scipy.spatial import KDTree
 import time
 import multiprocessing
 import csv
 from smarc_modelling.motion_planning.MotionPrimitives.MotionPrimitives import SAM_PRIMITIVES
-from smarc_modelling.motion_planning.MotionPrimitives.ObstacleChecker import calculate_angle_betweenVectors, calculate_angle_goalVector, compute_A_point_forward
+from smarc_modelling.motion_planning.MotionPrimitives.PrimitiveWorkers import PrimitiveWorkerPool
+from smarc_modelling.motion_planning.MotionPrimitives.ObstacleChecker import calculate_angle_betweenVectors, calculate_angle_goalVector, calculate_angle_velocityGoal, compute_A_point_forward, compute_forward_vector_batch, body_to_global_velocity, body_to_global_velocity_batch
+from smarc_modelling.lib.quaternion import quaternion_to_dcm, quaternion_to_euler, forward_vector, relative_angle, pitch as quaternion_pitch
+from smarc_modelling.motion_planning.MotionPrimitives.HeuristicField import get_heuristic_field
+from smarc_modelling.motion_planning.MotionPrimitives.SpatialIndex import TreeConnector
+from smarc_modelling.motion_planning.MotionPrimitives.SearchGraph import SearchGraph
+from smarc_modelling.motion_planning.MotionPrimitives.SearchContext import SearchContext
 from smarc_modelling.motion_planning.MotionPrimitives.OptimizationAcados_doubleTree import optimization_acados_doubleTree
 from smarc_modelling.motion_planning.MotionPrimitives.OptimizationAcados_singleTree import optimization_acados_singleTree
 from smarc_modelling.motion_planning.MotionPrimitives.Optimizer.acados_trajectory_simulator import main
@@ -25,64 +28,59 @@ import matplotlib.pyplot as plt
 lock = Lock()
 
 # Classes
-class Node:
-    def __init__(self, state, cost=0):
-        # Define the initial conditions of the node 
-        self.state = state
-        self.cost = cost 
+class StateLattice:
+    """
+    Discretization of the states used to detect duplicate nodes in the search.
+    Two states are the same node if they fall into the same cell of position, heading, pitch and surge velocity.
 
-    def __lt__(self, other):
-        # Define when a node is "better" than another. Better based on the cost
-        return self.cost < other.cost
+    Parameters:
+        position: cell size of x, y, z (m)
+        heading: cell size of the yaw angle (rad)
+        pitch: cell size of the pitch angle (rad)
+        speed: cell size of the surge velocity u (m/s)
+    """
 
-    def __eq__(self, other):
-        # Define when two nodes are equal. Equal if the have the same spatial coordinates (x,y,z)
-        return self.state[0] == other.state[0] and self.state[1] == other.state[1] and self.state[2] == other.state[2]
+    def __init__(self, position=0.2, heading=np.deg2rad(15), pitch=np.deg2rad(15), speed=0.2):
+        self.position = position
+        self.heading = heading
+        self.pitch = pitch
+        self.speed = speed
+        self.n_heading = max(1, int(round(2*np.pi / heading)))
 
-    def __hash__(self):
-        # Make Node hashable by its state
-        return hash((self.state[0], self.state[1], self.state[2])) 
+    def key(self, state):
+        """
+        Integer cell (x, y, z, heading, pitch, u) of a state
+        """
 
-# Functions
-def body_to_global_velocity(quaternion, body_velocity):
-    """
-    Convert body-fixed linear velocity to global frame.
-    
-    Parameters:
-    - quaternion: [q0, q1, q2, q3] (unit quaternion representing orientation)
-    - body_velocity: [vx, vy, vz] in body frame
-    
-    Returns:
-    - global_velocity: [vX, vY, vZ] in global frame
-    """
-    
-    # Create rotation object from quaternion
-    rotation = R.from_quat([quaternion[1], quaternion[2], quaternion[3], quaternion[0]])  # [x, y, z, w] format
-    
-    # Rotate body velocity to global frame
-    global_velocity = rotation.apply(body_velocity)
-    
-    return global_velocity
+        _, pitch, yaw = quaternion_to_euler(state[3:7])
+
+        return (int(np.round(state[0] / self.position)),
+                int(np.round(state[1] / self.position)),
+                int(np.round(state[2] / self.position)),
+                int(np.round(yaw / self.heading)) % self.n_heading,
+                int(np.round(pitch / self.pitch)),
+                int(np.round(state[7] / self.speed)))
 
-def reconstruct_path(current, parents_dict, resolution_dict, map_instance, ax, pltt):
+# Functions
+def reconstruct_path(graph, current, map_instance, ax, pltt):
     """
-    This function reconstructs the path from the goal to the start. 
+    This function reconstructs the path from the goal (node id current of the SearchGraph) to the start. 
     It will return a list of states.
     """
 
     # Initialize the variables
     final_path = []
-    while current is not None:
+    while current != -1:
 
         # Check if we are the starting node
-        if parents_dict[current] is None:
-            final_path.append(current.state)
-            current = None 
+        if graph.parents[current] == -1:
+            final_path.append(graph.states[current].copy())
+            current = -1 
             success = 1
             continue
         
-        # Get the list of vertices from resolution_dictionary
-        res_list = resolution_dict[current]
+        # Get the list of vertices of the primitive
+        res_list = graph.waypoint_list(current)
         
         
         # Optimization Acados
@@ -117,98 +115,56 @@ def reconstruct_path(current, parents_dict, resolution_dict, map_instance, ax, p
             final_path.append(vertex)
 
         # Update current 
-        current = parents_dict[current]
+        current = graph.parents[current]
 
     # Return reversed path
     return final_path[::-1], success  # (path, successfulSearch)
 
-def reconstruct_path_doubleTree(current, parents_dict, resolution_dict, map_instance, ax, pltt):
+def reconstruct_path_doubleTree(graph, current, map_instance, ax, pltt):
     """
-    This function reconstructs the path from the goal to the start. 
+    This function reconstructs the path from the goal (node id current of the SearchGraph) to the start. 
     It will return a list of states.
     """
 
     # Initialize the variables
     final_path = []
     
-    while current is not None:
+    while current != -1:
 
         # Check if we are the starting node
-        if parents_dict[current] is None:
-            final_path.append(current.state)
-            current = None 
+        if graph.parents[current] == -1:
+            final_path.append(graph.states[current].copy())
+            current = -1 
             continue
         
-        # Get the list of vertices from resolution_dictionary
-        res_list = resolution_dict[current]
+        # Get the list of vertices of the primitive
+        res_list = graph.waypoint_list(current)
 
         # Append vertices to the final list (reverted order)
         for vertex in res_list[::-1]:
             final_path.append(vertex)
 
         # Update current 
-        current = parents_dict[current]
+        current = graph.parents[current]
 
     # Return reversed path
     return final_path[::-1] 
 
-def process_input_pair(inputs, current_state, sim, map_instance, numberTree):
-    '''This is the function that is parallelized'''
-
-    # Initialize variables
-    inputLen = len(inputs)
-
-    # If number of inputs is != from number of indices there is something wrong
-    if inputLen % 2 != 0:
-        print(inputs)
-        print("ERROR! INPUTS AND INDICES ARE NOT THE SAME LENGTH")
-        sys.exit(1)
-    
-    # Calculate angle between goal and velocity (for dynamic primitives length)
-    q0, q1, q2, q3 = current_state[3:7]
-    vx, vy, vz = body_to_global_velocity((q0, q1, q2, q3), current_state[7:10])
-    v_vector = np.array([vx, vy, vz])
-
-    # Orientation 
-    alpha = calculate_angle_goalVector(current_state, v_vector, map_instance, numberTree)
-
-    # Get all the points within one single input primitive
-    data, cost, inObs, arrived, finalState = sim.curvePrimitives(current_state, inputs[0 : inputLen//2], inputs[inputLen//2 : inputLen], map_instance, alpha, numberTree)
-    if not inObs:
-        neighbour = data[:,-1]
-        cost_path = cost
-
-        # Return (allPoints, (lastPoint, costPath), boolInObstacle, boolArrived, stateInGoal(or None))
-        return data, (neighbour, cost_path), inObs, arrived  
-    
-    # If no valid primitive is available, return an empty array
-    return np.array([]), ([], -1), inObs, arrived
-
 def compute_current_orientationVector(state, map_inst, numberTree, type = "normal"):
     """
     Returns either forward_orientation or backward_orientation vector based on the minimum angle between 
     goal vector and backward/forward vector
     """
 
-    # Define quaternion
-    q0,q1,q2,q3 = state[3:7]
-
     # Define forward and backward vectors
-    rotation = R.from_quat([q1, q2, q3, q0])
-    body_forward = np.array([1.0, 0.0, 0.0])
-    body_backward = np.array([-1.0, 0.0, 0.0])
-    forward_vector = rotation.apply(body_forward)
-    forward_vector_norm = np.linalg.norm(forward_vector)
-    backward_vector = rotation.apply(body_backward)
-    backward_vector_norm = np.linalg.norm(backward_vector)
-    forward_vector /= forward_vector_norm
-    backward_vector /= backward_vector_norm
-
-    angle = calculate_angle_goalVector(state, forward_vector, map_inst, numberTree, type)
+    forward = forward_vector(state[3:7])
+    backward = -forward
+
+    angle = calculate_angle_goalVector(state, forward, map_inst, numberTree, type)
     if angle < np.pi/2:
-        orientation_vector = forward_vector
+        orientation_vector = forward
     else:
-        orientation_vector = backward_vector
+        orientation_vector = backward
 
     return orientation_vector
 
@@ -224,11 +180,7 @@ def compute_current_velocity_pointA(vertex):
     omega_body = np.array([rr, ww, vv])              # Angular velocity in body frame
     r_fwd_body = np.array([0.655, 0, 0])           # Position of forward point relative to CG in body frame
 
-    # Ensure quaternion is in (x, y, z, w) format for scipy
-    q0 = vertex[3]
-    q1, q2, q3 = vertex[4:7]
-    rotation = R.from_quat([q1, q2, q3, q0])                    ####CHANGEDTHIS
-    R_b2i = rotation.as_matrix()  # Body to inertial rotation matrix
+    R_b2i = quaternion_to_dcm(vertex[3:7])  # Body to inertial rotation matrix
 
     # Compute cross product in body frame
     v_relative_body = np.cross(omega_body, r_fwd_body)
@@ -241,24 +193,17 @@ def compute_current_velocity_pointA(vertex):
 
     return v_fwd_inertial
 
-def get_neighbors(current, sim, map_instance, numberTree):
+def primitive_input_pairs():
     """
-    This function is used to compute the motion primitives for the current state.
-
-    This function will return:
-    1) A list containing all the valid primitives (all the states within all the valid primitives)
-    2) A list containing only the last states of the valid primitives
-    3) True/False based on if at least one primitive arrived at the goal
-    4) The final state and cost if we arrived at the goal
+    This function defines the inputs used for the motion primitives.
+    It returns an array with one row per primitive: (values, indices of u)
     """
-    
+
     dynamic_step = 3
 
     # Initialize variables
     max_input = 7
     step_input = dynamic_step
-    reached_states = []
-    last_states = []
 
     # Change the inputs for the primitives
     '''
@@ -287,16 +232,48 @@ def get_neighbors(current, sim, map_instance, numberTree):
     # 5 # Control all the inputs for tests if needed 
     #full_input_pairs = np.array([[-1000, 4]]) 
 
-    # Parallelize the creation of primitives
+    return full_input_pairs
+
+def get_neighbors(current_state, sim, map_instance, numberTree, pool=None, library=None, context=None):
+    """
+    This function is used to compute the motion primitives for the current state.
+    If a PrimitiveLibrary is given and covers the current state, the primitives are looked up and transformed.
+    Otherwise, if a PrimitiveWorkerPool is given, the primitives are generated by its resident workers,
+    otherwise all the inputs are rolled out together in this process (curvePrimitives_batch).
+    context: optional SearchContext of the search, the arrival of a valid primitive at the goal is recorded there.
+
+    This function will return:
+    1) A list containing all the valid primitives (all the states within all the valid primitives)
+    2) A list containing only the last states of the valid primitives
+    3) True/False based on if at least one primitive arrived at the goal
+    4) The final state, cost and index (in the list 1) of the primitive if we arrived at the goal
+    """
+
+    reached_states = []
+    last_states = []
+
+    # Generate the primitives
     arrived = False
-    results = Parallel(n_jobs=multiprocessing.cpu_count())(
-        delayed(process_input_pair)(inputs, current.state, sim, map_instance, numberTree) for inputs in full_input_pairs
-    ) 
+    looked_up = None
+    if library is not None:
+        alpha = calculate_angle_velocityGoal(current_state, map_instance, numberTree)
+        looked_up = library.primitives(current_state, map_instance, alpha, numberTree)
+    if looked_up is not None:
+        primitives, costs, inObs, arrived_primitives = looked_up
+        results = [(primitives[ii], (primitives[ii][:, -1], costs[ii]), inObs[ii], arrived_primitives[ii]) for ii in range(len(costs))]
+    elif pool is not None:
+        primitives, costs, arrived_primitives = pool.expand(current_state, numberTree)
+        results = [(primitives[ii], (primitives[ii][:, -1], costs[ii]), False, arrived_primitives[ii]) for ii in range(len(costs))]
+    else:
+        alpha = calculate_angle_velocityGoal(current_state, map_instance, numberTree)
+        primitives, costs, inObs, arrived_primitives = sim.curvePrimitives_batch(current_state, primitive_input_pairs(), map_instance, alpha, numberTree)
+        results = [(primitives[ii], (primitives[ii][:, -1], costs[ii]), inObs[ii], arrived_primitives[ii]) for ii in range(len(costs))]
 
     # Save the generated primitives
     arrived_atLeast_one = False
     finalState = None
     finalCost = None
+    finalIndex = None
     bestFinalAngle = 2*np.pi
     for data, last_state, inObstacle, arrived in results:
 
@@ -313,15 +290,30 @@ def get_neighbors(current, sim, map_instance, numberTree):
             if arrived:
 
                 arrived_atLeast_one = True
+                if context is not None:
+                    context.goal_reached(numberTree)
                 bestOrientation = compute_current_orientationVector(last_state[0], map_instance, numberTree)
                 finalAngle = calculate_angle_goalVector(last_state[0], bestOrientation, map_instance, numberTree)
                 if finalAngle < bestFinalAngle:
 
                     finalState = last_state[0]
                     finalCost = last_state[1]
+                    finalIndex = len(reached_states) - 1
     end_p = time.time()
 
-    return reached_states, last_states, arrived_atLeast_one, (finalState, finalCost)
+    return reached_states, last_states, arrived_atLeast_one, (finalState, finalCost, finalIndex)
+
+def set_goal_node(graph, current_node, reached_states, final, numberTree=1):
+    """
+    Store the primitive that arrived at the goal (final, see get_neighbors) from current_node in its own node, with the key ("goal", numberTree).
+    The lattice cell of its last state may hold a cheaper node that is not in the goal area, so the path is reconstructed from this node.
+    It returns its id
+    """
+
+    finalState, finalCost, finalIndex = final
+    g = graph.g[current_node] + finalCost
+
+    return graph.set_node(finalState, current_node, g, g, getResolution(reached_states[finalIndex], glbv.RESOLUTION_DT), ("goal", numberTree))
 
 def heuristic(state, goal_p):
     """
@@ -392,15 +384,15 @@ def calculate_f(neighbor, map_instance, tentative_g, heuristic_cost, dec, typeF,
             final_vector = orientation_vector + v_vector
             angle_between_vectors = calculate_angle_goalVector(neighbor, final_vector, map_instance, numberTree)
 
-            # Compute d and c distances
+            # Compute d and c distances (heuristic_cost is the distance to the goal, straight line or HeuristicField)
             maxAngle = np.deg2rad(7)
             if angle_between_vectors > maxAngle:
                 angleBrake = angle_between_vectors - maxAngle
                 d = -1**2 / (-2*dec)
-                c = np.sqrt(goal_vector_norm**2 + d**2 - 2*goal_vector_norm*d*np.cos(angleBrake))
+                c = np.sqrt(heuristic_cost**2 + d**2 - 2*heuristic_cost*d*np.cos(angleBrake))
                 heuristic = c + d
             else:
-                heuristic = goal_vector_norm
+                heuristic = heuristic_cost
 
             total_f = (tentative_g**2 + heuristic**2) / tentative_g
 
@@ -410,6 +402,56 @@ def calculate_f(neighbor, map_instance, tentative_g, heuristic_cost, dec, typeF,
         
     return total_f
 
+def calculate_f_batch(neighbors, map_instance, tentative_g, heuristic_cost, dec, typeF, numberTree):
+    """
+    Vectorized calculate_f() for the (N, 19) neighbors of one expansion, tentative_g and heuristic_cost are (N,) arrays
+    """
+
+    match typeF:
+        case 1:
+            '''# 1 # Normal A star'''
+
+            total_f = tentative_g + heuristic_cost
+
+        case 2:
+            '''# 2 # Adaptive A star'''
+
+            total_f = (tentative_g**2 + heuristic_cost**2) / tentative_g
+
+        case 3:
+            '''# 3 # Using the heading A star'''
+
+            # Define the goal vector
+            goal = map_instance["goal_pixel"] if numberTree == 1 else map_instance["start_pos"]
+            goal_vector = np.asarray(goal[:3], dtype=float) - neighbors[:, :3]
+            goal_vector_norm = np.linalg.norm(goal_vector, axis=1)
+            goal_direction = goal_vector / np.where(goal_vector_norm > 0, goal_vector_norm, 1)[:, None]
+
+            # Best orientation vector: forward if it is less than 90 deg away from the goal vector, backward otherwise
+            forward_vector = compute_forward_vector_batch(neighbors)
+            useForward = (np.sum(forward_vector * goal_direction, axis=1) > 0) | (goal_vector_norm == 0)
+            orientation_vector = np.where(useForward[:, None], forward_vector, -forward_vector)
+
+            # Find the angle between final_vector and goal
+            final_vector = orientation_vector + body_to_global_velocity_batch(neighbors[:, 3:7], neighbors[:, 7:10])
+            final_vector_norm = np.linalg.norm(final_vector, axis=1)
+            cos_theta = np.sum(final_vector * goal_direction, axis=1) / np.where(final_vector_norm > 0, final_vector_norm, 1)
+            angle_between_vectors = np.where((final_vector_norm == 0) | (goal_vector_norm == 0), 0, np.arccos(np.clip(cos_theta, -1.0, 1.0)))
+
+            # Compute d and c distances
+            maxAngle = np.deg2rad(7)
+            d = -1**2 / (-2*dec)
+            c = np.sqrt(np.maximum(heuristic_cost**2 + d**2 - 2*heuristic_cost*d*np.cos(angle_between_vectors - maxAngle), 0))
+            heuristic = np.where(angle_between_vectors > maxAngle, c + d, heuristic_cost)
+
+            total_f = (tentative_g**2 + heuristic**2) / tentative_g
+
+        case _:
+            print("Non valid cost function f...")
+            total_f = np.zeros(len(neighbors))
+
+    return total_f
+
 def getResolution(reached_states, dt_reference):
     '''Used for getting the correct resolution of the path... i.e. waypoints every dt'''
 
@@ -436,131 +478,210 @@ def getResolution(reached_states, dt_reference):
     return list_vertices
 
 def computeAngleDeg(state1, state2):
-    q1 = state1[3:7]
-    q2 = state2[3:7]
-
-    r1 = R.from_quat([q1[1], q1[2], q1[3], q1[0]])  # (x, y, z, w)
-    r2 = R.from_quat([q2[1], q2[2], q2[3], q2[0]])
-
-    q_rel = r2 * r1.inv()
-    angle_rad = q_rel.magnitude()  # angle of relative rotation
-
-    return np.rad2deg(angle_rad)
-
-def find_tree_intersection(g_cost_tree1, g_cost_tree2, list_connection_states, minimumDistance=0.5, minimumAngle = 20):
-    '''Function used for connecting the two trees in Double-Tree '''
-
-    coords_tree1 = np.array([node.state[:3] for node in g_cost_tree1])  # x, y, z only
-    coords_tree2 = np.array([node.state[:3] for node in g_cost_tree2])
+    # Angle of the relative rotation
+    return relative_angle(state1[3:7], state2[3:7], degrees=True)
 
-    tree1_kdtree = KDTree(coords_tree1)
-    for idx2, coord2 in enumerate(coords_tree2):
+def find_tree_intersection(connector, list_connection_states, minimumDistance=0.5, minimumAngle = 20, newOnly=True):
+    '''Function used for connecting the two trees in Double-Tree (connector: TreeConnector with the nodes of both trees).
+    With newOnly, only the nodes generated since the previous call are checked.
+    The list holds every pair once, the threshold is on connector.count that counts the candidates of each call again
+    (one per second tree node), so the trees connect after as many iterations as with the list of repeated pairs'''
 
-        distance, index = tree1_kdtree.query(coord2)
-        if distance < minimumDistance:
-            node1 = list(g_cost_tree1.keys())[index]
-            node2 = list(g_cost_tree2.keys())[idx2]
-            angle_deg = computeAngleDeg(node1.state, node2.state)
-
-            if np.abs(angle_deg) < minimumAngle:
-                list_connection_states.append((node1.state, node2.state))
+    list_connection_states.extend(connector.connections(minimumDistance, minimumAngle, newOnly))
 
     moreThanMinimum = False
-    if len(list_connection_states) > 1000:
+    if connector.count > 1000:
         moreThanMinimum = True
     
     return (list_connection_states, moreThanMinimum)
 
-def findBestConnectionNodes(list_states):
+def findBestConnectionNodes(graph, graph_secondTree, list_pairs):
+    '''Pick and remove from list_pairs the pair of node ids (id1, id2) with the best aligned velocities.
+    The states are read now from the graphs, the nodes may have been replaced since the pair was found'''
     best_angle = np.inf
+    best_index = 0
 
     # Using current_v + forward angles
-    for state1, state2 in list_states:
+    for i, (id1, id2) in enumerate(list_pairs):
+        state1 = graph.states[id1]
+        state2 = graph_secondTree.states[id2]
         v1 = body_to_global_velocity(state1[3:7], state1[7:10])
         v2 = - body_to_global_velocity(state2[3:7], state2[7:10])
         angle_deg = np.rad2deg(calculate_angle_betweenVectors(v1, v2))
         if angle_deg < best_angle:
             best_angle = angle_deg
-            best_state1 = state1
-            best_state2 = state2
-    
-    # Delete the best state from the list 
-    for i, (state1, state2) in enumerate(list_states):
-        if np.array_equal(state1, best_state1) and np.array_equal(state2, best_state2):
-            del list_states[i]
-            break
+            best_index = i
     
-    # Create the list containing the best states
-    connection_list = [best_state1]
-    connection_list.append(best_state2)
-    
-    return connection_list
+    # Delete the best pair from the list 
+    return list_pairs.pop(best_index)
 
 def compute_current_pitch(state):
 
-    q0, q1, q2, q3 = state[3:7]
+    return np.rad2deg(quaternion_pitch(state[3:7]))  # in degrees
 
-    r = R.from_quat([q1, q2, q3, q0])  
-    _, pitch, _ = r.as_euler('xyz', degrees=True)
+def compute_current_forward_vector(state):
 
-    return pitch  # in degrees
+    return forward_vector(state[3:7])
 
-def compute_current_forward_vector(state):
+def pop_open_node(open_set, graph):
+    """
+    Pop the node with the lowest f_cost from the open set (entries (f_cost, g_cost, node id)) and close it.
+    Entries of closed nodes and entries whose cost was lowered afterwards are skipped (lazy decrease-key).
 
-    # Define quaternion
-    q0,q1,q2,q3 = state[3:7]
+    It returns the node id, None if the open set is empty
+    """
 
-    # Define forward and backward vectors
-    rotation = R.from_quat([q1, q2, q3, q0])
-    body_forward = np.array([1.0, 0.0, 0.0])
-    forward_vector = rotation.apply(body_forward)
-    forward_vector_norm = np.linalg.norm(forward_vector)
-    forward_vector /= forward_vector_norm
+    while open_set:
+        _, g, node = heapq.heappop(open_set)
+        if graph.closed[node] or g > graph.g[node]:
+            continue
+        graph.closed[node] = True
+        return node
+
+    return None
+
+def heuristic_batch(states, map_instance, numberTree, heuristic_field=None):
+    """
+    Heuristic of an (N, >=3) array of states towards the goal of the tree:
+    the HeuristicField if given, the straight line otherwise
+    """
+
+    if heuristic_field is not None:
+        return heuristic_field(states)
 
-    return forward_vector
+    goal = map_instance["goal_pixel"] if numberTree == 1 else map_instance["start_pos"]
+    return np.linalg.norm(states[:, :3] - np.asarray(goal[:3], dtype=float), axis=1)
 
-def double_a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, dec):
+def update_open_set(graph, current_node, reached_states, last_states, open_set, map_instance, dec, typeF_function, numberTree, heuristic_field=None, inflation=1.0, inconsistent=None, f_batch=None):
+    """
+    Add the end points of the valid primitives from current_node (id) to the SearchGraph and the open set.
+    A neighbor is only added if its node is not closed yet and it improves the cost of the node,
+    the improved node replaces the previous one (state, parent and waypoints).
+    The heuristic is the HeuristicField of the tree if given, the straight line otherwise, multiplied by inflation.
+
+    inconsistent: set (ARA*). If given, closed nodes whose cost improves are updated too
+    and stored there instead of the open set.
+    f_batch: optional f_batch(neighbors, tentative_g) returning the f costs, instead of the heuristic and calculate_f_batch (multi-goal)
+
+    It returns the list of the ids of the added (or improved) nodes
+    """
+
+    added = []
+    if len(last_states) == 0:
+        return added
+
+    dt_resolution = glbv.RESOLUTION_DT
+
+    # Calculate tentative g scores, heuristics and f costs of all the neighbors at once
+    current_g = graph.g[current_node]
+    neighbors = np.array([neighbor for neighbor, _ in last_states])
+    tentative_g = current_g + np.array([cost_path for _, cost_path in last_states])
+    if f_batch is not None:
+        f_costs = f_batch(neighbors, tentative_g)
+    else:
+        heuristic_cost = inflation * heuristic_batch(neighbors, map_instance, numberTree, heuristic_field)
+        f_costs = calculate_f_batch(neighbors, map_instance, tentative_g, heuristic_cost, dec, typeF_function, numberTree)
+
+    for ii, (sequence_states, (neighbor, _)) in enumerate(zip(reached_states, last_states)):
+
+        key = graph.lattice.key(neighbor)
+        neighbor_node = graph.node_id(neighbor, key)
+
+        # Update the hierarchy
+        if neighbor_node is not None and tentative_g[ii] >= graph.g[neighbor_node]:
+            continue
+        if neighbor_node is not None and graph.closed[neighbor_node] and inconsistent is None:
+            continue
+
+        # Save the node with its parent, costs and specific points for resolution of the trajectory
+        neighbor_node = graph.set_node(neighbor, current_node, tentative_g[ii], f_costs[ii], getResolution(sequence_states, dt_resolution), key)
+        added.append(neighbor_node)
+
+        # Closed nodes wait for the next search with a lower inflation
+        if graph.closed[neighbor_node]:
+            inconsistent.add(neighbor_node)
+            continue
+
+        # Save the last node of the primitive along its f_cost
+        heapq.heappush(open_set, (f_costs[ii], tentative_g[ii], neighbor_node))
+
+    return added
+
+def update_stats(stats, sim, expansions, *graphs):
+    """
+    Statistics of a search, if a stats dict is given:
+    number of expanded nodes, of nodes in the graphs and of states evaluated by the dynamics (in this process)
+    """
+
+    if stats is None:
+        return
+    stats["expansions"] = expansions
+    stats["nodes"] = sum(graph.size for graph in graphs)
+    stats["rhs_evaluations"] = sim.rhs_evaluations()
+
+def double_a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, dec, pool=None, library=None, lattice=None, usePool=True, stats=None):
     """
     This is the main function of the algorithm. This function runs the main loop for generating the path.
     If needed, change the initial condition of SAM in the "SAM initial state".
     If you want to change the starting position (or goal position), use MapGeneration_MotionPrimitives.py.
 
+    pool: PrimitiveWorkerPool (created for this map_instance) used for the primitives. If None, one is started for this search and closed at the end.
+    library: optional PrimitiveLibrary, its primitives are used wherever it covers the current state.
+    lattice: StateLattice for the duplicate detection of nodes, a default StateLattice() if None.
+    usePool: if False and no pool is given, the primitives are generated in this process (e.g. within worker processes).
+    stats: optional dict, filled during the search with the expansions, the generated nodes and the dynamics evaluations (see update_stats).
+
     This function returns (trajectory, successfulZeroOrOne, totalCost)
     """
 
+    sim = SAM_PRIMITIVES()
+    if pool is not None or not usePool:
+        return double_a_star_search_loop(ax, plt, map_instance, realTimeDraw, typeF_function, dec, sim, pool, library, lattice, stats)
+
+    # Start the primitive workers once for the whole search
+    with PrimitiveWorkerPool(sim, map_instance, primitive_input_pairs()) as pool:
+        return double_a_star_search_loop(ax, plt, map_instance, realTimeDraw, typeF_function, dec, sim, pool, library, lattice, stats)
+
+def double_a_star_search_loop(ax, plt, map_instance, realTimeDraw, typeF_function, dec, sim, pool, library=None, lattice=None, stats=None):
+    """
+    Main loop of the double-tree search, see double_a_star_search
+    """
+
     # Initialise general variables (valid for both trees)
     random.seed()
-    sim = SAM_PRIMITIVES()
+    if lattice is None:
+        lattice = StateLattice()
+    heuristic_field = get_heuristic_field(map_instance, 1)    # None without obstacles (straight line)
+    heuristic_field_secondTree = get_heuristic_field(map_instance, 2)
+    context = SearchContext()   # arrivals of this search
     dt_resolution = glbv.RESOLUTION_DT
     flag = 0    # for number of iterations
+    expansions = 0
     nMaxIterations = 300
     maxTime = 300   # seconds
 
     # First tree variables
     x0 = map_instance["initial_state"]
-    start = Node(x0)
-    open_set = []                   # (cost_node, Node)
-    parents_dictionary = {}         # (Node_current: Node_parent)
-    g_cost = {start: 0}             # keeps track of the costs of the nodes, useful to understand more convenient paths
-    resolution_dictionary = {}
-    heapq.heappush(open_set, (0, start))
-    parents_dictionary[start] = None
+    graph = SearchGraph(lattice)    # nodes: states, parents, costs and waypoints
+    start = graph.set_node(x0, -1, 0)
+    open_set = []                   # (f_cost, g_cost, node id)
+    heapq.heappush(open_set, (0, 0, start))
     arrivedPoint = False
 
     # Second tree variables
     x0_secondTree = map_instance["final_state"] 
-    start_secondTree = Node(x0_secondTree)
+    graph_secondTree = SearchGraph(lattice)
+    start_secondTree = graph_secondTree.set_node(x0_secondTree, -1, 0)
     open_set_secondTree = []
-    parents_dictionary_secondTree = {}
-    g_cost_secondTree = {start_secondTree: 0}
-    resolution_dictionary_secondTree = {}
-    heapq.heappush(open_set_secondTree, (0, start_secondTree))
-    parents_dictionary_secondTree[start_secondTree] = None
+    heapq.heappush(open_set_secondTree, (0, 0, start_secondTree))
     arrivedPoint_secondTree = False
     
 
     # Start the search
-    list_connection_states = []  #[(node1, node2), ...]
+    list_connection_states = []  #[(id1, id2), ...]
+    connector = TreeConnector(graph, graph_secondTree)  # spatial index of both trees, for the intersection
+    connector.add_nodes(1, [start])
+    connector.add_nodes(2, [start_secondTree])
     algorithm_start_time = time.time()
     current_algorithm_time = algorithm_start_time
     while (current_algorithm_time - algorithm_start_time < maxTime):   ###Change this in the future
@@ -568,7 +689,7 @@ def double_a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, de
         if flag > 0:
             status = 1
 
-            list_connection_states, moreThanMinimum = find_tree_intersection(g_cost, g_cost_secondTree, list_connection_states, 1, 50)
+            list_connection_states, moreThanMinimum = find_tree_intersection(connector, list_connection_states, 1, 50)
             if arrivedPoint and arrivedPoint_secondTree and not moreThanMinimum:
                 
                 distance = 0
@@ -579,7 +700,7 @@ def double_a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, de
                     while angle <= 150 and not moreThanMinimum:
                         angle += 10
                         print("Angle (deg):", angle)
-                        list_connection_states, moreThanMinimum = find_tree_intersection(g_cost, g_cost_secondTree, list_connection_states, distance, angle)      
+                        list_connection_states, moreThanMinimum = find_tree_intersection(connector, list_connection_states, distance, angle, newOnly=False)      
                 moreThanMinimum = True
 
             currentNumOptimization = 0
@@ -597,12 +718,12 @@ def double_a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, de
                         return list_connection_states, 0, "NoPointsToConnect"
 
                     currentNumOptimization += 1
-                    list_connection = findBestConnectionNodes(list_connection_states)  
+                    id1, id2 = findBestConnectionNodes(graph, graph_secondTree, list_connection_states)
 
                     # Reconstruct the second path and invert v, w, rpm
                     waypoints = []
-                    first_path = reconstruct_path_doubleTree(Node(list_connection[0]), parents_dictionary,resolution_dictionary, map_instance, ax, plt)
-                    second_path = reconstruct_path_doubleTree(Node(list_connection[-1]), parents_dictionary_secondTree, resolution_dictionary_secondTree, map_instance, ax, plt)
+                    first_path = reconstruct_path_doubleTree(graph, id1, map_instance, ax, plt)
+                    second_path = reconstruct_path_doubleTree(graph_secondTree, id2, map_instance, ax, plt)
 
                     # Add last states for robustness
                     for _ in range(50):
@@ -618,7 +739,7 @@ def double_a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, de
                     # Create the list containing the two nodes to be connected
                     list_connection_full = []
                     for _ in range(10): # If you change it, you have to recompile Acados!
-                        list_connection_full.append(list_connection[0])
+                        list_connection_full.append(graph.states[id1].copy())
                     list_connection_full.append(second_path[-1])
                     
                     # Optimizing the connection
@@ -693,23 +814,31 @@ def double_a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, de
 
         # Get the current node for the first tree (the one with cheapest f_cost in open_set)
         if not arrivedPoint:
-            _, current_node = heapq.heappop(open_set)   #removes and returns the node with lowest f value
-            current_g = g_cost[current_node]
+            current_node = pop_open_node(open_set, graph)   #removes and returns the node with lowest f value
+            if current_node is None:
+                # Nothing left to expand: stop growing this tree
+                print(f"{bcolors.WARNING}first tree has no nodes left{bcolors.ENDC}")
+                arrivedPoint = True
 
         # Get the current node for the second tree (the one with cheapest f_cost in open_set)
         if not arrivedPoint_secondTree:
-            _, current_node_secondTree = heapq.heappop(open_set_secondTree)   #removes and returns the node with lowest f value
-            current_g_secondTree = g_cost_secondTree[current_node_secondTree]
+            current_node_secondTree = pop_open_node(open_set_secondTree, graph_secondTree)   #removes and returns the node with lowest f value
+            if current_node_secondTree is None:
+                # Nothing left to expand: stop growing this tree
+                print(f"{bcolors.WARNING}second tree has no nodes left{bcolors.ENDC}")
+                arrivedPoint_secondTree = True
 
         # Find new neighbors (last point of the primitives) using the motion primitives
         if not arrivedPoint:
-            reached_states, last_states, neighbor_arrived, final = get_neighbors(current_node, sim, map_instance, 1)
+            reached_states, last_states, _, final = get_neighbors(graph.states[current_node], sim, map_instance, 1, pool, library, context)
             finalLast = final[0] # in case we arrived
             finalCost = final[1] # in case we arrived 
+            expansions += 1
 
         # Find new neighbors for second tree (last point of the primitives) using the motion primitives
         if not arrivedPoint_secondTree:
-            reached_states_secondTree, last_states_secondTree, neighbor_arrived_secondTree, final_secondTree = get_neighbors(current_node_secondTree, sim, map_instance, 2)
+            reached_states_secondTree, last_states_secondTree, _, final_secondTree = get_neighbors(graph_secondTree.states[current_node_secondTree], sim, map_instance, 2, pool, library, context)
+            expansions += 1
             finalLast_secondTree = final_secondTree[0] # in case we arrived
             finalCost_secondTree = final_secondTree[1] # in case we arrived 
 
@@ -722,10 +851,6 @@ def double_a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, de
             if len(reached_states) != 0:
                 for sequence_states in reached_states:
 
-                    # Save specific points for resolution of the trajectory
-                    list_vertices = getResolution(sequence_states, dt_resolution)
-                    resolution_dictionary[Node(sequence_states[:,-1])] = list_vertices
-
                     # Plot the found motion primitives
                     if realTimeDraw:
                         x_vals = sequence_states[0, :]
@@ -738,35 +863,14 @@ def double_a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, de
                     plt.pause(0.01)
 
                 # Save the new valid primitives
-                for neighbor, cost_path in last_states:
-                    
-                    # Calculate tentative g score
-                    tentative_g_cost = current_g + cost_path
-                    
-                    # Update the hierarchy
-                    if Node(neighbor) not in g_cost or tentative_g_cost < g_cost[Node(neighbor)]:
-
-                        # Save g cost in the g_cost dictionary
-                        g_cost[Node(neighbor)] = tentative_g_cost              
-                        
-                        # Compute the f_cost
-                        f_cost = calculate_f(neighbor, map_instance, tentative_g_cost,  heuristic(neighbor, (map_instance["goal_pixel"][0], map_instance["goal_pixel"][1], map_instance["goal_pixel"][2])), dec, typeF_function, 1)
-
-                        # Add node dependency on current node
-                        parents_dictionary[Node(neighbor)] = (current_node)   
-
-                        # Save the last node of the primitive along its f_cost
-                        heapq.heappush(open_set, (f_cost, Node(neighbor)))   
+                added = update_open_set(graph, current_node, reached_states, last_states, open_set, map_instance, dec, typeF_function, 1, heuristic_field)
+                connector.add_nodes(1, added)
 
         # Analyze the single steps within the primitives (each dt) for second tree
         if not arrivedPoint_secondTree:
             if len(reached_states_secondTree) != 0:
                 for sequence_states_secondTree in reached_states_secondTree:
 
-                    # Save specific points for resolution of the trajectory
-                    list_vertices_secondTree = getResolution(sequence_states_secondTree, dt_resolution)
-                    resolution_dictionary_secondTree[Node(sequence_states_secondTree[:,-1])] = list_vertices_secondTree
-
                     # Plot the found motion primitives
                     if realTimeDraw:
                         x_vals_secondTree = sequence_states_secondTree[0, :]
@@ -779,30 +883,14 @@ def double_a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, de
                     plt.pause(0.01)
 
                 # Save the new valid primitives
-                for neighbor_secondTree, cost_path_secondTree in last_states_secondTree:
-                    
-                    # Calculate tentative g score
-                    tentative_g_cost_secondTree = current_g_secondTree + cost_path_secondTree
-                    
-                    # Update the hierarchy
-                    if Node(neighbor_secondTree) not in g_cost_secondTree or tentative_g_cost_secondTree < g_cost_secondTree[Node(neighbor_secondTree)]:
-
-                        # Save g cost in the g_cost dictionary
-                        g_cost_secondTree[Node(neighbor_secondTree)] = tentative_g_cost_secondTree              
-                        
-                        # Compute the f_cost
-                        f_cost_secondTree = calculate_f(neighbor_secondTree, map_instance, tentative_g_cost_secondTree,  heuristic(neighbor_secondTree, (map_instance["start_pos"][0], map_instance["start_pos"][1], map_instance["start_pos"][2])), dec, typeF_function, 2) 
-
-                        # Add node dependency on current node
-                        parents_dictionary_secondTree[Node(neighbor_secondTree)] = (current_node_secondTree)   
-
-                        # Save the last node of the primitive along its f_cost
-                        heapq.heappush(open_set_secondTree, (f_cost_secondTree, Node(neighbor_secondTree)))   
+                added_secondTree = update_open_set(graph_secondTree, current_node_secondTree, reached_states_secondTree, last_states_secondTree, open_set_secondTree, map_instance, dec, typeF_function, 2, heuristic_field_secondTree)
+                connector.add_nodes(2, added_secondTree)
+        update_stats(stats, sim, expansions, graph, graph_secondTree)
 
         # If a neighbor arrived to goal, avoid computing its neighbour (do not continue growing that tree!)
-        if neighbor_arrived:
+        if context.arrived[1]:
             arrivedPoint = True
-        if neighbor_arrived_secondTree:
+        if context.arrived[2]:
             arrivedPoint_secondTree = True
 
         # Update the timer
@@ -813,18 +901,40 @@ def double_a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, de
 
     return [], 0, "maxIterations" # No path found 
 
-def a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, dec):
+def a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, dec, pool=None, library=None, lattice=None, usePool=True, stats=None):
     """
     This is the main function of the algorithm. This function runs the main loop for generating the path.
     If needed, change the initial condition of SAM in the "SAM initial state".
     If you want to change the starting position (or goal position), use MapGeneration_MotionPrimitives.py.
 
+    pool: PrimitiveWorkerPool (created for this map_instance) used for the primitives. If None, one is started for this search and closed at the end.
+    library: optional PrimitiveLibrary, its primitives are used wherever it covers the current state.
+    lattice: StateLattice for the duplicate detection of nodes, a default StateLattice() if None.
+    usePool: if False and no pool is given, the primitives are generated in this process (e.g. within worker processes).
+    stats: optional dict, filled during the search with the expansions, the generated nodes and the dynamics evaluations (see update_stats).
+
     This function returns (trajectory, successfulZeroOrOne, totalCost)
     """
 
+    sim = SAM_PRIMITIVES()
+    if pool is not None or not usePool:
+        return a_star_search_loop(ax, plt, map_instance, realTimeDraw, typeF_function, dec, sim, pool, library, lattice, stats)
+
+    # Start the primitive workers once for the whole search
+    with PrimitiveWorkerPool(sim, map_instance, primitive_input_pairs()) as pool:
+        return a_star_search_loop(ax, plt, map_instance, realTimeDraw, typeF_function, dec, sim, pool, library, lattice, stats)
+
+def a_star_search_loop(ax, plt, map_instance, realTimeDraw, typeF_function, dec, sim, pool, library=None, lattice=None, stats=None):
+    """
+    Main loop of the single-tree search, see a_star_search
+    """
+
     # Initialise general variables (valid for both trees)
     random.seed()
-    sim = SAM_PRIMITIVES()
+    if lattice is None:
+        lattice = StateLattice()
+    heuristic_field = get_heuristic_field(map_instance, 1)    # None without obstacles (straight line)
+    context = SearchContext()   # arrivals of this search
     dt_resolution = glbv.RESOLUTION_DT
     flag = 0    # for number of iterations
     nMaxIterations = 300
@@ -832,14 +942,10 @@ def a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, dec):
 
     # First tree variables
     x0 = map_instance["initial_state"]
-    start = Node(x0)
-    open_set = []                   # (cost_node, Node)
-    parents_dictionary = {}         # (Node_current: Node_parent)
-    g_cost = {start: 0}             # keeps track of the costs of the nodes, useful to understand more convenient paths
-    resolution_dictionary = {}
-    heapq.heappush(open_set, (0, start))
-    parents_dictionary[start] = None
-    arrivedPoint = False
+    graph = SearchGraph(lattice)    # nodes: states, parents, costs and waypoints
+    start = graph.set_node(x0, -1, 0)
+    open_set = []                   # (f_cost, g_cost, node id)
+    heapq.heappush(open_set, (0, 0, start))
 
     # Start the search
     algorithm_start_time = time.time()
@@ -847,10 +953,10 @@ def a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, dec):
     while (algorithm_current_time - algorithm_start_time < maxTime): 
         
         # Reconstruct the path of first tree if arrived to the goal
-        if arrivedPoint:
+        if context.arrived[1]:
             print("A star (first tree) ended successfully!")
-            glbv.ARRIVED_PRIM = 0
-            path, successfulSearch = reconstruct_path(Node(finalLast), parents_dictionary, resolution_dictionary, map_instance, ax, plt)
+            context.reset(1)
+            path, successfulSearch = reconstruct_path(graph, goal_node, map_instance, ax, plt)
 
             if successfulSearch:
                 return path, successfulSearch, "success"
@@ -860,17 +966,19 @@ def a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, dec):
         print(f"iteration {flag:.0f}")
 
         # Get the current node for the first tree (the one with cheapest f_cost in open_set)
-        _, current_node = heapq.heappop(open_set)   #removes and returns the node with lowest f value
-        current_g = g_cost[current_node]
+        current_node = pop_open_node(open_set, graph)   #removes and returns the node with lowest f value
+        if current_node is None:
+            break
 
         # Stop the algorithm if we exceed the maximum number of iterations
         if flag > nMaxIterations:
             break
 
         # Find new neighbors (last point of the primitives) using the motion primitives
-        reached_states, last_states, arrivedPoint, final = get_neighbors(current_node, sim, map_instance, 1)
-        finalLast = final[0] # in case we arrived
-        finalCost = final[1] # in case we arrived 
+        reached_states, last_states, _, final = get_neighbors(graph.states[current_node], sim, map_instance, 1, pool, library, context)
+        if context.arrived[1]:
+            goal_node = set_goal_node(graph, current_node, reached_states, final)
+        update_stats(stats, sim, flag, graph)
 
         #If all the generated primitives are not in the free space, then continue with the next vertex
         if len(reached_states) == 0: 
@@ -879,10 +987,6 @@ def a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, dec):
         # Analyze the single steps within the primitives (each dt) for first tree
         for sequence_states in reached_states:
 
-            # Save specific points for resolution of the trajectory
-            list_vertices = getResolution(sequence_states, dt_resolution)
-            resolution_dictionary[Node(sequence_states[:,-1])] = list_vertices
-
             # Plot the found motion primitives
             if realTimeDraw:
                 x_vals = sequence_states[0, :]
@@ -895,25 +999,8 @@ def a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, dec):
             plt.pause(0.01)
 
         # Save the new valid primitives
-        for neighbor, cost_path in last_states:
-            
-            # Calculate tentative g score
-            tentative_g_cost = current_g + cost_path
-            
-            # Update the hierarchy
-            if Node(neighbor) not in g_cost or tentative_g_cost < g_cost[Node(neighbor)]:
-
-                # Save g cost in the g_cost dictionary
-                g_cost[Node(neighbor)] = tentative_g_cost              
-                
-                # Compute the f_cost
-                f_cost = calculate_f(neighbor, map_instance, tentative_g_cost,  heuristic(neighbor, (map_instance["goal_pixel"][0], map_instance["goal_pixel"][1], map_instance["goal_pixel"][2])), dec, typeF_function, 1)
-
-                # Add node dependency on current node
-                parents_dictionary[Node(neighbor)] = (current_node)   
-
-                # Save the last node of the primitive along its f_cost
-                heapq.heappush(open_set, (f_cost, Node(neighbor)))   
+        update_open_set(graph, current_node, reached_states, last_states, open_set, map_instance, dec, typeF_function, 1, heuristic_field)
+        update_stats(stats, sim, flag, graph)
         
         # Update the current time
         algorithm_current_time = time.time()
@@ -925,4 +1012,4 @@ def a_star_search(ax, plt, map_instance, realTimeDraw, typeF_function, dec):
 
 
 # Possible results for "failingNotes":
-# "success", "allOptimizationsFailed", "maxIterations", "NoPointsToConnect", "maxNumberOptimizations"
+# "success", "allOptimizationsFailed", "maxIterations", "maxTime", "NoPointsToConnect", "maxNumberOptimizations"
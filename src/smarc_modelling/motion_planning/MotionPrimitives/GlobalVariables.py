@@ -4,11 +4,4 @@ DT_PRIMITIVES = 0.1
 # Change the dt you want to get in the final trajectory (i.e. the resolution)
 RESOLUTION_DT = 0.1 # !! RESOLUTION_DT > DT_PRIMITIVES !!
 
-# Number of arrived primitives for the first tree
-ARRIVED_PRIM = 0
-
-# Number of arrived primitives for the second tree
-ARRIVED_PRIM_SECONDTREE = 0
-
-# Map instance
-MAP_INSTANCE = None
\ No newline at end of file
+# The state of a search (e.g. the arrivals at the goal) is not global, see SearchContext
\ No newline at end of file
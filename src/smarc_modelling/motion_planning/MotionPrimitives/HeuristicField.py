@@ -0,0 +1,87 @@
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import dijkstra
+from smarc_modelling.motion_planning.MotionPrimitives.ObstacleChecker import get_occupancy_map
+
+# Largest ratio between the 26-connected grid distance and the straight line: the norm of the step costs
+# (1, sqrt(2)-1, sqrt(3)-sqrt(2)) of the sorted axis distances
+GRID_METRIC_OVERESTIMATE = np.sqrt(1 + (np.sqrt(2) - 1)**2 + (np.sqrt(3) - np.sqrt(2))**2)
+
+class HeuristicField():
+    """
+    Obstacle-aware heuristic: lower bound (m) of the path length to the goal around the obstacles.
+
+    A single Dijkstra pass from the goal over the voxels of the OccupancyMap (26-connected, occupied voxels blocked)
+    is done once at planning start. The grid distance D between the voxel centers overestimates the path length by
+    up to GRID_METRIC_OVERESTIMATE, and the point and the goal are off their voxel centers. A lookup is therefore
+
+        h(p) = max(|p - goal|, D(v)/GRID_METRIC_OVERESTIMATE - |p - c_v| - |goal - c_goal|)
+
+    O(1) per point. It never exceeds the straight line where that is free, and grows behind the obstacles.
+    Voxels that cannot reach the goal are np.inf.
+
+    Parameters:
+        map_instance: the map
+        goal: (x, y, z) of the goal
+    """
+
+    def __init__(self, map_instance, goal):
+        occupancy = get_occupancy_map(map_instance)
+        self.occupancy = occupancy
+        self.goal = np.asarray(goal[:3], dtype=float)
+        shape = occupancy.shape
+        resolution = occupancy.resolution
+        free = ~occupancy.occupancy
+
+        # Edges between free neighbouring voxels, every offset only in one direction (undirected graph)
+        index = np.arange(np.prod(shape)).reshape(shape)
+        offsets = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1) if (dx, dy, dz) > (0, 0, 0)]
+        rows, cols, weights = [], [], []
+        for offset in offsets:
+            source = tuple(slice(max(0, -d), n - max(0, d)) for d, n in zip(offset, shape))
+            target = tuple(slice(max(0, d), n - max(0, -d)) for d, n in zip(offset, shape))
+            valid = free[source] & free[target]
+            rows.append(index[source][valid])
+            cols.append(index[target][valid])
+            weights.append(np.full(np.count_nonzero(valid), resolution * np.linalg.norm(offset)))
+        graph = coo_matrix((np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))),
+                           shape=(index.size, index.size)).tocsr()
+
+        # Distance from the goal, starting at the center of the goal voxel
+        self.goal_voxel = occupancy.voxel_index(self.goal)[0]
+        goal_center = self.voxel_center(self.goal_voxel[None])[0]
+        self.field = dijkstra(graph, directed=False, indices=index[tuple(self.goal_voxel)]).reshape(shape)
+        self.goal_offset = np.linalg.norm(self.goal - goal_center)
+
+    def voxel_center(self, voxels):
+        return self.occupancy.origin + (voxels + 0.5) * self.occupancy.resolution
+
+    def __call__(self, points):
+        """
+        Heuristic of an (N, 3) array of points, it returns an (N,) array
+        """
+
+        points = np.atleast_2d(points)[:, :3]
+        voxels = self.occupancy.voxel_index(points)
+        ix, iy, iz = voxels.T
+        h_grid = self.field[ix, iy, iz] / GRID_METRIC_OVERESTIMATE \
+               - np.linalg.norm(points - self.voxel_center(voxels), axis=1) - self.goal_offset
+
+        return np.maximum(np.linalg.norm(points - self.goal, axis=1), h_grid)
+
+def get_heuristic_field(map_instance, numberTree):
+    """
+    This function returns the HeuristicField towards the goal of the tree (goal_pixel for the first tree, start_pos
+    for the second one), or None if the map has no obstacles (the straight line is exact there).
+    It is built once and stored in map_instance["heuristicField"]
+    """
+
+    if not get_occupancy_map(map_instance).has_obstacles:
+        return None
+
+    fields = map_instance.setdefault("heuristicField", {})
+    if numberTree not in fields:
+        goal = map_instance["goal_pixel"] if numberTree == 1 else map_instance["start_pos"]
+        fields[numberTree] = HeuristicField(map_instance, goal)
+
+    return fields[numberTree]
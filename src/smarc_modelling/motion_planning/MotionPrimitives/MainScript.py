@@ -4,11 +4,13 @@ from smarc_modelling.vehicles import *
 from smarc_modelling.lib import *
 import smarc_modelling.motion_planning.MotionPrimitives.MapGeneration as MapGen
 from smarc_modelling.motion_planning.MotionPrimitives.GenerationTree import a_star_search, double_a_star_search, body_to_global_velocity
+from smarc_modelling.motion_planning.MotionPrimitives.Planner import Planner
 from smarc_modelling.motion_planning.MotionPrimitives.PlotResults import *
 from smarc_modelling.motion_planning.MotionPrimitives.trm_colors import *
 from smarc_modelling.motion_planning.MotionPrimitives.StatisticalAnalysis import runStatisticalAnalysis
 #from smarc_modelling.sam_sim import plot_results, Sol
 import time
+import atexit
 import matplotlib.animation as animation
 #import pandas as pd
 from scipy.spatial.transform import Rotation as R
@@ -133,40 +135,40 @@ def MotionPlanningAlgorithm(realTimeDraw, map_instance):
         print(f"{bcolors.OKGREEN}[ OK ]{bcolors.ENDC}")
     print(f"{bcolors.OKGREEN}THE END{bcolors.ENDC}")
 
-def MotionPlanningROS(start_state, goal_state, map_boundaries, map_resolution):
+# Planners of MotionPlanningROS by (map_boundaries, map_resolution), kept warm between the calls
+planners = {}
+
+def get_planner(map_boundaries, map_resolution):
+    """
+    The Planner of the map, created at the first call and closed at exit
+    """
+
+    key = (tuple(map_boundaries), map_resolution)
+    if key not in planners:
+        planners[key] = Planner(map_boundaries, map_resolution)
+        atexit.register(planners[key].close)
+
+    return planners[key]
+
+def MotionPlanningROS(start_state, goal_state, map_boundaries, map_resolution, time_budget=None, callback=None):
     """
-    This is the function called by the ROS node. It takes:
+    This is the function called by the ROS node. The Planner of the map is kept between the calls (see get_planner). It takes:
     -)  start_state (np.array)
     -)  goal_state (np.array)
     -)  map_boundaries ((max_x, max_y, max_z))
     -)  map_resolution (float)
+    -)  time_budget (seconds, optional): use the anytime search, the best path found within the budget is returned
+    -)  callback (optional, with time_budget): called with (trajectory, totalCost, inflation) for every improved path
 
     And the output is:
     -)  a list of waypoints ans a successful Flag
     """
 
-    print(">> Creating the map")
-    map_instance = MapGen.generateMapInstance(start_state, goal_state, map_boundaries, map_resolution)
-    print(f"{bcolors.OKGREEN}[ OK ]{bcolors.ENDC}")
-    
-    complexity = MapGen.evaluateComplexityMap(map_instance)
-    print("complexity:",complexity)
-    
-    # Which cost function you want to use (1-Astar 2-AdaptiveAstar 3-HeadingConstraint) 
-    typeFunction = 3
-
-    # The tuning parameter in the algorithm (if using typeFunction=3)
-    dec = 0.1
-
-    # Search the path
+    # Search the path (cost function 3-HeadingConstraint with dec = 0.1, see Planner)
     print(f"{bcolors.HEADER}>> Trajectory search{bcolors.ENDC}")
+    planner = get_planner(map_boundaries, map_resolution)
     start_time = time.time()
-    if complexity == 0:
-        print(f"{bcolors.WARNING}single tree search{bcolors.ENDC}")
-        trajectory, succesfulSearch, totalCost = a_star_search(None, None, map_instance, False, typeFunction, dec)
-    else:
-        print(f"{bcolors.WARNING}double tree search{bcolors.ENDC}")
-        trajectory, succesfulSearch, totalCost = double_a_star_search(None, None, map_instance, False, typeFunction, dec)
+    trajectory, succesfulSearch, totalCost = planner.plan(start_state, goal_state, time_budget, callback)
     print(f"{bcolors.OKGREEN}[ OK ]{bcolors.ENDC}")
     end_time = time.time()
 
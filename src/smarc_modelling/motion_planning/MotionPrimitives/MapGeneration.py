@@ -8,9 +8,9 @@ from smarc_modelling.motion_planning.MotionPrimitives.GenerationTree import comp
 from scipy.spatial.transform import Rotation as R
 #import pandas as pd
 
-def generationFirstMap():
-    """Define random seed"""
-    random.seed()
+def generationFirstMap(seed=None):
+    """Define random seed (None: unseeded)"""
+    random.seed(seed)
 
     """Define tiles"""
     F = 0   #free
@@ -234,6 +234,21 @@ def generateMapInstance(start_state, goal_state, map_boundaries, map_res):
 
     return map_instance
 
+def generateMapOfComplexity(chosenComplexity, seed=None):
+    """
+    Random map (generationFirstMap) of the chosen complexity (see evaluateComplexityMap).
+    With a seed the same map is returned every time.
+    """
+
+    attempt = 0
+    complexity = -1
+    while complexity != chosenComplexity:
+        map_instance = generationFirstMap(None if seed is None else f"{seed}-{attempt}")
+        complexity = evaluateComplexityMap(map_instance)
+        attempt += 1
+
+    return map_instance
+
 def evaluateComplexityMap(map_instance):
     start_position = map_instance["start_pos"]
     goal_position = map_instance["goal_pixel"]
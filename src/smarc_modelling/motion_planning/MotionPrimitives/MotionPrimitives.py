@@ -5,13 +5,14 @@ import smarc_modelling.motion_planning.MotionPrimitives.GlobalVariables as glbv
 import sys
 sys.path.append('~/Desktop/smarc_modelling-master')
 from smarc_modelling.vehicles.SAM import SAM
+from smarc_modelling.lib.integrators import Integrator
 from mpl_toolkits.mplot3d import Axes3D
 from smarc_modelling.motion_planning.MotionPrimitives.ObstacleChecker import *
 import math
 
 
 class SAM_PRIMITIVES():
-    def __init__(self):
+    def __init__(self, backend="numpy", compile=False, integrator="euler"):
 
         # 1 # select the duration of 1 step within a primitive 
         self.dt = glbv.DT_PRIMITIVES
@@ -23,14 +24,46 @@ class SAM_PRIMITIVES():
         self.n_sim = int(self.t_span[1]/self.dt)
         self.t_eval = np.linspace(self.t_span[0], self.t_span[1], self.n_sim)
 
+        # 4 # limits of the dynamic primitive length in curvePrimitives (seconds)
+        self.min_t_span = 1.5
+        self.max_t_span = 3
+
         # Create SAM instance
-        self.sam = SAM(self.dt)
+        # backend: "numpy" or "casadi", see SAM.set_backend
+        self.backend = backend
+        self.compile = compile
+        # integrator: method of lib.integrators.Integrator used for the steps
+        self.integrator_method = integrator
+        self.sam = self.createSAM()
+
+    def createSAM(self):
+        """
+        Create the SAM instance with the selected dynamics backend
+        """
+        sam = SAM(self.dt)
+        sam.set_backend(self.backend, compile=self.compile)
+        self.integrator = Integrator(sam.dynamics, self.integrator_method)
+        self.batch_integrator = Integrator(sam.dynamics_batch, self.integrator_method)
+        return sam
+
+    def rhs_evaluations(self):
+        """
+        Number of states evaluated by the dynamics of SAM in this process (since createSAM)
+        """
+        return self.integrator.n_evaluations + self.batch_integrator.n_evaluations
 
     def dynamics_wrapper(self, x, ds_inputs, indexes):
         """
         u: control inputs as [x_vbs, x_lcg, delta_s (rad), delta_r (rad), rpm1, rpm2]
         index: 2 for vertical primitives and 3 for horizontal primitives
         """
+        return self.sam.dynamics(x, self.controlInputs(ds_inputs, indexes))
+
+    def controlInputs(self, ds_inputs, indexes):
+        """
+        Control input vector u for the primitive inputs ds_inputs at the
+        positions indexes
+        """
 
         # Default conditions
         u = np.zeros(6)
@@ -51,15 +84,41 @@ class SAM_PRIMITIVES():
             else:
                 u[int(indexes[ii])] = ds_inputs[ii]
 
-        return self.sam.dynamics(x, u)
+        return u
+
+    def controlInputs_batch(self, input_pairs):
+        """
+        Control inputs (N, 6) for an (N, 2*nInputs) array of (values, indices of u), see controlInputs
+        """
+
+        nPrimitives = input_pairs.shape[0]
+        nInputs = input_pairs.shape[1] // 2
+        values = input_pairs[:, :nInputs].astype(float)
+        indexes = input_pairs[:, nInputs:].astype(int)
+
+        # Default conditions
+        U = np.zeros((nPrimitives, 6))
+        U[:, 0] = 50  # VBS
+        U[:, 1] = 50  # LCG
+
+        # Unpacking the inputs, angles in radiants and RPM2 = RPM1
+        rows = np.arange(nPrimitives)
+        for jj in range(nInputs):
+            index = indexes[:, jj]
+            isAngle = (index == 2) | (index == 3)
+            U[rows, index] = np.where(isAngle, np.deg2rad(values[:, jj]), values[:, jj])
+            isRPM = index == 4
+            U[rows[isRPM], 5] = values[isRPM, jj]
+
+        return U
 
     def curvePrimitives_singleStep(self, x, ds_inputs, indexes):
         '''
-        dynamical model with forward Euler, it returns a SINGLE step within one primitive and the cost for such step
+        dynamical model with the selected integrator (forward Euler by default), it returns a SINGLE step within one primitive and the cost for such step
         '''
 
         data = np.empty(len(x)) 
-        data[:] = x + self.dynamics_wrapper(x, ds_inputs, indexes) * self.dt 
+        data[:] = self.integrator.step(x, self.controlInputs(ds_inputs, indexes), self.dt)
         cost = self.computeCost(x, data[:])
 
         return data, cost
@@ -79,20 +138,14 @@ class SAM_PRIMITIVES():
 
         return cost
         
-    def curvePrimitives(self, x0, ds_inputs, indexes_u, map_instance, angle, numberTree):
-        '''
-        It returns the sequence of steps within a single input primitive.
-
-        The output will be (a, b, c, d), where:
-            a: sequence of point within one primitive (one single input)    --> We use them to plot the primitive (we can not only use the last point, otherwise it will be a stright line)
-            b: the cost of this path, from x0 to x1 (within one single input)   --> We add it to the cost of the previous node (x0)
-            c: True if at least one point of the primitive lies in an obstacle, False otherwise
-            d: True if at least one point of the primitive lies in the goal area, False otherwise
-        '''
+    def primitiveLength(self, angle):
+        """
+        Set the dynamic length of the primitives (t_span and n_sim) from the angle between velocity and goal
+        """
 
         # Compute the dynamical value for the primitiveLength
-        maxValue = 3 
-        minValue = 1.5
+        maxValue = self.max_t_span
+        minValue = self.min_t_span
         stepAngle = 85
         MinAngle = np.min([angle, np.pi- angle])
         if np.rad2deg(MinAngle) < stepAngle:
@@ -112,6 +165,22 @@ class SAM_PRIMITIVES():
         self.t_span = (0, computedSpan)
         self.n_sim = int(self.t_span[1]/self.dt)
 
+        return self.n_sim
+
+    def curvePrimitives(self, x0, ds_inputs, indexes_u, map_instance, angle, numberTree):
+        '''
+        It returns the sequence of steps within a single input primitive.
+
+        The output will be (a, b, c, d), where:
+            a: sequence of point within one primitive (one single input)    --> We use them to plot the primitive (we can not only use the last point, otherwise it will be a stright line)
+            b: the cost of this path, from x0 to x1 (within one single input)   --> We add it to the cost of the previous node (x0)
+            c: True if at least one point of the primitive lies in an obstacle, False otherwise
+            d: True if at least one point of the primitive lies in the goal area, False otherwise
+        '''
+
+        # Compute the dynamic t_span
+        self.primitiveLength(angle)
+
         # Initialize the variables
         cost_sum = 0
         data = np.empty((len(x0), self.n_sim))  # a matrix containing for each state in x0, n_sim values (empty rn)
@@ -132,8 +201,8 @@ class SAM_PRIMITIVES():
             pointB = compute_B_point_backward(data[:, i+1])
             current_cg = (data[0,i+1], data[1,i+1], data[2,i+1])
 
-            # If outside the map, reject the primitive
-            if  IsOutsideTheMap(pointB[0], pointB[1], pointB[2], map_instance) or IsOutsideTheMap(pointA[0], pointA[1], pointA[2], map_instance):
+            # If outside the map or colliding with an obstacle, reject the primitive
+            if  IsOutsideTheMap(pointB[0], pointB[1], pointB[2], map_instance) or IsOutsideTheMap(pointA[0], pointA[1], pointA[2], map_instance) or IsHullInObstacle_batch(np.array([pointA]), np.array([pointB]), map_instance)[0]:
                 return [], -1, True, False, None
 
             # If arrived at the goal
@@ -143,6 +212,160 @@ class SAM_PRIMITIVES():
                 
         return data, cost_sum, False, arrivedPointBefore, finalState
 
+    def stepPrimitives_batch(self, X, U):
+        """
+        One integration step of dt for an (N, nx) array of states with the (N, 6) control inputs.
+        euler and rk4 are batched, the other methods are stepped row by row
+        """
+
+        if self.integrator_method in ("euler", "rk4"):
+            return self.batch_integrator.step(X, U, self.dt)
+
+        return np.array([self.integrator.step(x_k, u_k, self.dt) for x_k, u_k in zip(X, U)])
+
+    def rolloutPrimitives_batch(self, x0, input_pairs, n_sim, out=None):
+        """
+        Integrate the primitives of all the inputs for n_sim samples, without any map or goal check.
+        A primitive that diverges (non-finite state) is not integrated further and is NaN from there on.
+        It returns the (N, nx, n_sim) states
+        """
+
+        input_pairs = np.atleast_2d(input_pairs)
+        U = self.controlInputs_batch(input_pairs)
+        if out is None:
+            out = np.empty((input_pairs.shape[0], len(x0), n_sim))
+        data = out[:, :, :n_sim]
+        data[:, :, 0] = x0
+        finite = np.ones(input_pairs.shape[0], dtype=bool)
+        with np.errstate(over="ignore", invalid="ignore"):
+            for i in range(n_sim - 1):
+                if finite.all():
+                    data[:, :, i+1] = self.stepPrimitives_batch(data[:, :, i], U)
+                else:
+                    data[~finite, :, i+1] = np.nan
+                    if finite.any():
+                        data[finite, :, i+1] = self.stepPrimitives_batch(data[finite, :, i], U[finite])
+                finite &= np.isfinite(data[:, :, i+1]).all(axis=1)
+
+        return data
+
+    def checkPrimitives_batch(self, data, map_instance, numberTree):
+        """
+        Map and goal checks of curvePrimitives_batch for already integrated (N, nx, n_sim) primitives.
+        A primitive is rejected if it leaves the map before (or when) it arrives at the goal,
+        the arrived ones are set to their final state from the arrival on (in place).
+        Diverged primitives (non-finite states, see rolloutPrimitives_batch) are rejected as well.
+
+        It returns (costs, inObs, arrived) as (N,) arrays
+        """
+
+        nPrimitives, nx, n_sim = data.shape
+        if n_sim < 2:
+            return np.zeros(nPrimitives), np.zeros(nPrimitives, dtype=bool), np.zeros(nPrimitives, dtype=bool)
+
+        # Only the finite primitives are checked
+        finite = np.isfinite(data).all(axis=(1, 2))
+        if not finite.all():
+            costs = np.full(nPrimitives, np.inf)
+            inObs = ~finite
+            arrivedPoint = np.zeros(nPrimitives, dtype=bool)
+            if finite.any():
+                checked = data[finite]
+                costs[finite], inObs[finite], arrivedPoint[finite] = self.checkPrimitives_batch(checked, map_instance, numberTree)
+                data[finite] = checked
+            return costs, inObs, arrivedPoint
+
+        # Checks on all the points after the initial state at once
+        states = data[:, :, 1:].transpose(0, 2, 1).reshape(-1, nx)
+        pointA, pointB = compute_AB_points_batch(states)
+        outside = (IsOutsideTheMap_batch(pointA, map_instance) | IsOutsideTheMap_batch(pointB, map_instance) | IsHullInObstacle_batch(pointA, pointB, map_instance)).reshape(nPrimitives, n_sim - 1)
+        reached = (arrived_batch(states[:, :3], map_instance, numberTree) | arrived_batch(pointA, map_instance, numberTree) | arrived_batch(pointB, map_instance, numberTree)).reshape(nPrimitives, n_sim - 1)
+
+        # First step outside the map and in the goal area (n_sim if never)
+        firstOut = np.where(outside.any(axis=1), outside.argmax(axis=1), n_sim)
+        firstArrived = np.where(reached.any(axis=1), reached.argmax(axis=1), n_sim)
+        inObs = (firstOut < n_sim) & (firstOut <= firstArrived)
+        arrivedPoint = ~inObs & (firstArrived < n_sim)
+
+        # Cost of each step, after the arrival the last step cost keeps adding up as in curvePrimitives
+        step_costs = np.linalg.norm(np.diff(data[:, :3, :], axis=2), axis=1)
+        costs = step_costs.sum(axis=1)
+        k = firstArrived[arrivedPoint]
+        rows = np.flatnonzero(arrivedPoint)
+        costs[rows] = np.cumsum(step_costs[rows], axis=1)[np.arange(len(rows)), k] + (n_sim - 2 - k) * step_costs[rows, k]
+
+        # Hold the final state of the arrived primitives
+        last = np.where(arrivedPoint, firstArrived + 1, n_sim - 1)
+        columns = np.minimum(np.arange(n_sim)[None, :], last[:, None])
+        data[:] = np.take_along_axis(data, np.broadcast_to(columns[:, None, :], data.shape), axis=2)
+
+        return costs, inObs, arrivedPoint
+
+    def curvePrimitives_batch(self, x0, input_pairs, map_instance, angle, numberTree, out=None):
+        '''
+        Vectorized curvePrimitives() for all the inputs at once: the N primitives are advanced together as an (N, nx) array.
+        Map and goal checks are masks, rejected and arrived primitives stop being integrated.
+
+        input_pairs: (N, 2*nInputs) array of (values, indices of u)
+        out: optional (N, nx, >=n_sim) buffer for the states
+
+        The output will be (a, b, c, d), where:
+            a: (N, nx, n_sim) sequence of points within each primitive (only valid where c is False)
+            b: (N,) cost of each primitive
+            c: (N,) True if at least one point of the primitive is outside the map
+            d: (N,) True if at least one point of the primitive lies in the goal area
+        '''
+
+        # Compute the dynamic t_span
+        n_sim = self.primitiveLength(angle)
+
+        # Initialize the variables
+        input_pairs = np.atleast_2d(input_pairs)
+        nPrimitives = input_pairs.shape[0]
+        U = self.controlInputs_batch(input_pairs)
+        if out is None:
+            out = np.empty((nPrimitives, len(x0), n_sim))
+        data = out[:, :, :n_sim]
+        data[:, :, 0] = x0
+        cost_sum = np.zeros(nPrimitives)
+        cost = np.zeros(nPrimitives)
+        inObs = np.zeros(nPrimitives, dtype=bool)
+        arrivedPoint = np.zeros(nPrimitives, dtype=bool)
+
+        for i in range(n_sim - 1):
+            active = ~(inObs | arrivedPoint)
+            if not np.any(active):
+                break
+
+            # Advance the active primitives, the arrived ones stay in their final state
+            x = data[active, :, i]
+            x_next = self.stepPrimitives_batch(x, U[active])
+            data[:, :, i+1] = data[:, :, i]
+            data[active, :, i+1] = x_next
+            cost[active] = np.linalg.norm(x_next[:, :3] - x[:, :3], axis=1)
+            cost_sum += cost
+
+            # Find point base, A and B
+            pointA, pointB = compute_AB_points_batch(x_next)
+            current_cg = x_next[:, :3]
+
+            # If outside the map or colliding with an obstacle, reject the primitive
+            outside = IsOutsideTheMap_batch(pointA, map_instance) | IsOutsideTheMap_batch(pointB, map_instance) | IsHullInObstacle_batch(pointA, pointB, map_instance)
+            inObs[np.flatnonzero(active)[outside]] = True
+
+            # If arrived at the goal
+            reached = ~outside & (arrived_batch(current_cg, map_instance, numberTree) | arrived_batch(pointA, map_instance, numberTree) | arrived_batch(pointB, map_instance, numberTree))
+            arrivedPoint[np.flatnonzero(active)[reached]] = True
+        else:
+            i = n_sim - 1
+
+        # All primitives stopped early: hold the final states, the last step cost keeps adding up as in curvePrimitives
+        if i < n_sim - 1:
+            data[:, :, i+1:] = data[:, :, i:i+1]
+            cost_sum += (n_sim - 1 - i) * cost
+
+        return data, cost_sum, inObs, arrivedPoint
+
     def curvePrimitives_justToShow(self, x0, ds_inputs, indexes_u):
         '''
         ONLY USED FOR PLOTTING THE PRIMITIVES IN THIS SCRIPT
@@ -172,7 +395,7 @@ class SAM_PRIMITIVES():
         self.t_span = (0, lengthTime)
         self.n_sim = int(self.t_span[1]/self.dt)
         self.t_eval = np.linspace(self.t_span[0], self.t_span[1], self.n_sim)
-        self.sam = SAM(self.dt)
+        self.sam = self.createSAM()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,171 @@
+import heapq
+import time
+import numpy as np
+from smarc_modelling.motion_planning.MotionPrimitives.MotionPrimitives import SAM_PRIMITIVES
+from smarc_modelling.motion_planning.MotionPrimitives.PrimitiveWorkers import PrimitiveWorkerPool
+from smarc_modelling.motion_planning.MotionPrimitives.HeuristicField import get_heuristic_field
+from smarc_modelling.motion_planning.MotionPrimitives.SearchGraph import SearchGraph
+from smarc_modelling.motion_planning.MotionPrimitives.ObstacleChecker import arrived_batch, compute_AB_points_batch
+from smarc_modelling.motion_planning.MotionPrimitives.GenerationTree import StateLattice, primitive_input_pairs, get_neighbors, pop_open_node, update_open_set, update_stats, heuristic_batch, calculate_f_batch, getResolution, reconstruct_path
+from smarc_modelling.motion_planning.MotionPrimitives.trm_colors import *
+import smarc_modelling.motion_planning.MotionPrimitives.GlobalVariables as glbv
+
+def goal_map_instance(map_instance, goal):
+    """
+    Copy of map_instance with another goal state (goal_pixel, goal_area and final_state), the occupancy map is shared
+    """
+
+    goal_map = {key: value for key, value in map_instance.items() if key != "heuristicField"}
+    TILESIZE = map_instance["TileSize"]
+    goal_map["goal_pixel"] = tuple(goal[:3])
+    goal_map["goal_area"] = (int((goal[1] - map_instance["y_min"]) // TILESIZE),
+                             int((goal[0] - map_instance["x_min"]) // TILESIZE),
+                             int((goal[2] - map_instance["z_min"]) // TILESIZE))
+    goal_map["final_state"] = np.asarray(goal)
+
+    return goal_map
+
+def multi_goal_f_batch(goal_maps, remaining, heuristic_fields, dec, typeF_function):
+    """
+    f_batch for update_open_set: the lowest f_cost over the remaining goals (combined heuristic)
+    """
+
+    def f_batch(neighbors, tentative_g):
+        f_costs = np.full(len(neighbors), np.inf)
+        for k in remaining:
+            heuristic_cost = heuristic_batch(neighbors, goal_maps[k], 1, heuristic_fields[k])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                f_costs = np.minimum(f_costs, calculate_f_batch(neighbors, goal_maps[k], tentative_g, heuristic_cost, dec, typeF_function, 1))
+
+        return f_costs
+
+    return f_batch
+
+def refresh_open_set(open_set, graph, f_batch):
+    """
+    Recompute the f_cost of the open nodes (after a goal was reached, the combined heuristic changed)
+    """
+
+    nodes = np.array(sorted({node for _, g, node in open_set if not graph.closed[node] and g <= graph.g[node]}), dtype=int)
+    open_set.clear()
+    if len(nodes) == 0:
+        return
+
+    g = graph.g[nodes]
+    f_costs = np.where(g > 0, f_batch(graph.states[nodes], g), 0)
+    graph.f[nodes] = f_costs
+    open_set.extend(zip(f_costs, g, nodes))
+    heapq.heapify(open_set)
+
+def goal_arrivals(reached_states, current_g, goal_maps, remaining):
+    """
+    First arrival of the primitives (reached_states of get_neighbors) in the goal area of each remaining goal.
+    It returns {goal index: (cost, primitive index, column of the arrival)} with the cheapest primitive per goal
+    """
+
+    arrivals = {}
+    for ii, data in enumerate(reached_states):
+        if data.shape[1] < 2:
+            continue
+        states = data[:, 1:].T
+        pointA, pointB = compute_AB_points_batch(states)
+        step_costs = np.cumsum(np.linalg.norm(np.diff(data[:3, :], axis=1), axis=0))
+        for k in remaining:
+            reached = arrived_batch(states[:, :3], goal_maps[k], 1) | arrived_batch(pointA, goal_maps[k], 1) | arrived_batch(pointB, goal_maps[k], 1)
+            if not np.any(reached):
+                continue
+            first = int(np.argmax(reached))
+            cost = current_g + step_costs[first]
+            if k not in arrivals or cost < arrivals[k][0]:
+                arrivals[k] = (cost, ii, first + 1)
+
+    return arrivals
+
+def multi_goal_a_star_search(map_instance, goals, typeF_function, dec, pool=None, library=None, lattice=None, usePool=True, stats=None, maxIterations=300, maxTime=300):
+    """
+    Multi-goal version of a_star_search: one tree from the start of map_instance towards all the goal states at once.
+
+    The open set is ordered by the lowest f_cost over the goals not reached yet. Every expansion checks the
+    primitives against the goal area of all these goals (arrived_batch). A goal is done at its first arrival
+    (as a_star_search), the search goes on towards the remaining ones and ends when all are reached.
+
+    goals: list of goal states (same format as map_instance["final_state"])
+    pool, library, lattice, usePool, stats: see a_star_search (the pool is started with the map of the first goal, see multi_goal_a_star_loop)
+    maxIterations, maxTime: limits of the whole search (expansions, seconds)
+
+    This function returns a list with (trajectory, successfulSearch, failingNotes) for each goal, like a_star_search
+    """
+
+    goal_maps = [goal_map_instance(map_instance, goal) for goal in goals]
+    sim = SAM_PRIMITIVES()
+    if pool is not None or not usePool:
+        return multi_goal_a_star_loop(goal_maps, typeF_function, dec, sim, pool, library, lattice, stats, maxIterations, maxTime)
+
+    # Start the primitive workers once for the whole search
+    with PrimitiveWorkerPool(sim, goal_maps[0], primitive_input_pairs()) as pool:
+        return multi_goal_a_star_loop(goal_maps, typeF_function, dec, sim, pool, library, lattice, stats, maxIterations, maxTime)
+
+def multi_goal_a_star_loop(goal_maps, typeF_function, dec, sim, pool, library=None, lattice=None, stats=None, maxIterations=300, maxTime=300):
+    """
+    Main loop of the multi-goal search, see multi_goal_a_star_search.
+    The primitives are generated with the map of the active goal, the first remaining one: they stop in its goal area
+    and are aligned with it. When the active goal is reached, the next remaining one becomes active (also in the pool),
+    so the tree can grow through the area of a reached goal
+    """
+
+    if lattice is None:
+        lattice = StateLattice()
+    active = 0
+    map_instance = goal_maps[active]
+    heuristic_fields = [get_heuristic_field(goal_map, 1) for goal_map in goal_maps]
+    remaining = set(range(len(goal_maps)))
+    f_batch = multi_goal_f_batch(goal_maps, remaining, heuristic_fields, dec, typeF_function)
+    results = [([], 0, "maxIterations") for _ in goal_maps]
+    dt_resolution = glbv.RESOLUTION_DT
+
+    # Tree variables
+    x0 = map_instance["initial_state"]
+    graph = SearchGraph(lattice)
+    start = graph.set_node(x0, -1, 0)
+    open_set = [(0, 0, start)]      # (f_cost, g_cost, node id)
+    expansions = 0
+
+    algorithm_start_time = time.time()
+    while remaining and expansions < maxIterations and time.time() - algorithm_start_time < maxTime:
+
+        current_node = pop_open_node(open_set, graph)
+        if current_node is None:
+            break
+        expansions += 1
+        print(f"iteration {expansions:.0f} ({len(remaining)} goals left)")
+
+        reached_states, last_states, _, _ = get_neighbors(graph.states[current_node], sim, map_instance, 1, pool, library)
+        update_open_set(graph, current_node, reached_states, last_states, open_set, map_instance, dec, typeF_function, 1, f_batch=f_batch)
+        update_stats(stats, sim, expansions, graph)
+
+        # Arrivals at the remaining goals (instead of a SearchContext), the primitive is cut at the arrival
+        arrivals = goal_arrivals(reached_states, graph.g[current_node], goal_maps, remaining)
+        for k, (cost, ii, column) in sorted(arrivals.items()):
+            data = reached_states[ii][:, :column+1]
+            goal_node = graph.set_node(data[:, -1], current_node, cost, cost, getResolution(data, dt_resolution), key=("goal", k))
+            path, successfulSearch = reconstruct_path(graph, goal_node, goal_maps[k], None, None)
+            if successfulSearch:
+                print(f"{bcolors.OKGREEN}[ OK ]{bcolors.ENDC} goal {k} reached with cost {cost:.3f}")
+                results[k] = (path, successfulSearch, "success")
+                remaining.discard(k)
+
+        # The combined heuristic changed
+        if arrivals and remaining:
+            refresh_open_set(open_set, graph, f_batch)
+
+        # Generate the primitives towards the next goal
+        if remaining and active not in remaining:
+            active = min(remaining)
+            map_instance = goal_maps[active]
+            if pool is not None:
+                pool.set_map(map_instance)
+
+    if time.time() - algorithm_start_time >= maxTime:
+        results = [result if result[1] else ([], 0, "maxTime") for result in results]
+
+    return results
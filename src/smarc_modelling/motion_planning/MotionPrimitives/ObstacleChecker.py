@@ -1,7 +1,21 @@
 import sys
 import numpy as np
-import smarc_modelling.motion_planning.MotionPrimitives.GlobalVariables as glbv
-from scipy.spatial.transform import Rotation as R
+from smarc_modelling.lib.quaternion import forward_vector, rotate
+from smarc_modelling.motion_planning.MotionPrimitives.OccupancyMap import OccupancyMap
+
+# Radius of SAM (m)
+SAM_RADIUS = 0.095
+
+def get_occupancy_map(map_instance):
+    """
+    This function returns the OccupancyMap of the map. It is built at the first call and stored in map_instance["occupancyMap"],
+    i.e. the given map_instance dict is modified. A map without "obstacleDict" has no obstacles
+    """
+
+    if map_instance.get("occupancyMap") is None:
+        map_instance["occupancyMap"] = OccupancyMap(map_instance)
+
+    return map_instance["occupancyMap"]
 
 def IsWithinObstacle(x,y,z, map_instance):
     """
@@ -11,12 +25,23 @@ def IsWithinObstacle(x,y,z, map_instance):
     --> How to check if a pixel position (x,y) is within an obstacle: IsWithinObstacle(x,y)
     """
 
-    ## CURRENTLY NOT CHECKING FOR TIP AND AFT!
-    TILESIZE = map_instance["TileSize"]
-    obstaclesDictionary = map_instance["obstacleDict"]
-    cellOfPixel = (y//TILESIZE, x//TILESIZE, z//TILESIZE)
+    ## CURRENTLY NOT CHECKING FOR TIP AND AFT! (see IsHullInObstacle_batch)
+    return bool(get_occupancy_map(map_instance).is_occupied(np.array([[x, y, z]]))[0])
+
+def IsWithinObstacle_batch(points, map_instance):
+    """
+    Vectorized IsWithinObstacle() for an (N, 3) array of points, it returns an (N,) boolean mask
+    """
+
+    return get_occupancy_map(map_instance).is_occupied(points)
+
+def IsHullInObstacle_batch(pointsA, pointsB, map_instance, radius=SAM_RADIUS):
+    """
+    This function checks if the hull of SAM, the capsule between pointB (aft) and pointA (forward) with the radius of SAM,
+    collides with an obstacle. It takes (N, 3) arrays and returns an (N,) boolean mask
+    """
 
-    return cellOfPixel in obstaclesDictionary
+    return get_occupancy_map(map_instance).capsule_collides(pointsA, pointsB, radius)
 
 def arrived(current, map_instance, numberTree):
     """
@@ -47,13 +72,25 @@ def arrived(current, map_instance, numberTree):
 
     if (x<arrivalx_min or x>arrivalx_max) or (y<arrivaly_min or y>arrivaly_max)  or (z<arrivalz_min or z>arrivalz_max):
         return False
-    
-    if glbv.ARRIVED_PRIM == 0:
-        print("DONE!")
-        glbv.ARRIVED_PRIM = 1
         
     return True
 
+def arrived_batch(points, map_instance, numberTree):
+    """
+    Vectorized arrived() for an (N, 3) array of points, it returns an (N,) boolean mask
+    """
+
+    # Compute goal area
+    TILESIZE = map_instance["TileSize"]
+    if numberTree == 1:
+        center = np.asarray(map_instance["goal_pixel"][:3], dtype=float)
+    else:
+        center = np.asarray(map_instance["start_pos"][:3], dtype=float)
+
+    inside = np.all(np.abs(points - center) <= 0.5 * TILESIZE, axis=1)
+
+    return inside
+
 def IsOutsideTheMap(x,y,z, map_instance):
     """
     This function checks if a pixel coordinate (x,y,z) is outside the map (True) or not (False) shrinked down by the radius of SAM = 0.095 meters
@@ -66,7 +103,7 @@ def IsOutsideTheMap(x,y,z, map_instance):
     xMax = map_instance["x_max"] 
     yMax = map_instance["y_max"] 
     zMax = map_instance["z_max"] 
-    radius = 0.095
+    radius = SAM_RADIUS
     
     # Check if we are inside the map
     if (x > xMin + radius and y > yMin + radius and z > zMin + radius) and (x < xMax - radius and y < yMax - radius and z < zMax - radius):   # Inside the map
@@ -74,26 +111,28 @@ def IsOutsideTheMap(x,y,z, map_instance):
     
     return True
 
-def compute_A_point_forward(state, distance=0.655):
+def IsOutsideTheMap_batch(points, map_instance):
     """
-    Compute the point 7.405 meters forward along the vehicle's longitudinal axis
+    Vectorized IsOutsideTheMap() for an (N, 3) array of points, it returns an (N,) boolean mask
     """
 
-    # Get current state
-    x, y, z, q0, q1, q2, q3 = state[:7]
+    # Boundaries of the map shrinked down by the radius of SAM
+    radius = SAM_RADIUS
+    lower = np.array([map_instance["x_min"], map_instance["y_min"], map_instance["z_min"]]) + radius
+    upper = np.array([map_instance["x_max"], map_instance["y_max"], map_instance["z_max"]]) - radius
 
-    # Create a rotation object from the quaternion
-    rotation = R.from_quat([q1, q2, q3, q0])  # Note: scipy expects [x, y, z, w] order
+    return ~np.all((points > lower) & (points < upper), axis=1)
 
-    # Forward direction in body frame (longitudinal axis)
-    forward_body = np.array([1, 0, 0])  # X-axis in body frame
+def compute_A_point_forward(state, distance=0.655):
+    """
+    Compute the point 7.405 meters forward along the vehicle's longitudinal axis
+    """
 
-    # Transform to world frame
-    forward_world = rotation.apply(forward_body)
-    forward_world /= np.linalg.norm(forward_world)
+    # Longitudinal axis (body x-axis) in world frame
+    forward_world = forward_vector(state[3:7])
 
     # Compute new point
-    new_point = np.array([x, y, z]) + distance * forward_world
+    new_point = np.asarray(state[:3], dtype=float) + distance * forward_world
 
     return tuple(new_point)
 
@@ -102,23 +141,30 @@ def compute_B_point_backward(state, distance=0.655):
     Compute the point 7.405 meters forward along the vehicle's longitudinal axis
     """
 
-    # Get current state
-    x, y, z, q0, q1, q2, q3 = state[:7]
+    # Longitudinal axis (body x-axis) in world frame
+    forward_world = forward_vector(state[3:7])
+
+    # Compute new point
+    new_point = np.asarray(state[:3], dtype=float) - distance * forward_world
+
+    return tuple(new_point)
 
-    # Create a rotation object from the quaternion
-    rotation = R.from_quat([q1, q2, q3, q0])  # Note: scipy expects [x, y, z, w] order
+def compute_forward_vector_batch(states):
+    """
+    Unit longitudinal axis in world frame for an (N, >=7) array of states, it returns an (N, 3) array
+    """
 
-    # Forward direction in body frame (longitudinal axis)
-    forward_body = np.array([1, 0, 0])  # X-axis in body frame
+    return forward_vector(states[:, 3:7])
 
-    # Transform to world frame
-    forward_world = rotation.apply(forward_body)
-    forward_world /= np.linalg.norm(forward_world)
+def compute_AB_points_batch(states, distance=0.655):
+    """
+    Vectorized compute_A_point_forward() and compute_B_point_backward() for an (N, >=7) array of states.
+    It returns the (N, 3) arrays (pointsA, pointsB)
+    """
 
-    # Compute new point
-    new_point = np.array([x, y, z]) - distance * forward_world
+    forward_world = distance * compute_forward_vector_batch(states)
 
-    return tuple(new_point)
+    return states[:, :3] + forward_world, states[:, :3] - forward_world
 
 def body_to_global_velocity(quaternion, body_velocity):
 
@@ -132,14 +178,25 @@ def body_to_global_velocity(quaternion, body_velocity):
     Returns:
     - global_velocity: [vX, vY, vZ] in global frame
     """
-    
-    # Create rotation object from quaternion
-    rotation = R.from_quat([quaternion[1], quaternion[2], quaternion[3], quaternion[0]])  # [x, y, z, w] format
-    
-    # Rotate body velocity to global frame
-    global_velocity = rotation.apply(body_velocity)
-    
-    return global_velocity
+
+    return rotate(quaternion, body_velocity)
+
+def body_to_global_velocity_batch(quaternions, body_velocities):
+    """
+    Vectorized body_to_global_velocity() for (N, 4) quaternions [q0, q1, q2, q3] and (N, 3) body velocities
+    """
+
+    return rotate(quaternions, body_velocities)
+
+def calculate_angle_velocityGoal(state, map_instance, numberTree):
+    """
+    Compute the angle (in rad) between the current velocity (global frame) and the goal vector.
+    Used for the dynamic length of the primitives
+    """
+
+    v_vector = body_to_global_velocity(state[3:7], state[7:10])
+
+    return calculate_angle_goalVector(state, v_vector, map_instance, numberTree)
 
 def calculate_angle_goalVector(state, vector, map_instance, numberTree, type = "normal"):
     """
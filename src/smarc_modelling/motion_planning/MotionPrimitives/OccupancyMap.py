@@ -0,0 +1,135 @@
+import numpy as np
+from scipy.ndimage import distance_transform_edt
+
+class OccupancyMap():
+    """
+    Dense voxel occupancy grid of the obstacles in map_instance, with a precomputed signed distance field.
+
+    The obstacles of map_instance["obstacleDict"] are cells (row=y, column=x, z) of size TileSize, counted from
+    (x_min, y_min, z_min). The grid uses voxels of TileSize/subdivision. The signed distance is positive in free
+    space and negative inside obstacles (m), evaluated by trilinear interpolation between voxel centers.
+    The map boundaries are not obstacles here, they are checked by IsOutsideTheMap.
+
+    All lookups take (N, 3) arrays of points (x, y, z).
+
+    Parameters:
+        map_instance: the map
+        subdivision: number of voxels per TileSize and axis
+    """
+
+    def __init__(self, map_instance, subdivision=1):
+        self.subdivision = subdivision
+        self.resolution = map_instance["TileSize"] / subdivision
+        self.origin = np.array([map_instance["x_min"], map_instance["y_min"], map_instance["z_min"]], dtype=float)
+        upper = np.array([map_instance["x_max"], map_instance["y_max"], map_instance["z_max"]], dtype=float)
+        self.shape = tuple(np.maximum(np.ceil((upper - self.origin) / self.resolution - 1e-9).astype(int), 1))
+
+        # Occupancy [ix, iy, iz]
+        self.occupancy = np.zeros(self.shape, dtype=bool)
+        self.set_cells(map_instance.get("obstacleDict", ()), True)
+        self.compute_sdf()
+
+    def set_cells(self, cells, occupied):
+        """
+        Mark the obstacle cells (row=y, column=x, z) as occupied or free
+        """
+
+        s = self.subdivision
+        for r, c, z in cells:
+            ix, iy, iz = int(c) * s, int(r) * s, int(z) * s
+            self.occupancy[ix:ix+s, iy:iy+s, iz:iz+s] = occupied
+
+    def update(self, add=(), remove=()):
+        """
+        Map delta: add and remove obstacle cells (row=y, column=x, z), the distance field is recomputed
+        """
+
+        self.set_cells(remove, False)
+        self.set_cells(add, True)
+        self.compute_sdf()
+
+    def compute_sdf(self):
+        """
+        Signed distance between voxel centers, shifted by half a voxel to approximate the obstacle surface
+        """
+
+        self.has_obstacles = bool(self.occupancy.any())
+        if self.has_obstacles:
+            outside = distance_transform_edt(~self.occupancy) * self.resolution
+            inside = distance_transform_edt(self.occupancy) * self.resolution
+            self.sdf = np.where(self.occupancy, -(inside - 0.5*self.resolution), outside - 0.5*self.resolution)
+        else:
+            self.sdf = np.full(self.shape, np.inf)
+
+    def voxel_index(self, points):
+        """
+        Integer voxel (ix, iy, iz) of each point, clipped to the grid
+        """
+
+        index = np.floor((np.atleast_2d(points) - self.origin) / self.resolution).astype(int)
+        return np.clip(index, 0, np.array(self.shape) - 1)
+
+    def is_occupied(self, points):
+        """
+        True for the points that lie in an occupied voxel
+        """
+
+        ix, iy, iz = self.voxel_index(points).T
+        return self.occupancy[ix, iy, iz]
+
+    def signed_distance(self, points):
+        """
+        Signed distance (m) of each point to the nearest obstacle, trilinear interpolation of the distance field
+        """
+
+        points = np.atleast_2d(points)
+        if not self.has_obstacles:
+            return np.full(len(points), np.inf)
+
+        # Coordinates in units of voxels, relative to the first voxel center
+        g = (points - self.origin) / self.resolution - 0.5
+        upper = np.array(self.shape) - 1
+        g = np.clip(g, 0, upper)
+        i0 = np.minimum(np.floor(g).astype(int), np.maximum(upper - 1, 0))
+        f = g - i0
+        i1 = np.minimum(i0 + 1, upper)
+
+        distance = np.zeros(len(points))
+        for cx in (0, 1):
+            ix = i1[:, 0] if cx else i0[:, 0]
+            wx = f[:, 0] if cx else 1 - f[:, 0]
+            for cy in (0, 1):
+                iy = i1[:, 1] if cy else i0[:, 1]
+                wy = f[:, 1] if cy else 1 - f[:, 1]
+                for cz in (0, 1):
+                    iz = i1[:, 2] if cz else i0[:, 2]
+                    wz = f[:, 2] if cz else 1 - f[:, 2]
+                    distance += wx * wy * wz * self.sdf[ix, iy, iz]
+
+        return distance
+
+    def capsule_collides(self, pointsA, pointsB, radius):
+        """
+        Swept-capsule check: True for each segment A-B whose points come closer than radius to an obstacle.
+        The segments are sampled at half the voxel size, the segments with the same number of samples together.
+        Segments with a non-finite point count as colliding.
+        """
+
+        pointsA = np.atleast_2d(pointsA)
+        pointsB = np.atleast_2d(pointsB)
+        finite = np.isfinite(pointsA).all(axis=1) & np.isfinite(pointsB).all(axis=1)
+        collides = ~finite
+        if not self.has_obstacles or not finite.any():
+            return collides
+
+        rows = np.flatnonzero(finite)
+        length = np.linalg.norm(pointsA[rows] - pointsB[rows], axis=1)
+        n_samples = np.ceil(length / (0.5*self.resolution)).astype(int) + 1
+        for n in np.unique(n_samples):
+            group = rows[n_samples == n]
+            s = np.linspace(0, 1, n)
+            samples = pointsB[group, None, :] + s[None, :, None] * (pointsA[group] - pointsB[group])[:, None, :]
+            distance = self.signed_distance(samples.reshape(-1, 3)).reshape(len(group), n)
+            collides[group] = np.any(distance < radius, axis=1)
+
+        return collides
@@ -1,10 +1,12 @@
 import numpy as np
 import os
+from threading import Lock
 from casadi import SX, vertcat, sqrt
 from acados_template import AcadosOcp, AcadosOcpSolver, AcadosModel
 from smarc_modelling.control.control import *
 from smarc_modelling.vehicles.SAM_casadi import *
 import smarc_modelling.motion_planning.MotionPrimitives.GlobalVariables as glbv
+from smarc_modelling.lib.acados_cache import cached_solver
 
 from casadi import SX, MX, vertcat, sqrt, horzcat
 
@@ -92,6 +94,24 @@ def compute_B_point_backward_casadi(state, distance=0.655):
 
     return new_point
 
+# Solvers of this process by horizon length, they are loaded once and reused for the following maps
+solvers = {}
+solver_lock = Lock()    # the solvers are shared by the threads of the process
+
+# Fields of the ocp set at every call (optimize_doubleTree)
+MAP_FIELDS = ("lbx_0", "ubx_0", "yref_e", "lh", "uh")
+
+def map_constraints(map_instance):
+    """
+    Bounds (lh, uh) that keep pointA and pointB inside the map
+    """
+
+    bound = 0.1
+    upper = np.array([map_instance["x_max"], map_instance["y_max"], map_instance["z_max"]], dtype=float) - bound
+    lower = np.array([map_instance["x_min"], map_instance["y_min"], map_instance["z_min"]], dtype=float) + bound
+
+    return np.concatenate([lower, lower]), np.concatenate([upper, upper])
+
 # Create an OCP object
 def create_ocp(model, x0, x_last, N, map_instance):
 
@@ -161,23 +181,8 @@ def create_ocp(model, x0, x_last, N, map_instance):
     )  
 
     # Constraint: x in XFREE
-    bound = 0.1
-    xMax = map_instance["x_max"] - bound
-    yMax = map_instance["y_max"] - bound
-    zMax = map_instance["z_max"] - bound
-    xMin = map_instance["x_min"] + bound
-    yMin = map_instance["y_min"] + bound
-    zMin = map_instance["z_min"] + bound
-
     ocp.model.con_h_expr = vertcat(goal_constraints_pointA, constraints_point_B)
-    ocp.constraints.lh = np.array([
-        xMin, yMin, zMin, 
-        xMin, yMin, zMin
-    ])
-    ocp.constraints.uh = np.array([
-        xMax, yMax, zMax, 
-        xMax, yMax, zMax
-    ])
+    ocp.constraints.lh, ocp.constraints.uh = map_constraints(map_instance)
     
     # Set constraints on the rate of change of inputs
     vbs_dot = 10    # Maximum rate of change for the VBS
@@ -211,32 +216,42 @@ def create_ocp(model, x0, x_last, N, map_instance):
     # Return ocp
     return ocp
 
+def get_solver(waypoints, map_instance):
+    """
+    The (ocp, ocp_solver) of this process for the horizon len(waypoints), loaded from the solver cache (or generated and built into it)
+    at the first call only. The initial state, the final reference and the map constraints are set at every call, they are not part of the cache key
+    """
+
+    N = len(waypoints)
+    if N not in solvers:
+        # Define class and model
+        dt = glbv.RESOLUTION_DT
+        sam = SAM_casadi(dt)
+        nmpc = NMPC(sam, dt, N, False)
+        model = nmpc.export_dynamics_model(sam)
+
+        # Create ocp
+        #ocp = create_ocp(model, waypoints[0], waypoints[-1], len(waypoints), map_instance)
+        ocp = create_ocp(model, waypoints[0], waypoints[-1], len(waypoints), map_instance)   # give waypoints[0] as the last for debugging!
+
+        # Solver setup
+        solvers[N] = (ocp, cached_solver(AcadosOcpSolver, ocp, ignore=MAP_FIELDS))
+
+    return solvers[N]
+
 def optimization_acados_doubleTree(waypoints, map_instance):
-    # Define class and model
-    dt = glbv.RESOLUTION_DT
+    with solver_lock:
+        return optimize_doubleTree(waypoints, map_instance)
+
+def optimize_doubleTree(waypoints, map_instance):
+    # Warm solver, start from a zero initial guess with the current map
     N = len(waypoints)
-    sam = SAM_casadi(dt)
-    nmpc = NMPC(sam, dt, N, False)
-    model = nmpc.export_dynamics_model(sam)
-
-    # Create ocp
-    #ocp = create_ocp(model, waypoints[0], waypoints[-1], len(waypoints), map_instance)
-    ocp = create_ocp(model, waypoints[0], waypoints[-1], len(waypoints), map_instance)   # give waypoints[0] as the last for debugging!
-
-    # Solver setup
-    # Set directory for code generation
-    this_file_dir = os.path.dirname(os.path.abspath(__file__))
-    #root_files_dir = '/home/parallels/Desktop/smarc_modelling-master/src/smarc_modelling/motion_planning/MotionPrimitives'
-    #package_root = os.path.abspath(os.path.join(this_file_dir, '..'))
-    package_root = os.path.abspath(this_file_dir)
-    codegen_dir = os.path.join(package_root, 'optimization_double_connection')
-    ocp_dir = os.path.join(codegen_dir, 'acados_ocp.json')
-    os.makedirs(codegen_dir, exist_ok=True)
-    ocp.code_export_directory = codegen_dir
-    print(f"ext package acados dir: {codegen_dir}")        
-
-    # Solve Acados (For compiling, change both flags to true)
-    ocp_solver = AcadosOcpSolver(ocp, json_file=ocp_dir, generate=False, build=False)
+    ocp, ocp_solver = get_solver(waypoints, map_instance)
+    ocp_solver.reset()
+    lh, uh = map_constraints(map_instance)
+    for stage in range(N):
+        ocp_solver.constraints_set(stage, "lh", lh)
+        ocp_solver.constraints_set(stage, "uh", uh)
 
     # Change y_ref of last point
     ocp_solver.set(N, "y_ref", waypoints[-1])
@@ -1,10 +1,12 @@
 import numpy as np
 import os
+from threading import Lock
 from casadi import SX, vertcat, sqrt
 from acados_template import AcadosOcp, AcadosOcpSolver, AcadosModel
 from smarc_modelling.control.control import *
 from smarc_modelling.vehicles.SAM_casadi import *
 import smarc_modelling.motion_planning.MotionPrimitives.GlobalVariables as glbv
+from smarc_modelling.lib.acados_cache import cached_solver
 
 from casadi import SX, MX, vertcat, sqrt, horzcat
 
@@ -92,6 +94,48 @@ def compute_B_point_backward_casadi(state, distance=0.655):
 
     return new_point
 
+# Solver of this process, it is built once and reused for the following maps (see set_map_constraints)
+solvers = {}
+solver_lock = Lock()    # the solvers are shared by the threads of the process
+
+# Fields of the ocp set by set_map_constraints
+MAP_FIELDS = ("lbx_0", "ubx_0", "lh", "uh", "lh_e", "uh_e")
+
+def map_constraints(map_instance):
+    """
+    Bounds of the constraints that depend on the map: (lh, uh) keep pointA and pointB inside the map,
+    (lh_e, uh_e) keep the final CG inside the goal area
+    """
+
+    # Goal area bounds
+    TILESIZE = map_instance["TileSize"]
+    goal = np.asarray(map_instance["goal_pixel"][:3], dtype=float)
+    lh_e = goal - 0.5 * TILESIZE
+    uh_e = goal + 0.5 * TILESIZE
+
+    # x in XFREE
+    bound = 0.1
+    upper = np.array([map_instance["x_max"], map_instance["y_max"], map_instance["z_max"]], dtype=float) - bound
+    lower = np.array([map_instance["x_min"], map_instance["y_min"], map_instance["z_min"]], dtype=float) + bound
+    lh = np.concatenate([lower, lower])
+    uh = np.concatenate([upper, upper])
+
+    return lh, uh, lh_e, uh_e
+
+def set_map_constraints(ocp_solver, N, x0, map_instance):
+    """
+    Set the initial state and the map constraints of a built solver
+    """
+
+    lh, uh, lh_e, uh_e = map_constraints(map_instance)
+    ocp_solver.set(0, "lbx", x0)
+    ocp_solver.set(0, "ubx", x0)
+    for stage in range(N):
+        ocp_solver.constraints_set(stage, "lh", lh)
+        ocp_solver.constraints_set(stage, "uh", uh)
+    ocp_solver.constraints_set(N, "lh", lh_e)
+    ocp_solver.constraints_set(N, "uh", uh_e)
+
 # Create an OCP object
 def create_ocp(model, x0, x_last, N, map_instance):
 
@@ -132,16 +176,8 @@ def create_ocp(model, x0, x_last, N, map_instance):
     # Constraints
     ocp.constraints.x0 = x0
 
-    # Terminal state constraints: Goal area bounds
-    
-    TILESIZE = map_instance["TileSize"]
-    arrivalx_min = map_instance["goal_pixel"][0] - 0.5 * TILESIZE
-    arrivalx_max = map_instance["goal_pixel"][0] + 0.5 * TILESIZE
-    arrivaly_min = map_instance["goal_pixel"][1] - 0.5 * TILESIZE
-    arrivaly_max = map_instance["goal_pixel"][1] + 0.5 * TILESIZE
-    arrivalz_min = map_instance["goal_pixel"][2] - 0.5 * TILESIZE
-    arrivalz_max = map_instance["goal_pixel"][2] + 0.5 * TILESIZE
-    
+    # Terminal state constraints: Goal area bounds, and x in XFREE
+    lh, uh, lh_e, uh_e = map_constraints(map_instance)
 
     # Define terminal state constraints as symbolic expressions
     goal_constraints_cg = vertcat(
@@ -184,34 +220,13 @@ def create_ocp(model, x0, x_last, N, map_instance):
     
     # At the end
     ocp.model.con_h_expr_e = vertcat(goal_constraints_cg)
-    ocp.constraints.lh_e = np.array([
-        arrivalx_min, arrivaly_min, arrivalz_min,  # cg bounds
-    ])
-    ocp.constraints.uh_e = np.array([
-        arrivalx_max, arrivaly_max, arrivalz_max,  # cg bounds
-    ])
-    
+    ocp.constraints.lh_e = lh_e     # cg bounds
+    ocp.constraints.uh_e = uh_e
 
     # Constraint: x in XFREE
-    
-    bound = 0.1
-    xMax = map_instance["x_max"] - bound
-    yMax = map_instance["y_max"] - bound
-    zMax = map_instance["z_max"] - bound
-    xMin = map_instance["x_min"] + bound
-    yMin = map_instance["y_min"] + bound
-    zMin = map_instance["z_min"] + bound
-
-    # Used
     ocp.model.con_h_expr = vertcat(goal_constraints_pointA, constraints_point_B)
-    ocp.constraints.lh = np.array([
-        xMin, yMin, zMin, 
-        xMin, yMin, zMin
-    ])
-    ocp.constraints.uh = np.array([
-        xMax, yMax, zMax, 
-        xMax, yMax, zMax
-    ])
+    ocp.constraints.lh = lh
+    ocp.constraints.uh = uh
     
 
     # Set constraints on the states
@@ -236,26 +251,37 @@ def create_ocp(model, x0, x_last, N, map_instance):
     # Return ocp
     return ocp
 
-def optimization_acados_singleTree(waypoints, map_instance):
-    # Define class and model
-    dt = glbv.RESOLUTION_DT
+def get_solver(waypoints, map_instance):
+    """
+    The (ocp, ocp_solver) of this process for the horizon len(waypoints), loaded from the solver cache (or generated and built into it)
+    at the first call only. The initial state and the map constraints are set at every call (set_map_constraints), they are not part of the cache key
+    """
+
     N = len(waypoints)
-    sam = SAM_casadi(dt)
-    nmpc = NMPC(sam, dt, N, True)
-    model = nmpc.export_dynamics_model(sam)
-
-    # Create ocp
-    ocp = create_ocp(model, waypoints[0], waypoints[-1], len(waypoints), map_instance)
-
-    # Solver setup
-    # Set directory for code generation
-    this_file_dir = os.path.dirname(os.path.abspath(__file__))
-    package_root = os.path.abspath(os.path.join(this_file_dir, '..'))
-    codegen_dir = os.path.join(package_root, 'optimization_single_velocity')
-    os.makedirs(codegen_dir, exist_ok=True)
-    ocp.code_export_directory = codegen_dir
-    print(f"ext package acados dir: {codegen_dir}")        
-    ocp_solver = AcadosOcpSolver(ocp, json_file='acados_ocp.json', generate=True, build=True)
+    if N not in solvers:
+        # Define class and model
+        dt = glbv.RESOLUTION_DT
+        sam = SAM_casadi(dt)
+        nmpc = NMPC(sam, dt, N, True)
+        model = nmpc.export_dynamics_model(sam)
+
+        # Create ocp
+        ocp = create_ocp(model, waypoints[0], waypoints[-1], len(waypoints), map_instance)
+
+        # Solver setup
+        solvers[N] = (ocp, cached_solver(AcadosOcpSolver, ocp, ignore=MAP_FIELDS))
+
+    return solvers[N]
+
+def optimization_acados_singleTree(waypoints, map_instance):
+    with solver_lock:
+        return optimize_singleTree(waypoints, map_instance)
+
+def optimize_singleTree(waypoints, map_instance):
+    # Warm solver, start from a zero initial guess with the current map
+    ocp, ocp_solver = get_solver(waypoints, map_instance)
+    ocp_solver.reset()
+    set_map_constraints(ocp_solver, ocp.dims.N, waypoints[0], map_instance)
 
     # Set initial guess from waypoints
     '''
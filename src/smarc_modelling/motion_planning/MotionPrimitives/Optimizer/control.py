@@ -4,6 +4,7 @@ from smarc_modelling.motion_planning.MotionPrimitives.ObstacleChecker import com
 import numpy as np
 import casadi as ca
 import os
+from smarc_modelling.lib.acados_cache import cached_solver
 from casadi import vertcat, horzcat, sqrt
 
 
@@ -112,11 +113,11 @@ class NMPC:
         self.ocp.solver_options.globalization = 'MERIT_BACKTRACKING'
         self.ocp.solver_options.regularize_method = 'NO_REGULARIZE'
 
-        solver_json = 'acados_ocp_' + self.model.name + '.json'
-        acados_ocp_solver = AcadosOcpSolver(self.ocp, json_file = solver_json)
+        # Built once per OCP content, the initial state is set at every step (see lib/acados_cache.py)
+        acados_ocp_solver = cached_solver(AcadosOcpSolver, self.ocp, ignore=("lbx_0", "ubx_0"))
 
         # create an integrator with the same settings as used in the OCP solver.
-        acados_integrator = AcadosSimSolver(self.ocp, json_file = solver_json)
+        acados_integrator = cached_solver(AcadosSimSolver, self.ocp, ignore=("lbx_0", "ubx_0"))
 
         return acados_ocp_solver, acados_integrator
     
@@ -417,25 +418,12 @@ class NMPC_trajectory:
         self.ocp.solver_options.globalization = 'MERIT_BACKTRACKING'
         self.ocp.solver_options.regularize_method = 'NO_REGULARIZE'
 
-        solver_json = 'acados_ocp_' + self.model.name + '.json'
-
-        # Set directory for code generation
-        this_file_dir = os.path.dirname(os.path.abspath(__file__))
-        #root_files_dir = '/home/parallels/Desktop/smarc_modelling-master/src/smarc_modelling/motion_planning/MotionPrimitives'
-        #package_root = os.path.abspath(os.path.join(this_file_dir, '..'))
-        package_root = os.path.abspath(this_file_dir)
-        codegen_dir = os.path.join(package_root, 'optimization_double_mpc')
-        ocp_dir = os.path.join(codegen_dir, 'acados_ocp_')
-        os.makedirs(codegen_dir, exist_ok=True)
-        self.ocp.code_export_directory = codegen_dir
-        print(f"ext package acados dir: {codegen_dir}") 
-
-        #acados_ocp_solver = AcadosOcpSolver(self.ocp, json_file = solver_json, generate=False, build=False)
-        acados_ocp_solver = AcadosOcpSolver(self.ocp, json_file = ocp_dir + self.model.name + '.json', generate=False, build=False)
+        # Built once per OCP content (model, weights, map bounds and options), the initial state
+        # is set at every step (see lib/acados_cache.py)
+        acados_ocp_solver = cached_solver(AcadosOcpSolver, self.ocp, ignore=("lbx_0", "ubx_0"))
 
         # create an integrator with the same settings as used in the OCP solver.
-        #acados_integrator = AcadosSimSolver(self.ocp, json_file = solver_json)
-        acados_integrator = AcadosSimSolver(self.ocp, json_file = ocp_dir + self.model.name + '.json')
+        acados_integrator = cached_solver(AcadosSimSolver, self.ocp, ignore=("lbx_0", "ubx_0"))
 
 
         return acados_ocp_solver, acados_integrator
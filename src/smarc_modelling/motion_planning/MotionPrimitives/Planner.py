@@ -0,0 +1,224 @@
+import time
+import copy
+import threading
+import smarc_modelling.motion_planning.MotionPrimitives.MapGeneration as MapGen
+from smarc_modelling.motion_planning.MotionPrimitives.MotionPrimitives import SAM_PRIMITIVES
+from smarc_modelling.motion_planning.MotionPrimitives.PrimitiveWorkers import PrimitiveWorkerPool
+from smarc_modelling.motion_planning.MotionPrimitives.ObstacleChecker import get_occupancy_map
+from smarc_modelling.motion_planning.MotionPrimitives.GenerationTree import a_star_search_loop, double_a_star_search_loop, primitive_input_pairs
+from smarc_modelling.motion_planning.MotionPrimitives.AnytimeSearch import anytime_a_star_loop, DEFAULT_INFLATIONS, ANYTIME_TYPEF
+from smarc_modelling.motion_planning.MotionPrimitives.MultiGoalSearch import multi_goal_a_star_loop, goal_map_instance
+from smarc_modelling.motion_planning.MotionPrimitives.trm_colors import *
+
+class Planner():
+    """
+    Long-lived motion planner, for repeated planning requests in the same map.
+
+    The setup is done once and kept warm between the requests (plan):
+        -) the SAM_PRIMITIVES simulator (and its compiled dynamics, with backend="casadi" and compile=True)
+        -) the worker pool of the primitive expansion, a new map is passed to the running workers
+        -) the OccupancyMap of the obstacles, changed by map deltas (update_map) instead of rebuilt
+        -) the HeuristicField of the last goals (they depend on the goal and the obstacles only)
+        -) the acados solvers of the optimizations, built once per process (see OptimizationAcados_*)
+
+    The planner is thread-safe. Each search has its own SearchContext, so plan can be called from several threads.
+    With usePool the searches share the worker pool and run one at a time; without it they run concurrently,
+    each thread with its own simulator. update_map does not change the map of the running searches.
+
+    Parameters:
+        map_boundaries: (x_max, y_max, z_max, x_min, y_min, z_min)
+        map_resolution: TileSize of the map (m)
+        obstacles: obstacle cells (row=y, column=x, z), see the obstacleDict of the map
+        typeFunction, dec: cost function and tuning parameter of the search, see a_star_search (the anytime search uses ANYTIME_TYPEF)
+        library, lattice: optional PrimitiveLibrary and StateLattice, see a_star_search
+        usePool: use a PrimitiveWorkerPool, started at the first request
+        n_workers: number of processes of the pool, None for all cores
+        backend, compile, integrator: options of SAM_PRIMITIVES
+        inflations: inflation factors of the anytime search (plan with a budget)
+        max_heuristic_fields: number of goals whose HeuristicField is kept
+    """
+
+    def __init__(self, map_boundaries, map_resolution, obstacles=(), typeFunction=3, dec=0.1, library=None, lattice=None,
+                 usePool=True, n_workers=None, backend="numpy", compile=False, integrator="euler",
+                 inflations=DEFAULT_INFLATIONS, max_heuristic_fields=8):
+        self.map_boundaries = tuple(map_boundaries)
+        self.map_resolution = map_resolution
+        self.obstacles = {tuple(int(i) for i in cell) for cell in obstacles}
+        self.typeFunction = typeFunction
+        self.dec = dec
+        self.library = library
+        self.lattice = lattice
+        self.usePool = usePool
+        self.n_workers = n_workers
+        self.inflations = inflations
+        self.max_heuristic_fields = max_heuristic_fields
+
+        # Warm state
+        self.sim_options = (backend, compile, integrator)
+        self.local = threading.local()      # simulator of each thread
+        self.lock = threading.RLock()       # maps and caches
+        self.pool_lock = threading.Lock()   # one search at a time in the worker pool
+        self.pool = None
+        self.occupancy = None
+        self.heuristic_fields = {}      # goal (x, y, z): HeuristicField
+
+    def simulator(self):
+        """
+        The SAM_PRIMITIVES of the current thread, created at its first request
+        """
+
+        sim = getattr(self.local, "sim", None)
+        if sim is None:
+            sim = self.local.sim = SAM_PRIMITIVES(*self.sim_options)
+
+        return sim
+
+    def map_instance(self, start, goal):
+        """
+        Map of a request: a new start and goal in the stored boundaries and obstacles, with the warm occupancy and heuristic fields
+        """
+
+        with self.lock:
+            return self.build_map_instance(start, goal)
+
+    def build_map_instance(self, start, goal):
+        map_instance = MapGen.generateMapInstance(start, goal, self.map_boundaries, self.map_resolution)
+        map_instance["obstacleDict"] = self.obstacles
+        if self.occupancy is None:
+            self.occupancy = get_occupancy_map(map_instance)
+        map_instance["occupancyMap"] = self.occupancy
+
+        # Tree 1 goes to the goal, tree 2 (double tree) to the start
+        fields = {}
+        for numberTree, target in ((1, map_instance["goal_pixel"]), (2, map_instance["start_pos"])):
+            field = self.heuristic_fields.get(tuple(target[:3]))
+            if field is not None:
+                fields[numberTree] = field
+        map_instance["heuristicField"] = fields
+
+        return map_instance
+
+    def keep_heuristic_fields(self, map_instance):
+        """
+        Store the heuristic fields built by a search, the oldest ones are dropped
+        """
+
+        with self.lock:
+            # Fields built before a map delta are not kept
+            if map_instance["occupancyMap"] is not self.occupancy:
+                return
+            for field in map_instance.get("heuristicField", {}).values():
+                goal = tuple(field.goal)
+                self.heuristic_fields.pop(goal, None)
+                self.heuristic_fields[goal] = field
+            while len(self.heuristic_fields) > self.max_heuristic_fields:
+                del self.heuristic_fields[next(iter(self.heuristic_fields))]
+
+    def update_map(self, add=(), remove=()):
+        """
+        Map delta: add and remove obstacle cells (row=y, column=x, z). The occupancy map is updated (a copy, the
+        running searches keep theirs), the heuristic fields are dropped. It applies from the next request
+        """
+
+        add = {tuple(int(i) for i in cell) for cell in add}
+        remove = {tuple(int(i) for i in cell) for cell in remove}
+        with self.lock:
+            self.obstacles = (self.obstacles - remove) | add
+            if self.occupancy is not None:
+                occupancy = copy.deepcopy(self.occupancy)
+                occupancy.update(add, remove)
+                self.occupancy = occupancy
+            self.heuristic_fields.clear()
+
+    def worker_pool(self, map_instance):
+        """
+        The PrimitiveWorkerPool (started at the first request) with the map of the request, None without pool
+        """
+
+        if not self.usePool:
+            return None
+        if self.pool is None:
+            self.pool = PrimitiveWorkerPool(self.simulator(), map_instance, primitive_input_pairs(), self.n_workers)
+        else:
+            self.pool.set_map(map_instance)
+
+        return self.pool
+
+    def plan(self, start, goal, budget=None, callback=None, stats=None):
+        """
+        Plan from the start state to the goal state.
+
+        budget: time budget (seconds), use the anytime search and return the best path found within it.
+            Without budget, the single tree search is used for the maps of complexity 0 and the double tree search otherwise
+        callback: with budget, called with (trajectory, totalCost, inflation) for every improved path
+        stats: optional dict, see a_star_search
+
+        This function returns (trajectory, successfulSearch, failingNotes), like a_star_search
+        """
+
+        map_instance = self.map_instance(start, goal)
+        if not self.usePool:
+            result = self.search(map_instance, None, budget, callback, stats)
+        else:
+            with self.pool_lock:
+                result = self.search(map_instance, self.worker_pool(map_instance), budget, callback, stats)
+        self.keep_heuristic_fields(map_instance)
+
+        return result
+
+    def plan_goals(self, start, goals, stats=None):
+        """
+        Plan from the start state to several candidate goal states in one search (see multi_goal_a_star_search).
+
+        This function returns a list with (trajectory, successfulSearch, failingNotes) for each goal
+        """
+
+        map_instance = self.map_instance(start, goals[0])
+        goal_maps = [map_instance] + [goal_map_instance(map_instance, goal) for goal in goals[1:]]
+        if not self.usePool:
+            results = multi_goal_a_star_loop(goal_maps, self.typeFunction, self.dec, self.simulator(), None, self.library, self.lattice, stats)
+        else:
+            with self.pool_lock:
+                pool = self.worker_pool(map_instance)
+                results = multi_goal_a_star_loop(goal_maps, self.typeFunction, self.dec, self.simulator(), pool, self.library, self.lattice, stats)
+        for goal_map in goal_maps:
+            self.keep_heuristic_fields(goal_map)
+
+        return results
+
+    def search(self, map_instance, pool, budget, callback, stats):
+        """
+        Run the search of plan in the current thread
+        """
+
+        sim = self.simulator()
+        if budget is not None:
+            print(f"{bcolors.WARNING}anytime search ({budget:.1f} seconds){bcolors.ENDC}")
+            deadline = time.time() + budget
+            result = None
+            for path, totalCost, inflation in anytime_a_star_loop(map_instance, ANYTIME_TYPEF, self.dec, sim, pool, self.library, self.lattice, deadline, self.inflations, stats):
+                result = (path, 1, "success")
+                if callback is not None:
+                    callback(path, totalCost, inflation)
+            if result is None:
+                result = ([], 0, "maxTime" if time.time() >= deadline else "maxIterations")
+        elif MapGen.evaluateComplexityMap(map_instance) == 0:
+            print(f"{bcolors.WARNING}single tree search{bcolors.ENDC}")
+            result = a_star_search_loop(None, None, map_instance, False, self.typeFunction, self.dec, sim, pool, self.library, self.lattice, stats)
+        else:
+            print(f"{bcolors.WARNING}double tree search{bcolors.ENDC}")
+            result = double_a_star_search_loop(None, None, map_instance, False, self.typeFunction, self.dec, sim, pool, self.library, self.lattice, stats)
+
+        return result
+
+    def close(self):
+        with self.pool_lock:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
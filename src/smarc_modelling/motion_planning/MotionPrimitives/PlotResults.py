@@ -9,8 +9,7 @@ from smarc_modelling.vehicles.SAM import SAM
 import matplotlib
 import matplotlib.pyplot as plt
 import csv
-from scipy.spatial.transform import Rotation as R
-matplotlib.use('TkAgg')  # or 'Qt5Agg', depending on what you have 
+from smarc_modelling.lib.quaternion import quaternion_to_dcm
 
 def plot_map(map_data, typePlot):
     """
@@ -143,8 +142,7 @@ def draw_torpedo(ax, vertex, colorr, length=1.5, radius=0.095, resolution=20):
     z_cap_rear = r_disk * np.sin(theta_disk)
 
     # Convert quaternion to rotation matrix
-    r = R.from_quat([q1, q2, q3, q0]) 
-    rotation_matrix = r.as_matrix()
+    rotation_matrix = quaternion_to_dcm(vertex[3:7])
     
     # Apply rotation
     def transform_points(x, y, z):
@@ -198,9 +196,7 @@ def draw_torpedo(ax, vertex, colorr, length=1.5, radius=0.095, resolution=20):
     rr, ww, vv = vertex[10:13]
     omega_body = np.array([rr, ww, vv])              # Angular velocity in body frame
     r_fwd_body = np.array([0.655, 0, 0])           # Position of forward point relative to CG in body frame
-    # Ensure quaternion is in (x, y, z, w) format for scipy
-    rotation = R.from_quat([q1, q2, q3, q0])
-    R_b2i = rotation.as_matrix()  # Body to inertial rotation matrix
+    R_b2i = quaternion_to_dcm(vertex[3:7])  # Body to inertial rotation matrix
     # Compute cross product in body frame
     v_relative_body = np.cross(omega_body, r_fwd_body)
     # Rotate to inertial frame
@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import numpy as np
+from scipy.spatial import KDTree
+from smarc_modelling.lib.quaternion import quaternion_to_euler
+
+# Features of a state used for the lookup: body velocities, roll, pitch and actuator states
+FEATURES = ("u", "v", "w", "p", "q", "r", "roll", "pitch", "vbs", "lcg", "ds", "dr", "rpm1", "rpm2")
+
+# Value of the features that are not part of the grid
+DEFAULT_SEED = {"u": 0, "v": 0, "w": 0, "p": 0, "q": 0, "r": 0, "roll": 0, "pitch": 0,
+                "vbs": 50, "lcg": 50, "ds": 0, "dr": 0, "rpm1": 0, "rpm2": 0}
+
+# Distance in the lookup is measured in units of these scales (state units, angles in rad)
+DEFAULT_SCALES = {"u": 0.1, "v": 0.1, "w": 0.1, "p": 0.1, "q": 0.1, "r": 0.1, "roll": 0.1, "pitch": 0.1,
+                  "vbs": 10, "lcg": 10, "ds": 0.05, "dr": 0.05, "rpm1": 100, "rpm2": 100}
+
+# Maximum estimated position error (m) of a lookup, about the radius of SAM
+DEFAULT_MAX_ERROR = 0.1
+
+# Grid of the seed states, if rpm2 is not given it follows rpm1
+DEFAULT_GRID = {"u": [-0.5, 0, 0.5, 1.0, 1.5],
+                "pitch": [-0.35, 0, 0.35],
+                "rpm1": [-800, -400, 0, 400, 800]}
+
+def state_features(states):
+    """
+    Lookup features (N, len(FEATURES)) of an (N, >=19) array of states
+    """
+
+    states = np.atleast_2d(states)
+    phi, theta, _ = quaternion_to_euler(states[:, 3:7])
+
+    return np.column_stack([states[:, 7:13], phi, theta, states[:, 13:19]])
+
+def yaw_of_states(states):
+    """
+    Yaw angle (rad) of an (N, >=7) array of states
+    """
+
+    _, _, psi = quaternion_to_euler(states[:, 3:7])
+
+    return psi
+
+def seed_state(values):
+    """
+    State at the origin with zero yaw for a dict of feature values
+    """
+
+    phi, theta = values["roll"], values["pitch"]
+
+    # q = qy(theta) * qx(phi), scalar first
+    q = np.array([np.cos(theta/2)*np.cos(phi/2), np.cos(theta/2)*np.sin(phi/2),
+                  np.sin(theta/2)*np.cos(phi/2), -np.sin(theta/2)*np.sin(phi/2)])
+
+    x = np.zeros(19)
+    x[3:7] = q
+    x[7:13] = [values[name] for name in FEATURES[:6]]
+    x[13:19] = [values[name] for name in FEATURES[8:]]
+
+    return x
+
+def transform_primitives(data, position, psi):
+    """
+    Rigid transformation of (N, nx, n_sim) primitives that start at the origin with zero yaw:
+    rotation by psi about the vertical axis and translation to position (in place)
+    """
+
+    c, s = np.cos(psi), np.sin(psi)
+    x, y = data[:, 0, :].copy(), data[:, 1, :].copy()
+    data[:, 0, :] = position[0] + c*x - s*y
+    data[:, 1, :] = position[1] + s*x + c*y
+    data[:, 2, :] += position[2]
+
+    # q = qz(psi) * q
+    c, s = np.cos(psi/2), np.sin(psi/2)
+    q0, q1, q2, q3 = data[:, 3, :].copy(), data[:, 4, :].copy(), data[:, 5, :].copy(), data[:, 6, :].copy()
+    data[:, 3, :] = c*q0 - s*q3
+    data[:, 4, :] = c*q1 - s*q2
+    data[:, 5, :] = c*q2 + s*q1
+    data[:, 6, :] = c*q3 + s*q0
+
+    return data
+
+class PrimitiveLibrary():
+    """
+    Precomputed, frame-relative motion primitives.
+
+    The dynamics of SAM do not depend on the position and the yaw angle. The primitives of all the inputs are
+    therefore integrated offline from seed states at the origin with zero yaw, over a grid of body velocities,
+    roll/pitch and actuator states (build). At search time the nearest seed is looked up and its primitives are
+    rotated and translated to the current state instead of integrating them (primitives).
+
+    On disk the library is a directory with
+        states.npy          (n_seeds, n_inputs, nx, n_sim_max) float32, memory-mapped when loaded
+        features.npy        (n_seeds, len(FEATURES)) features of the seeds
+        input_pairs.npy     (n_inputs, 2*nInputs) inputs of the primitives, see get_neighbors
+        library.json        dt, integrator, scales and the error model
+
+    A library is only loaded for a simulator with the same dt and integrator.
+
+    Parameters:
+        path: directory of the library
+        sim: SAM_PRIMITIVES instance (for the primitive length, the checks and the refinement)
+        max_distance: maximum scaled feature distance to the nearest seed, farther states are not looked up
+        max_error: maximum estimated position error (m) of a lookup (error model of validate, saved by build).
+            None disables the bound, e.g. to validate a library
+        refine: re-integrate the primitives that pass the checks on the library primitives
+    """
+
+    def __init__(self, path, sim, max_distance=3.0, max_error=DEFAULT_MAX_ERROR, refine=False):
+        self.path = path
+        self.sim = sim
+        self.max_distance = max_distance
+        self.max_error = max_error
+        self.refine = refine
+
+        with open(os.path.join(path, "library.json")) as f:
+            self.meta = json.load(f)
+        if abs(self.meta["dt"] - sim.dt) > 1e-12:
+            raise ValueError(f"Library built for dt={self.meta['dt']}, the simulator uses dt={sim.dt}")
+        if self.meta.get("integrator") != sim.integrator_method:
+            raise ValueError(f"Library built with the {self.meta.get('integrator')} integrator, the simulator uses {sim.integrator_method}")
+        if max_error is not None and self.meta["error_per_distance"] is None:
+            raise ValueError("Library without error model, validate it or use max_error=None")
+
+        self.states = np.load(os.path.join(path, "states.npy"), mmap_mode="r")
+        self.features = np.load(os.path.join(path, "features.npy"))
+        self.input_pairs = np.load(os.path.join(path, "input_pairs.npy"))
+        self.scales = np.array([self.meta["scales"][name] for name in FEATURES])
+        self.kdtree = KDTree(self.features / self.scales)
+
+    @staticmethod
+    def build(path, sim, input_pairs, grid=None, scales=None, n_validate=20):
+        """
+        Integrate the primitives of input_pairs from all the seed states of the grid and save them in path.
+        The library is then validated (see validate) to save its error model.
+
+        grid: dict feature -> values (state units), the product of all values is used. Default: DEFAULT_GRID
+        scales: dict feature -> scale of the lookup distance. Default: DEFAULT_SCALES
+        n_validate: number of random states of the validation
+
+        It returns (max position error (m), error per distance) of the validation
+        """
+
+        grid = dict(DEFAULT_GRID if grid is None else grid)
+        scales = dict(DEFAULT_SCALES, **(scales or {}))
+        names = list(grid.keys())
+        values = np.array(np.meshgrid(*[grid[name] for name in names], indexing="ij")).reshape(len(names), -1).T
+
+        n_sim_max = int(sim.max_t_span/sim.dt)
+        input_pairs = np.asarray(input_pairs)
+        os.makedirs(path, exist_ok=True)
+        states = np.lib.format.open_memmap(os.path.join(path, "states.npy"), mode="w+", dtype=np.float32,
+                                           shape=(len(values), len(input_pairs), 19, n_sim_max))
+        seeds = np.empty((len(values), 19))
+        for ii, row in enumerate(values):
+            seed = dict(DEFAULT_SEED, **dict(zip(names, row)))
+            if "rpm2" not in grid:
+                seed["rpm2"] = seed["rpm1"]
+            seeds[ii] = seed_state(seed)
+            states[ii] = sim.rolloutPrimitives_batch(seeds[ii], input_pairs, n_sim_max)
+        states.flush()
+
+        np.save(os.path.join(path, "features.npy"), state_features(seeds))
+        np.save(os.path.join(path, "input_pairs.npy"), input_pairs)
+        with open(os.path.join(path, "library.json"), "w") as f:
+            json.dump({"dt": sim.dt, "n_sim_max": n_sim_max, "integrator": sim.integrator_method,
+                       "grid": {name: list(map(float, grid[name])) for name in names},
+                       "scales": scales, "error_per_distance": None}, f, indent=2)
+
+        return PrimitiveLibrary(path, sim, max_error=None).validate(n_validate)
+
+    def lookup(self, current_state, n_sim):
+        """
+        Primitives of the nearest seed, transformed to current_state and cut to n_sim samples.
+        It returns (data, distance), data is None if the seed is too far away
+        """
+
+        distance, index = self.kdtree.query(state_features(current_state)[0] / self.scales)
+        if distance > self.max_distance:
+            return None, distance
+        if self.max_error is not None and self.error_bound(distance) > self.max_error:
+            return None, distance
+
+        data = np.array(self.states[index, :, :, :n_sim], dtype=float)
+        transform_primitives(data, current_state[:3], yaw_of_states(np.atleast_2d(current_state))[0])
+        data[:, :, 0] = current_state
+
+        return data, distance
+
+    def primitives(self, current_state, map_instance, angle, numberTree):
+        """
+        Same output as SAM_PRIMITIVES.curvePrimitives_batch for the library inputs, or None if the current
+        state is not covered by the library
+        """
+
+        n_sim = self.sim.primitiveLength(angle)
+        data, _ = self.lookup(current_state, n_sim)
+        if data is None:
+            return None
+        costs, inObs, arrived = self.sim.checkPrimitives_batch(data, map_instance, numberTree)
+
+        # Re-integrate what passed the checks (the library only pre-filters)
+        if self.refine:
+            valid = np.flatnonzero(~inObs)
+            data[valid], costs[valid], inObs[valid], arrived[valid] = self.sim.curvePrimitives_batch(current_state, self.input_pairs[valid], map_instance, angle, numberTree)
+
+        return data, costs, inObs, arrived
+
+    def error_bound(self, distance):
+        """
+        Estimated maximum position error (m) of a lookup at the scaled feature distance (see validate)
+        """
+
+        if self.meta["error_per_distance"] is None:
+            return np.inf
+        return self.meta["error_per_distance"] * distance
+
+    def validate(self, n_samples=20, seed=0):
+        """
+        Compare looked up primitives against integrated ones for random states around the seeds.
+        The largest position error per unit of scaled distance is saved as the error model of the library.
+        Diverged primitives (NaN, rejected at search time) are compared up to the divergence, the number of
+        primitives that diverge in only one of the two is saved as n_diverged_mismatch.
+
+        It returns (max position error (m), error per distance)
+        """
+
+        rng = np.random.default_rng(seed)
+        n_sim = self.meta["n_sim_max"]
+        max_error = 0.0
+        error_per_distance = 0.0
+        n_diverged_mismatch = 0
+        for _ in range(n_samples):
+            # Random state: a random seed, perturbed by up to 1.5 scales per feature, at a random pose
+            values = dict(zip(FEATURES, self.features[rng.integers(len(self.features))] + rng.uniform(-1.5, 1.5, len(FEATURES)) * self.scales))
+            x = seed_state(values)
+            transform_primitives(x[None, :, None], rng.uniform(0, 10, 3), rng.uniform(-np.pi, np.pi))
+
+            distance, index = self.kdtree.query(state_features(x)[0] / self.scales)
+            data = np.array(self.states[index, :, :, :n_sim], dtype=float)
+            transform_primitives(data, x[:3], yaw_of_states(x[None])[0])
+            exact = self.sim.rolloutPrimitives_batch(x, self.input_pairs, n_sim)
+
+            errors = np.linalg.norm(data[:, :3, :] - exact[:, :3, :], axis=1)
+            error = np.max(errors, where=np.isfinite(errors), initial=0.0)
+            n_diverged_mismatch += int(np.sum(np.isfinite(data).all(axis=(1, 2)) != np.isfinite(exact).all(axis=(1, 2))))
+            max_error = max(max_error, error)
+            if distance > 0:
+                error_per_distance = max(error_per_distance, error / distance)
+
+        self.meta["error_per_distance"] = error_per_distance
+        self.meta["n_diverged_mismatch"] = n_diverged_mismatch
+        with open(os.path.join(self.path, "library.json"), "w") as f:
+            json.dump(self.meta, f, indent=2)
+
+        return max_error, error_per_distance
+
+
+if __name__ == "__main__":
+    '''
+    Build the default library for the inputs of get_neighbors and validate it:
+        python3 PrimitiveLibrary.py [directory]
+    '''
+    from smarc_modelling.motion_planning.MotionPrimitives.MotionPrimitives import SAM_PRIMITIVES
+    from smarc_modelling.motion_planning.MotionPrimitives.GenerationTree import primitive_input_pairs
+
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.expanduser("~"), ".cache", "smarc_modelling", "primitive_library")
+    simulator = SAM_PRIMITIVES()
+
+    print(">> Building and validating the primitive library in", path)
+    max_error, error_per_distance = PrimitiveLibrary.build(path, simulator, primitive_input_pairs())
+    library = PrimitiveLibrary(path, simulator)
+    print("[ OK ]   seeds:", len(library.features), " inputs:", len(library.input_pairs))
+    print(f"[ OK ]   max position error: {max_error:.3f} m, error per scaled distance: {error_per_distance:.3f} m")
+    print("[ OK ]   primitives diverged in only one of library and integration:", library.meta["n_diverged_mismatch"])
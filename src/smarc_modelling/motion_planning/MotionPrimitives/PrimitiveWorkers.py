@@ -0,0 +1,150 @@
+import pickle
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from smarc_modelling.motion_planning.MotionPrimitives.ObstacleChecker import calculate_angle_velocityGoal, get_occupancy_map
+
+# State of a worker process, set once by init_worker
+worker = {}
+
+def init_worker(sim, map_instance, input_pairs, shm_name, shape):
+    """
+    Keep the simulator, the map and the input set resident in the worker and attach to the shared output buffer
+    """
+
+    worker["sim"] = sim
+    worker["map_instance"] = map_instance
+    worker["map_version"] = 0
+    worker["input_pairs"] = input_pairs
+    worker["shm"] = shared_memory.SharedMemory(name=shm_name)
+    worker["buffer"] = np.ndarray(shape, dtype=float, buffer=worker["shm"].buf)
+
+def load_map(map_version, shm_name, size):
+    """
+    Replace the map of the worker by the pickled one in the shared memory block shm_name (see PrimitiveWorkerPool.set_map)
+    """
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    worker["map_instance"] = pickle.loads(bytes(shm.buf[:size]))
+    worker["map_version"] = map_version
+    shm.close()
+
+def expand_chunk(start, stop, current_state, numberTree, map_update=None):
+    """
+    Generate the primitives of input_pairs[start:stop] from current_state.
+    The states are written into the shared buffer, only (start, valid, costs, arrived, n_sim) is sent back.
+    map_update: (version, shm name, size) of the current map, it is loaded if the worker has an older one
+    """
+
+    if map_update is not None and map_update[0] != worker["map_version"]:
+        load_map(*map_update)
+
+    sim = worker["sim"]
+    map_instance = worker["map_instance"]
+    input_pairs = worker["input_pairs"]
+    buffer = worker["buffer"]
+
+    # Angle between goal and velocity (for dynamic primitives length), the same for all inputs
+    alpha = calculate_angle_velocityGoal(current_state, map_instance, numberTree)
+
+    # Roll out the whole chunk at once, directly into the shared buffer
+    data, costs, inObs, arrived = sim.curvePrimitives_batch(current_state, input_pairs[start:stop], map_instance, alpha, numberTree, out=buffer[start:stop])
+
+    return start, ~inObs, costs, arrived, data.shape[2]
+
+class PrimitiveWorkerPool():
+    """
+    Long-lived process pool for the primitive expansion in get_neighbors.
+
+    The workers are started once per search (or once per Planner) and keep the simulator, the map and the input set.
+    Each expansion only sends the current state, the generated primitives come back through shared memory.
+    A new map (set_map) is passed through shared memory as well, each worker loads it at its next expansion.
+
+    Parameters:
+        sim: SAM_PRIMITIVES instance
+        map_instance: the map
+        input_pairs: (N, 2*nInputs) array of (values, indices of u), see get_neighbors
+        n_workers: number of processes, None for all cores
+        chunks_per_worker: number of tasks per worker and expansion (load balancing)
+        nx: length of the state
+    """
+
+    def __init__(self, sim, map_instance, input_pairs, n_workers=None, chunks_per_worker=4, nx=19):
+        self.input_pairs = np.asarray(input_pairs)
+        self.n_workers = n_workers if n_workers is not None else multiprocessing.cpu_count()
+
+        # One (nx, n_sim_max) slot per input, the primitive length is limited by sim.max_t_span
+        nInputs = self.input_pairs.shape[0]
+        self.n_sim_max = int(sim.max_t_span/sim.dt)
+        self.shape = (nInputs, nx, self.n_sim_max)
+        self.shm = shared_memory.SharedMemory(create=True, size=int(np.prod(self.shape))*8)
+        self.buffer = np.ndarray(self.shape, dtype=float, buffer=self.shm.buf)
+
+        # Build the occupancy map once here, the workers receive it with the map
+        get_occupancy_map(map_instance)
+        self.map_shm = None
+        self.map_update = None
+
+        bounds = np.linspace(0, nInputs, min(nInputs, self.n_workers*chunks_per_worker) + 1).astype(int)
+        self.chunks = [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+        self.pool = multiprocessing.Pool(self.n_workers, initializer=init_worker,
+                                         initargs=(sim, map_instance, self.input_pairs, self.shm.name, self.shape))
+
+    def expand(self, current_state, numberTree):
+        """
+        Generate all the primitives from current_state.
+
+        Returns:
+            data: (nValid, nx, n_sim) states of the valid primitives (a copy, the buffer is reused)
+            costs: (nValid,) cost of each primitive
+            arrived: (nValid,) True if the primitive reached the goal area
+        """
+
+        tasks = [(start, stop, current_state, numberTree, self.map_update) for start, stop in self.chunks]
+        valid = np.zeros(self.shape[0], dtype=bool)
+        costs = np.zeros(self.shape[0])
+        arrived = np.zeros(self.shape[0], dtype=bool)
+        n_sim = 0
+        for start, chunk_valid, chunk_costs, chunk_arrived, chunk_n_sim in self.pool.starmap(expand_chunk, tasks):
+            stop = start + len(chunk_valid)
+            valid[start:stop] = chunk_valid
+            costs[start:stop] = chunk_costs
+            arrived[start:stop] = chunk_arrived
+            n_sim = max(n_sim, chunk_n_sim)
+
+        return self.buffer[valid, :, :n_sim].copy(), costs[valid], arrived[valid]
+
+    def set_map(self, map_instance):
+        """
+        Use map_instance (new start and goal, or changed obstacles) from the next expansion on, without restarting the workers
+        """
+
+        get_occupancy_map(map_instance)
+        data = pickle.dumps({key: value for key, value in map_instance.items() if key != "heuristicField"})
+
+        # The previous block is no longer read, the expansions are synchronous
+        version = 1 if self.map_update is None else self.map_update[0] + 1
+        self.release_map()
+        self.map_shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        self.map_shm.buf[:len(data)] = data
+        self.map_update = (version, self.map_shm.name, len(data))
+
+    def release_map(self):
+        if self.map_shm is not None:
+            self.map_shm.close()
+            self.map_shm.unlink()
+            self.map_shm = None
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self.shm.close()
+        self.shm.unlink()
+        self.release_map()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,21 @@
+class SearchContext():
+    """
+    Arrival state of one search, instead of module globals. get_neighbors records there that a valid primitive
+    of a tree reached its goal area, the search loops read it to stop the tree (and reconstruct the path).
+    Searches with their own context can run at the same time in one process (threads or async tasks).
+    """
+
+    def __init__(self):
+        self.arrived = {1: False, 2: False}     # a valid primitive of the tree reached its goal area
+
+    def goal_reached(self, numberTree):
+        """
+        Record that a primitive of the tree numberTree (1 or 2) reached its goal area
+        """
+
+        if not self.arrived[numberTree]:
+            print("DONE!")
+            self.arrived[numberTree] = True
+
+    def reset(self, numberTree):
+        self.arrived[numberTree] = False
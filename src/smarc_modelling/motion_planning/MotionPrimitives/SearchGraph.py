@@ -0,0 +1,112 @@
+import numpy as np
+from smarc_modelling.motion_planning.MotionPrimitives.SpatialIndex import grow
+
+# Arrays of SearchGraph with one row per node
+NODE_ARRAYS = ("states", "parents", "g", "f", "closed", "waypoint_start", "waypoint_stop")
+
+class SearchGraph():
+    """
+    Array-backed storage of a search tree.
+
+    The nodes are integer ids, the rows of preallocated growable arrays:
+        states          (n, nx) state of the node
+        parents         (n,) id of the parent node, -1 for the root
+        g, f            (n,) costs of the node
+        closed          (n,) True once the node was expanded
+    The waypoints of the primitive that reaches each node (see getResolution) are stored in one contiguous
+    buffer, the rows waypoint_start[id]:waypoint_stop[id] of waypoints.
+
+    There is at most one node per cell of the lattice (ids: lattice key -> id). A cheaper node in the
+    same cell replaces the previous one in place, it keeps the id.
+
+    Parameters:
+        lattice: StateLattice of the duplicate detection
+        nx: length of the state
+        capacity: initial number of nodes
+    """
+
+    def __init__(self, lattice, nx=19, capacity=1024):
+        self.lattice = lattice
+        self.size = 0
+        self.states = np.empty((capacity, nx))
+        self.parents = np.empty(capacity, dtype=int)
+        self.g = np.empty(capacity)
+        self.f = np.empty(capacity)
+        self.closed = np.zeros(capacity, dtype=bool)
+        self.waypoint_start = np.zeros(capacity, dtype=int)
+        self.waypoint_stop = np.zeros(capacity, dtype=int)
+        self.waypoints = np.empty((4*capacity, nx))
+        self.n_waypoints = 0
+        self.ids = {}
+
+    def node_id(self, state, key=None):
+        """
+        Id of the node in the lattice cell of state (or of key), None if there is none
+        """
+
+        return self.ids.get(self.lattice.key(state) if key is None else key)
+
+    def set_node(self, state, parent, g, f=0.0, waypoints=(), key=None):
+        """
+        Store a node in a new row, or in the row of the node of the same lattice cell. It returns its id
+        """
+
+        key = self.lattice.key(state) if key is None else key
+        node_id = self.ids.get(key)
+        if node_id is None:
+            node_id = self.size
+            self.size += 1
+            for name in NODE_ARRAYS:
+                setattr(self, name, grow(getattr(self, name), self.size))
+            self.closed[node_id] = False
+            self.ids[key] = node_id
+
+        self.states[node_id] = state
+        self.parents[node_id] = parent
+        self.g[node_id] = g
+        self.f[node_id] = f
+
+        # The waypoints go at the end of the buffer (those of a replaced node stay there unused)
+        n = len(waypoints)
+        self.waypoints = grow(self.waypoints, self.n_waypoints + n)
+        if n > 0:
+            self.waypoints[self.n_waypoints:self.n_waypoints+n] = waypoints
+        self.waypoint_start[node_id] = self.n_waypoints
+        self.n_waypoints += n
+        self.waypoint_stop[node_id] = self.n_waypoints
+
+        return node_id
+
+    def waypoint_list(self, node_id):
+        """
+        Waypoints of the primitive of a node, as a new list of states
+        """
+
+        return list(self.waypoints[self.waypoint_start[node_id]:self.waypoint_stop[node_id]].copy())
+
+    def path_ids(self, node_id):
+        """
+        Ids of the nodes from the root to node_id
+        """
+
+        path = []
+        while node_id != -1:
+            path.append(node_id)
+            node_id = self.parents[node_id]
+
+        return path[::-1]
+
+    def nbytes(self):
+        """
+        Memory used by the stored nodes and waypoints (bytes)
+        """
+
+        return sum(getattr(self, name)[:self.size].nbytes for name in NODE_ARRAYS) + self.waypoints[:self.n_waypoints].nbytes
+
+    def save(self, path):
+        """
+        Save the tree in a .npz file
+        """
+
+        arrays = {name: getattr(self, name)[:self.size] for name in NODE_ARRAYS}
+        np.savez_compressed(path, waypoints=self.waypoints[:self.n_waypoints], **arrays)
@@ -0,0 +1,199 @@
+import numpy as np
+from scipy.spatial import KDTree
+from smarc_modelling.lib.quaternion import relative_angle
+
+def grow(array, size):
+    """
+    Return array with room for at least size rows (doubling the capacity, the first rows are kept)
+    """
+
+    if size <= len(array):
+        return array
+    grown = np.empty((max(2*len(array), size),) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+
+    return grown
+
+class IncrementalKDTree():
+    """
+    KD-tree over a growing set of points (logarithmic method).
+
+    The points are stored in one growable array in insertion order, the id of a point is its row.
+    They are covered by static KDTrees over contiguous ranges of leaf_size * 2^k points, the last
+    (less than leaf_size) points are searched by brute force. Two ranges of the same size are merged
+    and rebuilt, so a point is rebuilt O(log n) times in total instead of once per query.
+
+    Parameters:
+        dim: dimension of the points
+        leaf_size: number of points of the smallest KDTree
+    """
+
+    def __init__(self, dim=3, leaf_size=256):
+        self.points = np.empty((1024, dim))
+        self.size = 0
+        self.indexed = 0
+        self.leaf_size = leaf_size
+        self.blocks = []            # (start, stop, KDTree)
+
+    def insert(self, points):
+        """
+        Add an (N, dim) array of points, it returns their ids
+        """
+
+        points = np.atleast_2d(points)
+        self.points = grow(self.points, self.size + len(points))
+        ids = np.arange(self.size, self.size + len(points))
+        self.points[ids] = points
+        self.size += len(points)
+
+        while self.size - self.indexed >= self.leaf_size:
+            start, stop = self.indexed, self.indexed + self.leaf_size
+            while self.blocks and self.blocks[-1][1] - self.blocks[-1][0] == stop - start:
+                start = self.blocks.pop()[0]
+            self.blocks.append((start, stop, KDTree(self.points[start:stop].copy())))
+            self.indexed = stop
+
+        return ids
+
+    def query_ball(self, points, radius, limit=None):
+        """
+        All the pairs within radius of each other between an (M, dim) array of points and the stored points
+        with id < limit (all if None). It returns (rows in points, ids) as two arrays
+        """
+
+        limit = self.size if limit is None else min(limit, self.size)
+        points = np.atleast_2d(points)
+        rows, ids = [np.zeros(0, dtype=int)], [np.zeros(0, dtype=int)]
+        if len(points) == 0 or limit == 0:
+            return rows[0], ids[0]
+
+        # KDTrees
+        for start, stop, kdtree in self.blocks:
+            if start >= limit:
+                break
+            found = kdtree.query_ball_point(points, radius, return_sorted=False)
+            lengths = np.array([len(f) for f in found])
+            if lengths.sum() == 0:
+                continue
+            block_rows = np.repeat(np.arange(len(points)), lengths)
+            block_ids = start + np.concatenate([f for f in found if len(f)]).astype(int)
+            keep = block_ids < limit
+            rows.append(block_rows[keep])
+            ids.append(block_ids[keep])
+
+        # Points not indexed yet
+        if self.indexed < limit:
+            tail = self.points[self.indexed:limit]
+            distance = np.linalg.norm(points[:, None, :] - tail[None, :, :], axis=2)
+            tail_rows, tail_ids = np.nonzero(distance <= radius)
+            rows.append(tail_rows)
+            ids.append(self.indexed + tail_ids)
+
+        return np.concatenate(rows), np.concatenate(ids)
+
+class TreeConnector():
+    """
+    Connection candidates between the two trees (SearchGraph) of the double A star.
+
+    The nodes of both trees are inserted as they are generated (add_nodes), their positions go into an
+    IncrementalKDTree per tree. A node replaced in place by a cheaper one is inserted again with its new
+    position, the candidates are always checked on the current states of the graphs.
+
+    A query returns the pairs of node ids (id1, id2) closer than a distance with a relative rotation below an angle.
+    The nodes can still be replaced in place after the query, their states are read from the graphs when connecting.
+    Every pair of nodes is returned once. With newOnly only the nodes added since the previous such query are paired.
+
+    Each query also adds to count the number of second tree nodes with a candidate (the new and the previous ones
+    for newOnly), as the candidates were counted before the index: again at every query, one per second tree node.
+
+    Parameters:
+        graph, graph_secondTree: SearchGraph of the two trees
+    """
+
+    def __init__(self, graph, graph_secondTree):
+        self.graphs = (graph, graph_secondTree)
+        self.index = (IncrementalKDTree(), IncrementalKDTree())
+        self.node_ids = [np.empty(1024, dtype=int), np.empty(1024, dtype=int)]    # node id of each indexed point
+        self.checked = [0, 0]           # points already paired by the newOnly queries
+        self.found = set()              # (id1, id2) already returned
+        self.matched = set()            # second tree nodes with a candidate of the newOnly queries
+        self.count = 0                  # candidates counted as the queries without index (see find_tree_intersection)
+        self.ball_cache = {}            # distance: (sizes, rows1, rows2) of the last full query
+
+    def add_nodes(self, numberTree, ids):
+        """
+        Insert the nodes (ids in the SearchGraph) of the tree numberTree (1 or 2)
+        """
+
+        if len(ids) == 0:
+            return
+        t = numberTree - 1
+        ids = np.asarray(ids, dtype=int)
+        rows = self.index[t].insert(self.graphs[t].states[ids, :3])
+        self.node_ids[t] = grow(self.node_ids[t], self.index[t].size)
+        self.node_ids[t][rows] = ids
+
+    def size(self, numberTree):
+        return self.index[numberTree - 1].size
+
+    def pairs_new(self, distance):
+        """
+        Pairs of points (row1, row2) within distance that involve at least one point added since the previous call
+        """
+
+        c1, c2 = self.checked
+        n1, n2 = self.size(1), self.size(2)
+        rows, row2 = self.index[1].query_ball(self.index[0].points[c1:n1], distance)
+        row1_a, row2_a = c1 + rows, row2
+        rows, row1 = self.index[0].query_ball(self.index[1].points[c2:n2], distance, limit=c1)
+        row1_b, row2_b = row1, c2 + rows
+        self.checked = [n1, n2]
+
+        return np.concatenate([row1_a, row1_b]), np.concatenate([row2_a, row2_b])
+
+    def pairs_all(self, distance):
+        """
+        All the pairs of points (row1, row2) within distance (cached for the current trees)
+        """
+
+        sizes = (self.size(1), self.size(2))
+        cached = self.ball_cache.get(distance)
+        if cached is None or cached[0] != sizes:
+            row2, row1 = self.index[0].query_ball(self.index[1].points[:sizes[1]], distance)
+            cached = (sizes, row1, row2)
+            self.ball_cache[distance] = cached
+
+        return cached[1], cached[2]
+
+    def connections(self, distance, angle, newOnly=True):
+        """
+        New connection candidates [(id1, id2), ...] closer than distance and with a relative angle (deg) below angle
+        """
+
+        row1, row2 = self.pairs_new(distance) if newOnly else self.pairs_all(distance)
+        if len(row1) == 0:
+            self.count += len(self.matched) if newOnly else 0
+            return []
+
+        # Check the current states of the nodes
+        id1 = self.node_ids[0][row1]
+        id2 = self.node_ids[1][row2]
+        states1 = self.graphs[0].states[id1]
+        states2 = self.graphs[1].states[id2]
+        keep = (np.linalg.norm(states1[:, :3] - states2[:, :3], axis=1) <= distance) & \
+               (relative_angle(states1[:, 3:7], states2[:, 3:7], degrees=True) < angle)
+        if newOnly:
+            self.matched.update(id2[keep].tolist())
+            self.count += len(self.matched)
+        else:
+            self.count += len(np.unique(id2[keep]))
+
+        list_pairs = []
+        for ii in np.flatnonzero(keep):
+            pair = (int(id1[ii]), int(id2[ii]))
+            if pair in self.found:
+                continue
+            self.found.add(pair)
+            list_pairs.append(pair)
+
+        return list_pairs
@@ -34,12 +34,8 @@ def runStatisticalAnalysis(numberTrials, chosenComplexity):
     for trial in range(numberTrials):
         print(f"{bcolors.UNDERLINE}MAP NUMBER: {trial:.0f} {bcolors.ENDC}")
         # Generate the map
-        complexity = -1
-        while complexity != chosenComplexity:
-            map_instance = MapGen.generationFirstMap()
-
-            # Analyse its complexity
-            complexity = MapGen.evaluateComplexityMap(map_instance)
+        map_instance = MapGen.generateMapOfComplexity(chosenComplexity)
+        complexity = chosenComplexity
         print("complexity:",complexity) # 0-single, 1-xy, 2-z, 3-xyz
 
         # Search the trajectory
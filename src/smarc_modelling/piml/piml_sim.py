@@ -3,6 +3,8 @@
 
 import numpy as np
 from smarc_modelling.vehicles.SAM_PIML import SAM_PIML
+from smarc_modelling.lib.integrators import rk4, euler
+from smarc_modelling.lib.trajectory_writer import load_trajectory
 from smarc_modelling.piml.utils.utility_functions import load_data_from_bag, eta_quat_to_rad, angle_diff
 import matplotlib as mpl
 import matplotlib.pyplot as plt
@@ -13,7 +15,8 @@ import time
 class SIM:
     """Simulator for SAM / other UAVs"""
 
-    def __init__(self, piml_type: str, states: list, time_vec: list, control_vec: list, state_update: bool):
+    def __init__(self, piml_type: str, states: list, time_vec: list, control_vec: list, state_update: bool,
+                 backend: str = "numpy", writer=None):
 
         # Initial pose
         self.x0 = torch.Tensor.tolist(torch.cat([states[0][0], states[1][0], states[2][0]]))
@@ -21,14 +24,27 @@ class SIM:
         # Create vehicle instance
         self.vehicle = SAM_PIML(dt=0.01, piml_type=piml_type)
 
+        # SAM_PIML has its own white-box model, the CasADi backend is a port
+        # of SAM.dynamics() and would simulate a different vehicle
+        if backend == "casadi":
+            raise ValueError("The CasADi backend is not available for SAM_PIML, use backend=\"numpy\"")
+        elif backend != "numpy":
+            raise ValueError(f"Unknown backend: {backend}")
+
         # Controls and sim variables
         self.controls = control_vec
+        self.time_vec = time_vec
         self.n_sim = np.shape(time_vec)[0]
         self.var_dt = np.diff(time_vec)
 
+        # Optional TrajectoryWriter with 1 + 19 + 6 columns for [t, x, u]. When
+        # streaming only the current and the next state are kept in memory.
+        self.writer = writer
+        self.n_columns = self.n_sim if writer is None else 2
+
         # Decide if we are going to update the state or not
         self.state_update = state_update
-        self.data = np.empty((len(self.x0), self.n_sim))
+        self.data = np.empty((len(self.x0), self.n_columns))
         self.vels = np.empty((6, self.n_sim))
         self.states = states
 
@@ -45,10 +61,11 @@ class SIM:
         times =[]
         
         for i in range(self.n_sim-1):
+            k, k_next = i % self.n_columns, (i+1) % self.n_columns
             
             # For resetting the state every n step, currently unused
             if i % 3 == 0 and self.state_update:
-                self.data[:, i] = torch.Tensor.tolist(torch.cat([self.states[0][i], self.states[1][i], self.states[2][i]]))
+                self.data[:, k] = torch.Tensor.tolist(torch.cat([self.states[0][i], self.states[1][i], self.states[2][i]]))
                 times.append(time_since_update)
                 time_since_update = 0
 
@@ -62,11 +79,14 @@ class SIM:
                 u = self.controls[i]
                 self.vels[:, i] = self.vehicle.dynamics(x, u)[7:13]
 
+            if self.writer is not None:
+                self.write_row(i, self.data[:, k])
+
             # Do sim step using ef
             try:
-                self.data[:, i+1] = self.rk4(self.data[:, i], self.controls[i], dt, self.vehicle.dynamics)
+                self.data[:, k_next] = self.rk4(self.data[:, k], self.controls[i], dt, self.dynamics)
             except:
-                self.data[:, i+1] = self.data[:, i]
+                self.data[:, k_next] = self.data[:, k]
                 if once:
                     once = False
                     end_val = i - 5
@@ -74,21 +94,28 @@ class SIM:
         if self.state_update:
             print(f" Average times between resets: {np.mean(times)}")
 
+        if self.writer is not None:
+            self.write_row(self.n_sim-1, self.data[:, (self.n_sim-1) % self.n_columns])
+            self.writer.close()
+            trajectory = load_trajectory(self.writer.path)
+            return trajectory[:, 1:1+len(self.x0)].T, end_val, self.vels
+
         return self.data, end_val, self.vels
+
+    def write_row(self, i, x):
+        u = np.asarray(self.controls[min(i, len(self.controls)-1)], dtype=float)
+        self.writer.append(np.concatenate([[float(self.time_vec[i])], x, u]))
     
+    def dynamics(self, x, u):
+        return self.vehicle.dynamics(x, u)
+
     def rk4(self, x, u, dt, fun):
-        # https://github.com/smarc-project/smarc_modelling/blob/master/src/smarc_modelling/sam_sim.py#L38C1-L46C15 
-        # Runge Kutta 4
-        k1 = fun(x, u)
-        k2 = fun(x+dt/2*k1, u)
-        k3 = fun(x+dt/2*k2, u)
-        k4 = fun(x+dt*k3, u)
-        dxdt = x + dt/6 * (k1 + 2*k2 + 2*k3 + k4)
-        return dxdt
+        # Runge Kutta 4, see lib/integrators.py
+        return rk4(x, u, dt, fun)
 
     def ef(self, x, u, dt, fun):
-        dxdt = x + fun(x, u) * dt
-        return dxdt
+        # Forward Euler, see lib/integrators.py
+        return euler(x, u, dt, fun)
     
 if __name__ == "__main__":
     print(f" Starting simulator...")
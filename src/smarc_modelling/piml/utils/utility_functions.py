@@ -160,7 +160,7 @@ def load_data_from_bag(data_file: str="", return_type: str=""):
         sam.dynamics(state_vector[t], u_cmd[t]) # Calling the dynamics to update all matrices directly
 
         # Calculated acceleration where we have no damping
-        v_dot_nod = sam.Minv @ (sam.tau - sam.C @ nu[t] - sam.g_vec)
+        v_dot_nod = sam.solve_M(sam.tau - sam.C @ nu[t] - sam.g_vec)
 
         # Calculate the damping force based on difference in model prediction and real data
         Dv_comp[t] = sam.M @ (v_dot_nod.T - acc[t].T)
@@ -3,6 +3,7 @@ from smarc_modelling.vehicles import *
 from smarc_modelling.lib import *
 from smarc_modelling.vehicles.SAM import SAM
 from smarc_modelling.vehicles.SAM_casadi import SAM_casadi
+from smarc_modelling.lib.integrators import rk4
 import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
@@ -38,18 +39,12 @@ class Sol():
         self.t = t
         self.y = data
 
-def rk4(x, u, dt, fun):
-    k1 = fun(x, u)
-    k2 = fun(x+dt/2*k1, u)
-    k3 = fun(x+dt/2*k2, u)
-    k4 = fun(x+dt*k3, u)
-
-    x_t = x + dt/6 * (k1 + 2*k2 + 2*k3 + k4)
-
-    np.set_printoptions(precision=3)
-    print(f"vbs: {x_t.full().flatten()[13]}; vbs_dot: {k1.full().flatten()[13]}")
-
-    return x_t.full().flatten()
+def dynamics_np(x, u):
+    """
+    Evaluates the CasADi function and returns a flat numpy array for the
+    shared integrators.
+    """
+    return dynamics(x, u).full().flatten()
 
 def run_simulation(t_span, x0, dt, sam):
     """
@@ -76,7 +71,7 @@ def run_simulation(t_span, x0, dt, sam):
     #   and use these to compute eta_dot. This needs to be determined based on the 
     #   performance we see.
     for i in range(n_sim-1):
-        data[:,i+1] = rk4(data[:,i], u, dt, dynamics)
+        data[:,i+1] = rk4(data[:,i], u, dt, dynamics_np)
     sol = Sol(t_eval,data)
     print(f" Simulation complete!")
 
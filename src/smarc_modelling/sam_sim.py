@@ -2,6 +2,8 @@ import numpy as np
 from smarc_modelling.vehicles import *
 from smarc_modelling.lib import *
 from smarc_modelling.vehicles.SAM import SAM
+from smarc_modelling.lib.integrators import rk4
+from smarc_modelling.lib.trajectory_writer import load_trajectory
 import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
@@ -35,20 +37,14 @@ class Sol():
         self.t = t
         self.y = data
 
-        
-def rk4(x, u, dt, fun):
-    k1 = fun(x, u)
-    k2 = fun(x+dt/2*k1, u)
-    k3 = fun(x+dt/2*k2, u)
-    k4 = fun(x+dt*k3, u)
-
-    x_t = x + dt/6 * (k1 + 2*k2 + 2*k3 + k4)
 
-    return x_t
-
-def run_simulation(t_span, x0, dt, sam):
+def run_simulation(t_span, x0, dt, sam, writer=None):
     """
-    Run SAM simulation using solve_ivp.
+    Run SAM simulation using RK4.
+
+    writer: Optional TrajectoryWriter with 1 + 19 + 6 columns. The rows
+        [t, x, u] are streamed to it and only the current state is kept in
+        memory. The returned solution is read back memory-mapped.
     """
 
     u = np.zeros(6)
@@ -62,8 +58,12 @@ def run_simulation(t_span, x0, dt, sam):
     # Run integration
     print(f" Start simulation")
 
-    data = np.empty((len(x0), n_sim))
+    # When streaming, only the current and the next state are kept
+    n_columns = n_sim if writer is None else 2
+    data = np.empty((len(x0), n_columns))
     data[:,0] = x0
+    if writer is not None:
+        writer.append(np.concatenate([[t_eval[0]], x0, u]))
 
     # Euler forward integration
     # NOTE: This integrates eta, nu, u_control in the same time step.
@@ -71,8 +71,16 @@ def run_simulation(t_span, x0, dt, sam):
     #   and use these to compute eta_dot. This needs to be determined based on the 
     #   performance we see.
     for i in range(n_sim-1):
-        data[:,i+1] = rk4(data[:,i], u, dt, sam.dynamics)
-    sol = Sol(t_eval,data)
+        data[:,(i+1) % n_columns] = rk4(data[:,i % n_columns], u, dt, sam.dynamics)
+        if writer is not None:
+            writer.append(np.concatenate([[t_eval[i+1]], data[:,(i+1) % n_columns], u]))
+
+    if writer is None:
+        sol = Sol(t_eval,data)
+    else:
+        writer.close()
+        trajectory = load_trajectory(writer.path)
+        sol = Sol(trajectory[:,0], trajectory[:,1:1+len(x0)].T)
     print(f" Simulation complete!")
 
     return sol
@@ -33,6 +33,10 @@ Methods:
 
     [xdot] = dynamics(x, u_ref) returns for integration
 
+    [Xdot] = dynamics_batch(X, U_ref) vectorized dynamics for (N, 19) states and (N, 6) inputs
+
+    [xdot] = dynamics_rhs(x, u_ref, x_dot) stateless dynamics, optionally written into x_dot
+
     u_ref: control inputs as [x_vbs, x_lcg, delta_s, delta_r, rpm1, rpm2]
 
         - **vbs**: Variable buoyancy system control, which adjusts buoyancy to control depth.
@@ -57,6 +61,7 @@ Refactored: David Doerner
 
 import numpy as np
 import math
+from types import SimpleNamespace
 from scipy.linalg import block_diag
 from smarc_modelling.lib.gnc import *
 from smarc_modelling.piml.pinn import init_pinn_model, pinn_predict
@@ -165,6 +170,332 @@ class Propellers:
         self.rpm_dot_max = np.zeros(n_p) + 100  # Max acceleration (RPM/s)
 
 
+class MassPropertyTable:
+    """
+    Precomputed mass properties of SAM over the VBS and LCG actuator positions.
+
+    The mass, c.g., inertia tensor and mass matrices only depend on u[0] (VBS)
+    and u[1] (LCG). Instead of recomputing them for every evaluation of the
+    dynamics they are looked up here.
+
+    Parameters:
+        sam: SAM instance the table is built for.
+        method (str): "memoize" for exact values cached per (vbs, lcg) pair,
+            "interpolate" for a bilinear interpolation on a regular grid over
+            0-100 %. For single states only "memoize" is faster than the
+            analytic computation (sam_mass_table_benchmark). "interpolate"
+            pays off in dynamics_batch(), where the lookup is vectorized.
+        n_vbs, n_lcg (int): Grid points for "interpolate". The error of the
+            interpolation scales with the squared grid spacing.
+        decimals (int): Rounding of the cache key for "memoize". None means
+            only exact hits are reused.
+        max_entries (int): The memo is cleared when it grows beyond this.
+    """
+
+    def __init__(self, sam, method="memoize", n_vbs=101, n_lcg=101, decimals=None, max_entries=100000):
+        if method not in ("interpolate", "memoize"):
+            raise ValueError(f"Unknown mass table method: {method}")
+
+        self.sam = sam
+        self.method = method
+        self.decimals = decimals
+        self.max_entries = max_entries
+        self.memo = {}
+
+        if self.method == "interpolate":
+            self.vbs_grid = np.linspace(0, 100, n_vbs)
+            self.lcg_grid = np.linspace(0, 100, n_lcg)
+            vbs, lcg = np.meshgrid(self.vbs_grid, self.lcg_grid, indexing="ij")
+            U = np.zeros((vbs.size, 6))
+            U[:, 0] = vbs.ravel()
+            U[:, 1] = lcg.ravel()
+            # All properties of a grid cell are flattened into one row, s.t. a
+            # lookup is a single interpolation. self.split undoes this.
+            values = self.compute(U)
+            self.shapes = [value.shape[1:] for value in values]
+            self.table = np.concatenate([value.reshape(vbs.size, -1) for value in values], axis=1)
+            self.table = self.table.reshape(n_vbs, n_lcg, -1)
+
+    def compute(self, U):
+        """
+        Analytic mass properties for (N, 6) actuator states.
+
+        Returns:
+            m, p_OG_O, J_total, MRB, MA, M as stacked arrays
+        """
+        m, p_OG_O, J_total = self.sam.calculate_mass_properties_batch(U)
+        MRB, MA = self.sam.calculate_M_batch(m, J_total)
+        return m, p_OG_O, J_total, MRB, MA, MRB + MA
+
+    def lookup(self, u):
+        """
+        Mass properties for a single (bounded) actuator state u.
+
+        Returns:
+            m, p_OG_O, J_total, MRB, MA, M
+        """
+        if self.method == "memoize":
+            key = (u[0], u[1]) if self.decimals is None \
+                else (round(u[0], self.decimals), round(u[1], self.decimals))
+            values = self.memo.get(key)
+            if values is None:
+                if len(self.memo) >= self.max_entries:
+                    self.memo.clear()
+                U = np.zeros((1, 6))
+                U[0, 0:2] = key
+                values = tuple(value[0] for value in self.compute(U))
+                self.memo[key] = values
+            return values
+
+        # Bilinear interpolation on the regular grid
+        i, a = self.grid_index(u[0], self.vbs_grid)
+        j, b = self.grid_index(u[1], self.lcg_grid)
+        cell = self.table[i:i+2, j:j+2]
+        row = (1-a)*((1-b)*cell[0, 0] + b*cell[0, 1]) + a*((1-b)*cell[1, 0] + b*cell[1, 1])
+        return self.split(row)
+
+    def lookup_batch(self, U):
+        """
+        Mass properties for (N, 6) bounded actuator states.
+
+        Returns:
+            m, p_OG_O, J_total, M as stacked arrays
+        """
+        if self.method == "memoize":
+            values = [self.lookup(u) for u in U]
+            return tuple(np.array([v[k] for v in values]) for k in (0, 1, 2, 5))
+
+        i, a = self.grid_index(U[:, 0], self.vbs_grid)
+        j, b = self.grid_index(U[:, 1], self.lcg_grid)
+        a = a[:, None]
+        b = b[:, None]
+        rows = (1-a)*((1-b)*self.table[i, j] + b*self.table[i, j+1]) \
+             + a*((1-b)*self.table[i+1, j] + b*self.table[i+1, j+1])
+        values = self.split(rows)
+        return tuple(values[k] for k in (0, 1, 2, 5))
+
+    def split(self, rows):
+        """
+        Split flattened table rows back into m, p_OG_O, J_total, MRB, MA, M.
+        """
+        values = []
+        start = 0
+        for shape in self.shapes:
+            size = int(np.prod(shape))
+            value = rows[..., start:start+size]
+            values.append(value.reshape(rows.shape[:-1] + shape))
+            start += size
+        return tuple(values)
+
+    @staticmethod
+    def grid_index(x, grid):
+        """
+        Lower grid index and interpolation weight of x on a regular grid.
+        Works for scalars and arrays.
+        """
+        pos = (x - grid[0]) / (grid[1] - grid[0])
+        idx = np.clip(np.floor(pos).astype(int), 0, len(grid) - 2)
+        return idx, pos - idx
+
+
+def clip(x, lower, upper):
+    return min(max(x, lower), upper)
+
+
+# Math functions rhs_equations is evaluated with, for floats
+SCALAR_MATH = SimpleNamespace(sqrt=math.sqrt, sin=math.sin, cos=math.cos, tanh=math.tanh,
+                              atan2=math.atan2, fabs=abs, clip=clip)
+
+
+def rhs_equations(sam, x, u_ref, dt, ops):
+    """
+    Time derivative of the complete state [eta, nu, u] of the white-box model,
+    written with scalar operations only. Single source of SAM.dynamics_rhs and
+    the CasADi backend (SAM_casadi_backend), which evaluate it with floats and
+    with symbols respectively. Same model as SAM.dynamics() including the
+    actuator bounds.
+
+    Args:
+        sam: white-box SAM instance to take the parameters from
+        x: sequence of the 19 states [eta, nu, u]
+        u_ref: sequence of the 6 control inputs [x_vbs, x_lcg, delta_s, delta_r, rpm1, rpm2]
+        dt: time step of the actuator dynamics
+        ops: namespace with sqrt, sin, cos, tanh, atan2, fabs and clip, e.g. SCALAR_MATH
+
+    Returns:
+        x_dot: tuple of the 19 state derivatives
+    """
+    c = sam.rhs_constants
+    (px, py, pz, q0, q1, q2, q3, u, v, w, p, q, r,
+     x_vbs, x_lcg, delta_s, delta_r, rpm1, rpm2) = x
+    ur_vbs, ur_lcg, ur_s, ur_r, ur_rpm1, ur_rpm2 = u_ref
+
+    # Actuator bounds
+    x_vbs = ops.clip(x_vbs, 0, 100)
+    x_lcg = ops.clip(x_lcg, 0, 100)
+    ur_vbs = ops.clip(ur_vbs, 0, 100)
+    ur_lcg = ops.clip(ur_lcg, 0, 100)
+
+    # Normalized quaternion and the roll/pitch terms of the restoring forces
+    q_norm = ops.sqrt(q0*q0 + q1*q1 + q2*q2 + q3*q3)
+    q0, q1, q2, q3 = q0/q_norm, q1/q_norm, q2/q_norm, q3/q_norm
+    sth = ops.clip(2*(q0*q2 - q1*q3), -1, 1)
+    cth = ops.sqrt(1 - sth*sth)
+    phi = ops.atan2(2*(q0*q1 + q2*q3), 1 - 2*(q1*q1 + q2*q2))
+    sphi, cphi = ops.sin(phi), ops.cos(phi)
+
+    # Relative velocities due to current
+    V_c, beta_c = float(sam.V_c), float(sam.beta_c)
+    if V_c != 0:
+        psi = ops.atan2(2*(q0*q3 + q1*q2), 1 - 2*(q2*q2 + q3*q3))
+        u_r = u - V_c * ops.cos(beta_c - psi)
+        v_r = v - V_c * ops.sin(beta_c - psi)
+    else:
+        u_r, v_r = u, v
+
+    # Mass and cg
+    xv = (x_vbs/100) * sam.vbs.l_vbs_l
+    m_vbs = c["vbs_area"] * xv
+    m_ss, m_lcg = sam.ss.m_ss, sam.lcg.m_lcg
+    m = m_ss + m_vbs + m_lcg
+    lx = c["p_lcg0"][0] + (x_lcg/100) * sam.lcg.l_lcg_l
+    ly, lz = c["p_lcg0"][1], c["p_lcg0"][2]
+    p_ss, p_vbs = c["p_ss"], c["p_vbs"]
+    xg = (m_ss*p_ss[0] + m_vbs*p_vbs[0] + m_lcg*lx)/m
+    yg = (m_ss*p_ss[1] + m_vbs*p_vbs[1] + m_lcg*ly)/m
+    zg = (m_ss*p_ss[2] + m_vbs*p_vbs[2] + m_lcg*lz)/m
+
+    # Inertia tensor in CO, see SAM.update_inertias
+    Jc, Jv = c["J_const"], c["J_vbs"]
+    l2 = lx*lx + ly*ly + lz*lz
+    Jv_x = m_vbs * xv*xv/12
+    Jxx = (Jc[0] + m_vbs*Jv[0] + m_lcg*(l2 - lx*lx)) * sam.inertia_factor
+    Jyy = Jc[1] + m_vbs*Jv[1] + Jv_x + m_lcg*(l2 - ly*ly)
+    Jzz = Jc[2] + m_vbs*Jv[2] + Jv_x + m_lcg*(l2 - lz*lz)
+    Jxy = Jc[3] + m_vbs*Jv[3] - m_lcg*lx*ly
+    Jxz = Jc[4] + m_vbs*Jv[4] - m_lcg*lx*lz
+    Jyz = Jc[5] + m_vbs*Jv[5] - m_lcg*ly*lz
+
+    # Mass matrix including added mass, see SAM.calculate_M
+    m11 = m * (1 + sam.k1)
+    m22 = m * (1 + sam.k2)
+    Mxx = Jxx * (1 + sam.r44)
+    Myy = Jyy + sam.k_prime * Jyy
+    Mzz = Jzz + sam.k_prime * Jyy
+
+    # Coriolis: C nu_r = [w x a; v x a + w x b], a = M11 v, b = M22 w
+    ax, ay, az = m11*u_r, m22*v_r, m22*w
+    bx = Mxx*p + Jxy*q + Jxz*r
+    by = Jxy*p + Myy*q + Jyz*r
+    bz = Jxz*p + Jyz*q + Mzz*r
+    Cn0 = q*az - r*ay
+    Cn1 = r*ax - p*az
+    Cn2 = p*ay - q*ax
+    Cn3 = v_r*az - w*ay + q*bz - r*by
+    Cn4 = w*ax - u_r*az + r*bx - p*bz
+    Cn5 = u_r*ay - v_r*ax + p*by - q*bx
+
+    # Restoring forces, see gvect
+    W = m * sam.g
+    B = float(sam.B)
+    rb = sam.p_OB_O.tolist()
+    dx = xg*W - rb[0]*B
+    dy = yg*W - rb[1]*B
+    dz = zg*W - rb[2]*B
+    g0 = (W-B) * sth
+    g1 = -(W-B) * cth * sphi
+    g2 = -(W-B) * cth * cphi
+    g3 = -dy * cth * cphi + dz * cth * sphi
+    g4 = dz * sth + dx * cth * cphi
+    g5 = -dx * cth * sphi - dy * sth
+
+    # Propeller forces, see SAM.calculate_propeller_force
+    cs, ss = ops.cos(delta_s), ops.sin(delta_s)
+    cr, sr = ops.cos(delta_r), ops.sin(delta_r)
+    tx, ty, tz = cr*cs, -sr*cs, ss
+    Va_ax = tx*u_r + ty*v_r + tz*w
+    Va_abs = sam.Va_coef * ops.sqrt(Va_ax*Va_ax + 1e-9)
+    cT = sam.rho * sam.D_prop**4
+    cQ = sam.rho * sam.D_prop**5
+    dKT = (sam.KT_max - sam.KT_0)/sam.Ja_max
+    dKQ = (sam.KQ_max - sam.KQ_0)/sam.Ja_max
+    p_OC = c["p_OC"]
+
+    X_tot = 0.0
+    Mx = My = Mz = 0.0
+    for i, rpm in enumerate((rpm1, rpm2)):
+        n = rpm/60
+        nabs = ops.sqrt(n*n + 1e-9)
+        s = 0.5*(1 + ops.tanh(100.0*n))
+        gn = 0.5*(1 + ops.tanh(8.0*(ops.fabs(n)/(5.0 + 1e-9) - 1.0)))
+        Jb = (Va_abs/sam.D_prop) * nabs
+        scale = s + (1-s)/5
+        X_i = cT * (sam.KT_0*n*nabs + gn*dKT*Jb) * scale
+        K_i = cQ * (sam.KQ_0*n*nabs + gn*dKQ*Jb) * scale
+
+        rx, ry, rz = c["r_sh"][i]
+        rpx = cr*cs*rx + sr*ry - cr*ss*rz - p_OC[0]
+        rpy = -sr*cs*rx + cr*ry + sr*ss*rz - p_OC[1]
+        rpz = ss*rx + cs*rz - p_OC[2]
+
+        X_tot += X_i
+        Mx += (rpy*tz - rpz*ty)*X_i + (-1)**i * K_i
+        My += (rpz*tx - rpx*tz)*X_i
+        Mz += (rpx*ty - rpy*tx)*X_i
+
+    k = sam.thruster_rot_strength
+    tau0, tau1, tau2 = tx*X_tot, ty*X_tot, tz*X_tot
+    tau3, tau4, tau5 = k*Mz, k*My, k*Mx
+
+    # Damping, see SAM.calculate_D
+    f0 = tau0 - Cn0 - sam.Xuu*ops.sqrt(u_r*u_r + 1e-9)*u_r - g0
+    f1 = tau1 - Cn1 - sam.Yvv*ops.sqrt(v_r*v_r + 1e-9)*v_r - g1
+    f2 = tau2 - Cn2 - sam.Zww*ops.sqrt(w*w + 1e-9)*w - g2
+    f3 = tau3 - Cn3 - sam.Kpp*ops.sqrt(p*p + 1e-9)*p - g3
+    f4 = tau4 - Cn4 - sam.Mqq*ops.sqrt(q*q + 1e-9)*q - g4
+    f5 = tau5 - Cn5 - sam.Nrr*ops.sqrt(r*r + 1e-9)*r - g5
+
+    # nu_dot = M^-1 f, exact solve of the symmetric rotational block
+    c00 = Myy*Mzz - Jyz*Jyz
+    c01 = Jxz*Jyz - Jxy*Mzz
+    c02 = Jxy*Jyz - Jxz*Myy
+    c11 = Mxx*Mzz - Jxz*Jxz
+    c12 = Jxy*Jxz - Mxx*Jyz
+    c22 = Mxx*Myy - Jxy*Jxy
+    det = Mxx*c00 + Jxy*c01 + Jxz*c02
+
+    # Actuator dynamics, see SAM.actuator_dynamics
+    vbs_dot = ops.clip((ur_vbs - x_vbs)/dt, -sam.vbs.x_vbs_dot_max, sam.vbs.x_vbs_dot_max)
+    lcg_dot = ops.clip((ur_lcg - x_lcg)/dt, -sam.lcg.x_lcg_dot_max, sam.lcg.x_lcg_dot_max)
+
+    # Kinematics, Fossen 2021, eq. 2.78
+    gq = sam.gamma/2 * (1 - (q0*q0 + q1*q1 + q2*q2 + q3*q3))
+
+    return (
+        (1 - 2*(q2*q2 + q3*q3))*u + 2*(q1*q2 - q0*q3)*v + 2*(q1*q3 + q0*q2)*w,
+        2*(q1*q2 + q0*q3)*u + (1 - 2*(q1*q1 + q3*q3))*v + 2*(q2*q3 - q0*q1)*w,
+        2*(q1*q3 - q0*q2)*u + 2*(q2*q3 + q0*q1)*v + (1 - 2*(q1*q1 + q2*q2))*w,
+        0.5*(-q1*p - q2*q - q3*r) + gq*q0,
+        0.5*(q0*p - q3*q + q2*r) + gq*q1,
+        0.5*(q3*p + q0*q - q1*r) + gq*q2,
+        0.5*(-q2*p + q1*q + q0*r) + gq*q3,
+        f0/m11,
+        f1/m22,
+        f2/m22,
+        (c00*f3 + c01*f4 + c02*f5)/det,
+        (c01*f3 + c11*f4 + c12*f5)/det,
+        (c02*f3 + c12*f4 + c22*f5)/det,
+        vbs_dot,
+        lcg_dot,
+        (ur_s - delta_s)/dt,
+        (ur_r - delta_r)/dt,
+        (ur_rpm1 - rpm1)/dt,
+        (ur_rpm2 - rpm2)/dt,
+    )
+
+
+
+
 # Class Vehicle
 class SAM():
     """
@@ -237,7 +568,6 @@ class SAM():
         self.MRB = np.zeros((6,6)) 
         self.MA = np.zeros((6,6)) 
         self.M = np.zeros((6,6)) 
-        self.Minv = np.zeros((6,6)) 
 
         self.p_OG_O = np.array([0., 0, 0.12], float)  # CG w.r.t. to the CO, we
         self.p_OB_O = np.array([0., 0, 0], float)  # CB w.r.t. to the CO
@@ -313,6 +643,48 @@ class SAM():
         if piml_type == None:
             self.piml_type = "None"
 
+        # Optional mass property cache, see use_mass_table
+        self.mass_table = None
+
+        # Optional CasADi evaluation of the dynamics, see set_backend
+        self.casadi_rhs = None
+
+        # CasADi model for jacobians(), built on first use
+        self.jacobian_rhs = None
+
+        # Geometry dependent constants for the stateless dynamics_rhs
+        self.init_rhs_constants()
+
+
+    def init_rhs_constants(self):
+        """
+        Precompute the geometry dependent constants used by dynamics_rhs.
+        Only depends on the subsystems, not on the tuning factors. Call again
+        if you change the geometry of the subsystems after initialization.
+        """
+        # Solid structure inertia in CO plus the constant part of the LCG inertia
+        Ix = (2 / 5) * self.ss.m_ss * self.b ** 2
+        Iy = (1 / 5) * self.ss.m_ss * (self.a ** 2 + self.b ** 2)
+        S2_ss = skew_symmetric(self.ss.p_OSsg_O) @ skew_symmetric(self.ss.p_OSsg_O)
+        Ix_lcg = (1/2) * self.lcg.m_lcg * (self.lcg.h_lcg_dim/2)**2
+        Iy_lcg = (1/12) * self.lcg.m_lcg* (3*(self.lcg.h_lcg_dim/2)**2 + self.lcg.l_lcg_l**2)
+        J_const = np.diag([Ix + Ix_lcg, Iy + Iy_lcg, Iy + Iy_lcg]) - self.ss.m_ss * S2_ss
+
+        # VBS inertia per kg of water, -S(r)S(r) + diag(r^2/2, r^2/4, r^2/4)
+        S2_vbs = skew_symmetric(self.vbs.p_OVbs_O) @ skew_symmetric(self.vbs.p_OVbs_O)
+        r2 = self.vbs.r_vbs**2
+        J_vbs = np.diag([r2/2, r2/4, r2/4]) - S2_vbs
+
+        self.rhs_constants = {
+            "J_const": tuple(J_const[[0, 1, 2, 0, 0, 1], [0, 1, 2, 1, 2, 2]].tolist()),
+            "J_vbs": tuple(J_vbs[[0, 1, 2, 0, 0, 1], [0, 1, 2, 1, 2, 2]].tolist()),
+            "vbs_area": self.rho_w * np.pi * r2,
+            "p_ss": tuple(self.ss.p_OSsg_O.tolist()),
+            "p_vbs": tuple(self.vbs.p_OVbs_O.tolist()),
+            "p_lcg0": tuple(self.lcg.p_OLcgPos_O.tolist()),
+            "p_OC": tuple(self.p_OC_O.tolist()),
+            "r_sh": tuple(tuple(r.tolist()) for r in self.propellers.r_t_p_sh),
+        }
 
     def init_vehicle(self):
         """
@@ -369,10 +741,16 @@ class SAM():
         u = self.bound_actuators(u)
         u_ref = self.bound_actuators(u_ref)
 
+        if self.casadi_rhs is not None:
+            return self.casadi_rhs(np.concatenate([eta, nu, u]), u_ref, self.dt)
+
         self.calculate_system_state(nu, eta, u)
-        self.calculate_cg()
-        self.update_inertias()
-        self.calculate_M()
+        if self.mass_table is not None:
+            self.lookup_mass_properties(u)
+        else:
+            self.calculate_cg()
+            self.update_inertias()
+            self.calculate_M()
         self.calculate_C()
         self.calculate_D(eta, nu, u)
         self.calculate_g()
@@ -386,13 +764,13 @@ class SAM():
 
         np.set_printoptions(precision=3)
 
-        nu_dot = self.Minv @ (self.tau - np.matmul(self.C,self.nu_r) - np.matmul(self.D,self.nu_r) - self.g_vec)
+        nu_dot = self.solve_M(self.tau - np.matmul(self.C,self.nu_r) - np.matmul(self.D,self.nu_r) - self.g_vec)
         u_dot = self.actuator_dynamics(u, u_ref)
         eta_dot = self.eta_dynamics(eta, nu)
 
         if self.piml_type == "bpinn":
             Dv, _ = bpinn_predict(self.piml_model, eta, nu, u, [self.x_mean, self.x_std])
-            nu_dot = self.Minv @ (self.tau - np.matmul(self.C,self.nu_r) - Dv - self.g_vec)
+            nu_dot = self.solve_M(self.tau - np.matmul(self.C,self.nu_r) - Dv - self.g_vec)
 
         x_dot = np.concatenate([eta_dot, nu_dot, u_dot])
 
@@ -405,6 +783,286 @@ class SAM():
 
         return x_dot
 
+    def dynamics_batch(self, X, U_ref):
+        """
+        Vectorized version of dynamics() for N states at once.
+
+        Builds the stacked mass, Coriolis, damping, restoring and propeller
+        terms as (N, 6, 6) and (N, 6) arrays, without a Python loop over the
+        samples. The instance state (self.M, self.C, ...) is not touched.
+
+        Args:
+            X: (N, 19) array of states [eta, nu, u]
+            U_ref: (N, 6) array of control inputs [x_vbs, x_lcg, delta_s, delta_r, rpm1, rpm2]
+
+        Returns:
+            X_dot: (N, 19) array with the time derivatives of the states
+
+        Note: Only the white-box model is vectorized. For the PIML models we
+            fall back to evaluating dynamics() row by row.
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        U_ref = np.atleast_2d(np.asarray(U_ref, dtype=float))
+        if U_ref.shape[0] == 1 and X.shape[0] > 1:
+            U_ref = np.broadcast_to(U_ref, (X.shape[0], 6))
+
+        if self.piml_type != "None":
+            return np.array([self.dynamics(x, u_ref) for x, u_ref in zip(X, U_ref)])
+
+        n_samples = X.shape[0]
+        eta = X[:, 0:7]
+        nu = X[:, 7:13]
+
+        u = self.bound_actuators_batch(X[:, 13:19])
+        u_ref = self.bound_actuators_batch(U_ref)
+
+        if self.casadi_rhs is not None:
+            return self.casadi_rhs.batch(np.hstack([eta, nu, u]), u_ref, self.dt)
+
+        # System state
+        q = eta[:, 3:7] / np.linalg.norm(eta[:, 3:7], axis=1, keepdims=True)
+        psi, theta, phi = quaternion_to_angles_batch(q)
+
+        nu_c = np.zeros((n_samples, 6))
+        nu_c[:, 0] = self.V_c * np.cos(self.beta_c - psi)
+        nu_c[:, 1] = self.V_c * np.sin(self.beta_c - psi)
+        nu_r = nu - nu_c
+
+        # Mass, cg, inertias and mass matrix
+        if self.mass_table is not None:
+            m, p_OG_O, _, M = self.mass_table.lookup_batch(u)
+        else:
+            m, p_OG_O, J_total = self.calculate_mass_properties_batch(u)
+            MRB, MA = self.calculate_M_batch(m, J_total)
+            M = MRB + MA
+
+        # Coriolis, C = m2c(MRB) + m2c(MA) = m2c(M), since m2c is linear in M
+        C = m2c_batch(M, nu_r)
+
+        # Damping, see calculate_D
+        D_diag = np.array([self.Xuu, self.Yvv, self.Zww, self.Kpp, self.Mqq, self.Nrr]) \
+               * self.abs_smooth(nu_r)
+
+        # Restoring forces
+        g_vec = gvect_batch(m * self.g, self.B, theta, phi, p_OG_O, self.p_OB_O)
+
+        # External forces
+        tau = self.calculate_propeller_force_batch(u, nu_r)
+
+        rhs = tau - np.einsum('nij,nj->ni', C, nu_r) - D_diag * nu_r - g_vec
+        nu_dot = block_diag_solve(M, rhs)
+        u_dot = self.actuator_dynamics_batch(u, u_ref)
+        eta_dot = self.eta_dynamics_batch(eta, nu)
+
+        return np.concatenate([eta_dot, nu_dot, u_dot], axis=1)
+
+    def bound_actuators_batch(self, U):
+        """
+        Vectorized version of bound_actuators() for (N, 6) inputs.
+        """
+        U_bound = np.array(U, dtype=float)
+        U_bound[:, 0:2] = np.clip(U_bound[:, 0:2], 0, 100)
+        return U_bound
+
+    def calculate_mass_properties_batch(self, U):
+        """
+        Mass, center of gravity and inertia tensor in CO for (N, 6) actuator
+        states. Same as calculate_system_state(), calculate_cg() and
+        update_inertias() combined.
+
+        Returns:
+            m: (N,) total mass
+            p_OG_O: (N, 3) center of gravity w.r.t. CO
+            J_total: (N, 3, 3) inertia tensor in CO
+        """
+        n_samples = U.shape[0]
+        eye = np.eye(3)
+
+        x_vbs = (U[:, 0]/100) * self.vbs.l_vbs_l
+        m_vbs = self.rho_w * np.pi * self.vbs.r_vbs ** 2 * x_vbs
+        m = self.ss.m_ss + m_vbs + self.lcg.m_lcg
+
+        p_OLcg_O = np.tile(self.lcg.p_OLcgPos_O, (n_samples, 1))
+        p_OLcg_O[:, 0] += (U[:, 1]/100) * self.lcg.l_lcg_l
+
+        p_OG_O = (self.ss.m_ss/m)[:, None] * self.ss.p_OSsg_O \
+               + (m_vbs/m)[:, None] * self.vbs.p_OVbs_O \
+               + (self.lcg.m_lcg/m)[:, None] * p_OLcg_O
+
+        # Solid structure, constant
+        Ix = (2 / 5) * self.ss.m_ss * self.b ** 2
+        Iy = (1 / 5) * self.ss.m_ss * (self.a ** 2 + self.b ** 2)
+        J_ss_co = np.diag([Ix, Iy, Iy]) \
+                - self.ss.m_ss * skew_symmetric(self.ss.p_OSsg_O) @ skew_symmetric(self.ss.p_OSsg_O)
+
+        # VBS, S(r)S(r) = r r^T - |r|^2 I
+        r = self.vbs.p_OVbs_O
+        S2_r_vbs = np.outer(r, r) - np.dot(r, r) * eye
+        Ix_vbs = (1/2) * m_vbs * self.vbs.r_vbs**2
+        Iy_vbs = (1/12) * m_vbs * (3*self.vbs.r_vbs**2 + x_vbs**2)
+        J_vbs_co = -m_vbs[:, None, None] * S2_r_vbs
+        J_vbs_co[:, 0, 0] += Ix_vbs
+        J_vbs_co[:, 1, 1] += Iy_vbs
+        J_vbs_co[:, 2, 2] += Iy_vbs
+
+        # LCG
+        Ix_lcg = (1/2) * self.lcg.m_lcg * (self.lcg.h_lcg_dim/2)**2
+        Iy_lcg = (1/12) * self.lcg.m_lcg* (3*(self.lcg.h_lcg_dim/2)**2 + self.lcg.l_lcg_l**2)
+        S2_r_lcg = np.einsum('ni,nj->nij', p_OLcg_O, p_OLcg_O) \
+                 - np.einsum('ni,ni->n', p_OLcg_O, p_OLcg_O)[:, None, None] * eye
+        J_lcg_co = np.diag([Ix_lcg, Iy_lcg, Iy_lcg]) - self.lcg.m_lcg * S2_r_lcg
+
+        J_total = J_ss_co + J_vbs_co + J_lcg_co
+        J_total[:, 0, 0] *= self.inertia_factor
+
+        return m, p_OG_O, J_total
+
+    def calculate_M_batch(self, m, J_total):
+        """
+        Vectorized version of calculate_M() for (N,) masses and (N, 3, 3)
+        inertia tensors. MRB and MA are both block diagonal.
+
+        Returns:
+            MRB: (N, 6, 6) rigid-body mass matrices
+            MA: (N, 6, 6) added mass matrices
+        """
+        n_samples = m.shape[0]
+        MRB = np.zeros((n_samples, 6, 6))
+        MRB[:, 0, 0] = m
+        MRB[:, 1, 1] = m
+        MRB[:, 2, 2] = m
+        MRB[:, 3:6, 3:6] = J_total
+
+        MA = np.zeros((n_samples, 6, 6))
+        MA[:, 0, 0] = m * self.k1
+        MA[:, 1, 1] = m * self.k2
+        MA[:, 2, 2] = m * self.k2
+        MA[:, 3, 3] = self.r44 * J_total[:, 0, 0]
+        MA[:, 4, 4] = self.k_prime * J_total[:, 1, 1]
+        MA[:, 5, 5] = self.k_prime * J_total[:, 1, 1]
+
+        return MRB, MA
+
+    def calculate_propeller_force_batch(self, U, nu_r):
+        """
+        Vectorized version of calculate_propeller_force() for (N, 6) inputs
+        and (N, 6) relative velocities.
+        """
+        delta_s = U[:, 2]
+        delta_r = U[:, 3]
+        n_rps = U[:, 4:] / 60
+        prop_scaling = 5
+        n_ref = 5.0
+        sharp = 8.0
+
+        # C_T2C = Rz(delta_r) @ Ry(delta_s), see calculate_dcm
+        cs, ss = np.cos(delta_s), np.sin(delta_s)
+        cr, sr = np.cos(delta_r), np.sin(delta_r)
+        C_T2C = np.empty((U.shape[0], 3, 3))
+        C_T2C[:, 0, 0] = cr*cs
+        C_T2C[:, 0, 1] = sr
+        C_T2C[:, 0, 2] = -cr*ss
+        C_T2C[:, 1, 0] = -sr*cs
+        C_T2C[:, 1, 1] = cr
+        C_T2C[:, 1, 2] = sr*ss
+        C_T2C[:, 2, 0] = ss
+        C_T2C[:, 2, 1] = 0
+        C_T2C[:, 2, 2] = cs
+
+        t_b = C_T2C[:, :, 0]
+        Va_ax = np.einsum('ni,ni->n', t_b, nu_r[:, 0:3])
+        Va_abs = self.Va_coef * np.sqrt(Va_ax*Va_ax + 1e-9)
+
+        nabs = self.abs_smooth(n_rps)
+        s = self.smooth_switch(n_rps)
+        gn = self.gate_n(n_rps, n_ref, sharp)
+        Jb = (Va_abs/self.D_prop)[:, None] * nabs
+        KT_fwd = self.KT_0 * n_rps * nabs + gn * (self.KT_max - self.KT_0)/self.Ja_max * Jb
+        KQ_fwd = self.KQ_0 * n_rps * nabs + gn * (self.KQ_max - self.KQ_0)/self.Ja_max * Jb
+
+        cT = self.rho * (self.D_prop**4) * KT_fwd
+        cQ = self.rho * (self.D_prop**5) * KQ_fwd
+        X_i = s*cT + (1-s)*cT/prop_scaling   # (N, n_p)
+        K_i = s*cQ + (1-s)*cQ/prop_scaling
+
+        tau_prop = np.zeros((U.shape[0], 6))
+        for i in range(self.propellers.n_p):
+            F_prop_i = t_b * X_i[:, i:i+1]
+            r_prop_i = C_T2C @ self.propellers.r_t_p_sh[i] - self.p_OC_O
+            M_prop_i = np.cross(r_prop_i, F_prop_i)
+            M_prop_i[:, 0] += ((-1)**i) * K_i[:, i]
+
+            # Same x<->z swap as in calculate_propeller_force
+            tau_prop[:, 0:3] += F_prop_i
+            tau_prop[:, 3:6] += self.thruster_rot_strength * M_prop_i[:, ::-1]
+
+        return tau_prop
+
+    def eta_dynamics_batch(self, eta, nu):
+        """
+        Vectorized version of eta_dynamics() for (N, 7) poses and (N, 6) velocities.
+        """
+        q = eta[:, 3:7] / np.linalg.norm(eta[:, 3:7], axis=1, keepdims=True)
+        q0, q1, q2, q3 = q.T
+
+        # Position dynamics: ṗ = C * v
+        pos_dot = np.einsum('nij,nj->ni', quaternion_to_dcm_batch(q), nu[:, 0:3])
+
+        # Fossen 2021, eq. 2.78
+        p, q_rate, r = nu[:, 3], nu[:, 4], nu[:, 5]
+        q_dot = 0.5 * np.stack([-q1*p - q2*q_rate - q3*r,
+                                 q0*p - q3*q_rate + q2*r,
+                                 q3*p + q0*q_rate - q1*r,
+                                -q2*p + q1*q_rate + q0*r], axis=1)
+        q_dot += (self.gamma/2 * (1 - np.sum(q*q, axis=1)))[:, None] * q
+
+        return np.concatenate([pos_dot, q_dot], axis=1)
+
+    def actuator_dynamics_batch(self, u_cur, u_ref):
+        """
+        Vectorized version of actuator_dynamics() for (N, 6) inputs.
+        """
+        u_dot = (u_ref - u_cur)/self.dt
+        u_dot[:, 0] = np.clip(u_dot[:, 0], -self.vbs.x_vbs_dot_max, self.vbs.x_vbs_dot_max)
+        u_dot[:, 1] = np.clip(u_dot[:, 1], -self.lcg.x_lcg_dot_max, self.lcg.x_lcg_dot_max)
+        return u_dot
+
+    def dynamics_rhs(self, x, u_ref, x_dot=None):
+        """
+        Stateless version of dynamics() for the single-state hot path.
+
+        Evaluates the same white-box model with scalar math, without
+        allocating intermediate arrays and without writing to the instance.
+        Several threads can therefore share one SAM object. Changes to the
+        tuning factors (inertia_factor, damping, ...) are picked up directly;
+        geometry changes require init_rhs_constants() to be called.
+
+        Only the white-box model is available. The PIML models go through
+        dynamics(), which writes to the instance.
+
+        In pure Python this takes about 20 us per call (sam_rhs_benchmark).
+        For single digit microseconds use set_backend("casadi", compile=True).
+
+        Args:
+            x: state space vector with [eta, nu, u]
+            u_ref: control inputs as [x_vbs, x_lcg, delta_s, delta_r, rpm1, rpm2]
+            x_dot: optional preallocated (19,) array the result is written into
+
+        Returns:
+            x_dot: Time derivative of complete state vector
+        """
+        if self.piml_type != "None":
+            raise ValueError(f"dynamics_rhs is not available for piml_type {self.piml_type}, use dynamics()")
+
+        if x_dot is None:
+            x_dot = np.empty(19)
+
+        x = x.tolist() if hasattr(x, "tolist") else x
+        u_ref = u_ref.tolist() if hasattr(u_ref, "tolist") else u_ref
+        x_dot[:] = rhs_equations(self, x, u_ref, self.dt, SCALAR_MATH)
+
+        return x_dot
+
     def bound_actuators(self, u):
         """
         Enforce actuation limits on each actuator.
@@ -545,12 +1203,116 @@ class SAM():
 
         # Mass matrix including added mass
         self.M = self.MRB + self.MA
-        self.Minv = np.linalg.inv(self.M)
         #print(f"MRB: {MRB_check}, MA: {self.MA}, M: {self.M}")
         #print(f"MRB:\n {np.sign(self.MRB)}")
         #print(f"MA:\n {np.sign(self.MA)}")
         #print(f"M:\n {np.sign(self.M)}")
 
+    def use_mass_table(self, method="memoize", n_vbs=101, n_lcg=101, decimals=None):
+        """
+        Enable the mass property cache for dynamics() and dynamics_batch().
+        See MassPropertyTable for the arguments. The table is built with the
+        current tuning factors, call this again after changing inertia_factor.
+        Use method=None to go back to the analytic computation.
+        """
+        if method is None:
+            self.mass_table = None
+        else:
+            self.mass_table = MassPropertyTable(self, method, n_vbs, n_lcg, decimals)
+
+    def set_backend(self, backend="numpy", compile=False, cache_dir=None, n_threads=1):
+        """
+        Select how dynamics() and dynamics_batch() are evaluated.
+
+        Args:
+            backend: "numpy" for the implementation in this class, "casadi"
+                for a CasADi port of the same equations (see dynamics_rhs).
+                Only the white-box model is available for "casadi".
+            compile, cache_dir, n_threads: See SAM_casadi_backend.CasadiRHS.
+
+        The parameters are baked in when the CasADi backend is built, call
+        this again after changing them.
+        """
+        self.jacobian_rhs = None
+        if backend == "numpy":
+            self.casadi_rhs = None
+        elif backend == "casadi":
+            if self.piml_type != "None":
+                raise ValueError(f"The CasADi backend is not available for piml_type {self.piml_type}")
+
+            from smarc_modelling.vehicles.SAM_casadi_backend import CasadiRHS
+            self.casadi_rhs = CasadiRHS(self, compile, cache_dir, n_threads)
+        else:
+            raise ValueError(f"Unknown backend: {backend}")
+
+    def jacobians(self, x, u_ref):
+        """
+        Linearization of dynamics() by automatic differentiation. Both
+        backends evaluate the same equations, the derivatives are taken of
+        the CasADi port (see SAM_casadi_backend.x_dot_expression). The
+        actuator bounds are part of the model, the derivatives w.r.t. a
+        clipped actuator are zero.
+
+        Args:
+            x: state space vector with [eta, nu, u]
+            u_ref: control inputs as [x_vbs, x_lcg, delta_s, delta_r, rpm1, rpm2]
+
+        Returns:
+            A: (19, 19) df/dx
+            B: (19, 6) df/du_ref
+        """
+        return self.get_jacobian_rhs().jacobians(x, u_ref, self.dt)
+
+    def jacobians_batch(self, X, U_ref):
+        """
+        Vectorized version of jacobians() for (N, 19) states and (N, 6)
+        inputs, e.g. along a trajectory.
+
+        Returns:
+            A: (N, 19, 19) df/dx
+            B: (N, 19, 6) df/du_ref
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        U_ref = np.atleast_2d(np.asarray(U_ref, dtype=float))
+        if U_ref.shape[0] == 1 and X.shape[0] > 1:
+            U_ref = np.broadcast_to(U_ref, (X.shape[0], 6))
+
+        return self.get_jacobian_rhs().jacobians_batch(X, U_ref, self.dt)
+
+    def get_jacobian_rhs(self):
+        """
+        The CasADi right-hand side used by jacobians(). Reuses the CasADi
+        backend if it is selected, otherwise one is built on first use with
+        the current parameters. set_backend() drops it, call it after
+        changing the parameters.
+        """
+        if self.casadi_rhs is not None:
+            return self.casadi_rhs
+
+        if self.jacobian_rhs is None:
+            if self.piml_type != "None":
+                raise ValueError(f"Jacobians are not available for piml_type {self.piml_type}")
+
+            from smarc_modelling.vehicles.SAM_casadi_backend import CasadiRHS
+            self.jacobian_rhs = CasadiRHS(self)
+
+        return self.jacobian_rhs
+
+    def lookup_mass_properties(self, u):
+        """
+        Replaces calculate_cg, update_inertias and calculate_M when the mass
+        property cache is enabled.
+        """
+        self.m, self.p_OG_O, self.J_total, self.MRB, self.MA, self.M \
+            = self.mass_table.lookup(u)
+
+    def solve_M(self, f):
+        """
+        Solve M nu_dot = f with the current mass matrix. Exploits the block
+        diagonal structure of M instead of forming its inverse.
+        """
+        return block_diag_solve(self.M, f)
+
     def calculate_C(self):
         """
         Calculate Corriolis Matrix
@@ -192,6 +192,7 @@ class SAM_LQR():
         # Initialize Subsystems:
         self.init_vehicle()
         self.create_model = True
+        self.jacobian_fun = None # Built on the first call of jacobians()
         # Reference values and current
         self.V_c = V_current  # Current water speed
         self.beta_c = beta_current * self.D2R  # Current water direction (rad)
@@ -373,6 +374,31 @@ class SAM_LQR():
         #return self.x_dot_sym(x, u_ref) # returns a ca.DM
         return self.x_dot_sym  # returns a casadi MX.function
 
+    def jacobians(self, x, u_ref):
+        """
+        Linearization of the exported 12-state model, e.g. for LQR gain
+        scheduling. The Jacobians are computed by automatic differentiation
+        and the CasADi function is built once.
+
+        Args:
+            x: state space vector with [eta, nu], eta in Euler angles
+            u_ref: control inputs as [x_vbs, x_lcg, delta_s, delta_r, rpm1, rpm2]
+
+        Returns:
+            A: (12, 12) df/dx
+            B: (12, 6) df/du_ref
+        """
+        if self.jacobian_fun is None:
+            x_dot_fun = self.dynamics(export=True)
+            x_sym = ca.MX.sym('x', 12, 1)
+            u_ref_sym = ca.MX.sym('u_ref', 6, 1)
+            x_dot = x_dot_fun(x_sym, u_ref_sym)
+            self.jacobian_fun = ca.Function('x_dot_jac', [x_sym, u_ref_sym],
+                                            [ca.jacobian(x_dot, x_sym), ca.jacobian(x_dot, u_ref_sym)])
+
+        A, B = self.jacobian_fun(x, u_ref)
+        return np.array(A), np.array(B)
+
     
     def calculate_system_state(self, nu, eta, u_control):
         """
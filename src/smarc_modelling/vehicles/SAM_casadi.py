@@ -348,29 +348,7 @@ class SAM_casadi():
             # NOTE: Not sure why we need this model... 
             x_sym = ca.MX.sym('x', 19,1)
             u_ref_sym = ca.MX.sym('u_ref', 6,1)
-            eta = x_sym[0:7]
-            nu = x_sym[7:13]
-            u = x_sym[13:19]
-
-            # Bound_actuators is removed -see SAM for reference
-
-            self.calculate_system_state(nu, eta, u)
-            self.calculate_cg()
-            self.update_inertias()
-            self.calculate_M()
-            self.calculate_C()
-            self.calculate_D()
-            self.calculate_g()
-            self.calculate_tau(u)
-
-            rhs = self.tau - self.C @ self.nu_r - self.D @ self.nu_r - self.g_vec
-            epsM = 1e-10
-            nu_dot = ca.solve(self.M + epsM*ca.DM.eye(6), rhs)
-
-            u_dot = self.actuator_dynamics(u, u_ref_sym)
-            eta_dot = self.eta_dynamics(eta, nu)
-
-            x_dot = ca.vertcat(eta_dot, nu_dot, u_dot)
+            x_dot = self.x_dot_expression(x_sym, u_ref_sym)
             self.x_dot_sym = ca.Function('x_dot', [x_sym, u_ref_sym], [x_dot])
             self.create_model = False
 
@@ -405,6 +383,43 @@ class SAM_casadi():
 
         return self.x_dot_sym  # returns a casadi MX.function
 
+    def x_dot_expression(self, x_sym, u_ref_sym):
+        """
+        Symbolic time derivative of the complete state [eta, nu, u] of this
+        model. Used by dynamics(). The CasADi backend of SAM does not use this
+        model, see SAM_casadi_backend.
+
+        Args:
+            x_sym: (19, 1) symbolic state
+            u_ref_sym: (6, 1) symbolic control reference
+
+        Returns:
+            x_dot: (19, 1) symbolic state derivative
+        """
+        eta = x_sym[0:7]
+        nu = x_sym[7:13]
+        u = x_sym[13:19]
+
+        # Bound_actuators is removed -see SAM for reference
+
+        self.calculate_system_state(nu, eta, u)
+        self.calculate_cg()
+        self.update_inertias()
+        self.calculate_M()
+        self.calculate_C()
+        self.calculate_D()
+        self.calculate_g()
+        self.calculate_tau(u)
+
+        rhs = self.tau - self.C @ self.nu_r - self.D @ self.nu_r - self.g_vec
+        epsM = 1e-10
+        nu_dot = ca.solve(self.M + epsM*ca.DM.eye(6), rhs)
+
+        u_dot = self.actuator_dynamics(u, u_ref_sym)
+        eta_dot = self.eta_dynamics(eta, nu)
+
+        return ca.vertcat(eta_dot, nu_dot, u_dot)
+
 
     def calculate_system_state(self, nu, eta, u_control):
         """
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SAM_casadi_backend.py:
+
+   Evaluates the SAM right-hand side as a symbolic CasADi function instead of
+   the NumPy implementation in SAM. The function is built from the same
+   source as SAM.dynamics_rhs (SAM.rhs_equations), with the parameters of
+   the given vehicle. It can be code-generated and compiled to a shared
+   library with the local C compiler. Compiled libraries are cached on disk,
+   keyed by a hash of the model, s.t. the compilation only happens once per
+   set of parameters.
+
+   CasadiRHS(vehicle)
+       vehicle: white-box SAM instance. Its parameters (tuning factors,
+           damping, propeller coefficients, geometry and currents) are baked
+           into the CasADi function when the backend is built. Rebuild the
+           backend if you change them afterwards.
+
+Methods:
+
+    [xdot] = rhs(x, u_ref, dt) returns for integration
+    [Xdot] = rhs.batch(X, U_ref, dt) for (N, 19) states and (N, 6) inputs
+    [A, B] = rhs.jacobians(x, u_ref, dt) returns df/dx and df/du_ref
+    [A, B] = rhs.jacobians_batch(X, U_ref, dt) along a trajectory
+"""
+
+import os
+import hashlib
+import subprocess
+import numpy as np
+import casadi as ca
+from types import SimpleNamespace
+from smarc_modelling.vehicles.SAM import rhs_equations
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "smarc_modelling")
+
+
+def clip(x, lower, upper):
+    return ca.fmin(ca.fmax(x, lower), upper)
+
+
+# Math functions rhs_equations is evaluated with, for CasADi symbols
+CASADI_MATH = SimpleNamespace(sqrt=ca.sqrt, sin=ca.sin, cos=ca.cos, tanh=ca.tanh,
+                              atan2=ca.atan2, fabs=ca.fabs, clip=clip)
+
+
+def x_dot_expression(vehicle, x, u_ref, dt):
+    """
+    Symbolic time derivative of the complete state [eta, nu, u]. Evaluates
+    SAM.rhs_equations, the source of SAM.dynamics_rhs, with CasADi symbols.
+
+    Args:
+        vehicle: white-box SAM instance to take the parameters from
+        x: (19, 1) symbolic state
+        u_ref: (6, 1) symbolic control reference
+        dt: symbolic time step of the actuator dynamics
+
+    Returns:
+        x_dot: (19, 1) symbolic state derivative
+    """
+    return ca.vertcat(*rhs_equations(vehicle, ca.vertsplit(x), ca.vertsplit(u_ref), dt, CASADI_MATH))
+
+
+class CasadiRHS():
+    """
+    CasADi right-hand side of the SAM dynamics.
+
+    Parameters:
+        vehicle: White-box NumPy vehicle model (SAM) to take the parameters from.
+        compile (bool): Code-generate and compile the function to C.
+        cache_dir (str): Where compiled libraries are kept.
+        n_threads (int): Threads used by batch() through CasADi's map.
+    """
+
+    def __init__(self, vehicle, compile=False, cache_dir=None, n_threads=1):
+        self.compile = compile
+        self.cache_dir = cache_dir if cache_dir is not None else DEFAULT_CACHE_DIR
+        self.n_threads = n_threads
+
+        self.x_dot_sym = self.build_function(vehicle)
+        self.x_dot = self.x_dot_sym
+        if self.compile:
+            self.x_dot = self.compile_function(self.x_dot_sym)
+
+        # Built on the first call of jacobians()
+        self.jac = None
+
+        # Mapped functions, keyed by the number of samples and function name
+        self.mapped = {}
+
+    def build_function(self, vehicle):
+        """
+        Build x_dot(x, u_ref, dt). dt is an input s.t. variable time steps
+        don't require a rebuild.
+        """
+        x_sym = ca.SX.sym('x', 19, 1)
+        u_ref_sym = ca.SX.sym('u_ref', 6, 1)
+        dt_sym = ca.SX.sym('dt')
+
+        x_dot = x_dot_expression(vehicle, x_sym, u_ref_sym, dt_sym)
+        return ca.Function('x_dot', [x_sym, u_ref_sym, dt_sym], [x_dot])
+
+    def build_jacobian_function(self):
+        """
+        Build jac(x, u_ref, dt) -> (A, B) with A = df/dx and B = df/du_ref
+        by automatic differentiation of the symbolic x_dot.
+        """
+        x_sym = ca.SX.sym('x', 19, 1)
+        u_ref_sym = ca.SX.sym('u_ref', 6, 1)
+        dt_sym = ca.SX.sym('dt')
+
+        x_dot = self.x_dot_sym(x_sym, u_ref_sym, dt_sym)
+        A = ca.jacobian(x_dot, x_sym)
+        B = ca.jacobian(x_dot, u_ref_sym)
+        jac_fun = ca.Function('x_dot_jac', [x_sym, u_ref_sym, dt_sym], [A, B])
+
+        if self.compile:
+            jac_fun = self.compile_function(jac_fun)
+
+        return jac_fun
+
+    def compile_function(self, fun):
+        """
+        Code-generate fun, compile it to a shared library and load it.
+        The library is reused if one with the same model hash exists.
+        """
+        model_hash = hashlib.sha1((ca.__version__ + fun.serialize()).encode()).hexdigest()[:16]
+        name = f"sam_x_dot_{model_hash}"
+        lib_path = os.path.join(self.cache_dir, name + ".so")
+
+        if not os.path.exists(lib_path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            codegen = ca.CodeGenerator(name + ".c")
+            codegen.add(fun)
+            codegen.generate(self.cache_dir + os.sep)
+
+            # Compile to a temporary file first, s.t. concurrent processes
+            # never load a half written library.
+            c_path = os.path.join(self.cache_dir, name + ".c")
+            tmp_path = f"{lib_path}.{os.getpid()}.tmp"
+            compiler = os.environ.get("CC", "cc")
+            subprocess.run([compiler, "-O3", "-fPIC", "-shared", c_path, "-o", tmp_path],
+                           check=True)
+            os.replace(tmp_path, lib_path)
+
+        return ca.external(fun.name(), lib_path)
+
+    def get_mapped(self, fun, n_samples):
+        """
+        fun mapped over n_samples with n_threads threads, built once.
+        """
+        key = (fun.name(), n_samples)
+        if key not in self.mapped:
+            self.mapped[key] = fun.map(n_samples, "thread", self.n_threads)
+        return self.mapped[key]
+
+    def __call__(self, x, u_ref, dt):
+        """
+        Time derivative of the complete state for a single state.
+
+        Returns:
+            x_dot: (19,) array
+        """
+        return np.asarray(self.x_dot(x, u_ref, dt)).ravel()
+
+    def batch(self, X, U_ref, dt):
+        """
+        Time derivatives for (N, 19) states and (N, 6) inputs through CasADi's
+        map, evaluated with n_threads threads.
+
+        Returns:
+            X_dot: (N, 19) array
+        """
+        x_dot_map = self.get_mapped(self.x_dot, X.shape[0])
+        return np.asarray(x_dot_map(X.T, U_ref.T, dt)).T
+
+    def jacobians(self, x, u_ref, dt):
+        """
+        Jacobians of the right-hand side for a single state.
+
+        Returns:
+            A: (19, 19) df/dx
+            B: (19, 6) df/du_ref
+        """
+        if self.jac is None:
+            self.jac = self.build_jacobian_function()
+
+        A, B = self.jac(x, u_ref, dt)
+        return np.asarray(A), np.asarray(B)
+
+    def jacobians_batch(self, X, U_ref, dt):
+        """
+        Jacobians for (N, 19) states and (N, 6) inputs, e.g. along a
+        trajectory, through CasADi's map.
+
+        Returns:
+            A: (N, 19, 19) df/dx
+            B: (N, 19, 6) df/du_ref
+        """
+        if self.jac is None:
+            self.jac = self.build_jacobian_function()
+
+        n_samples = X.shape[0]
+        jac_map = self.get_mapped(self.jac, n_samples)
+        A, B = jac_map(X.T, U_ref.T, dt)
+
+        # map concatenates the outputs horizontally: (19, N*19) and (19, N*6)
+        A = np.asarray(A).reshape(19, n_samples, 19).transpose(1, 0, 2)
+        B = np.asarray(B).reshape(19, n_samples, 6).transpose(1, 0, 2)
+        return A, B
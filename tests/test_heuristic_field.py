@@ -0,0 +1,60 @@
+"""
+The HeuristicField is a lower bound of the path length: the straight line where it is free, more behind obstacles.
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+from smarc_modelling.motion_planning.MotionPrimitives.HeuristicField import HeuristicField
+from smarc_modelling.motion_planning.MotionPrimitives.OccupancyMap import OccupancyMap
+
+GOAL = (6.0, 2.0, 2.0)
+
+
+def tank(obstacles):
+    """
+    10 x 4 x 4 m tank with the obstacle cells (row=y, column=x, z) of 0.5 m
+    """
+    map_instance = {"x_max": 10, "y_max": 4, "z_max": 4, "x_min": 0, "y_min": 0, "z_min": 0, "TileSize": 0.5,
+                    "obstacleDict": obstacles}
+    map_instance["occupancyMap"] = OccupancyMap(map_instance)
+    return map_instance
+
+
+def random_points(n, seed=0):
+    return np.random.default_rng(seed).uniform([0, 0, 0], [10, 4, 4], (n, 3))
+
+
+def test_straight_line_without_obstacles():
+    field = HeuristicField(tank(set()), GOAL)
+    points = random_points(2000)
+
+    np.testing.assert_allclose(field(points), np.linalg.norm(points - GOAL, axis=1), rtol=0, atol=1e-9)
+
+
+def test_not_above_the_straight_line_in_free_space():
+    # Corner obstacle of 1 m
+    map_instance = tank({(0, 0, 0), (0, 1, 0), (1, 0, 0), (1, 1, 0)})
+    field = HeuristicField(map_instance, GOAL)
+    points = random_points(2000, seed=1)
+
+    # Points with a free line of sight to the goal, with a margin of two voxels
+    occupancy = map_instance["occupancyMap"]
+    visible = ~occupancy.capsule_collides(points, np.tile(GOAL, (len(points), 1)), 1.0) & ~occupancy.is_occupied(points)
+    assert visible.sum() > 1000
+
+    straight_line = np.linalg.norm(points - GOAL, axis=1)
+    h = field(points)
+    assert np.all(h[visible] <= straight_line[visible] + 1e-9)
+    assert np.all(h[visible] >= straight_line[visible] - 1e-9)
+
+
+def test_above_the_straight_line_behind_a_wall():
+    # Wall at 3 m <= x < 3.5 m with an opening at y > 3.5 m
+    # Point and goal on voxel centers, the path around the wall is about 6.8 m, the straight line 5.2 m
+    goal = (6.25, 2.25, 2.25)
+    field = HeuristicField(tank({(r, 6, z) for r in range(7) for z in range(8)}), goal)
+    point = np.array([[1.25, 0.75, 2.25]])
+
+    assert field(point)[0] > np.linalg.norm(point - goal) + 0.5
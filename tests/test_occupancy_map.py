@@ -0,0 +1,37 @@
+"""
+OccupancyMap.capsule_collides on batches with non-finite and long segments.
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+from smarc_modelling.motion_planning.MotionPrimitives.OccupancyMap import OccupancyMap
+
+
+def map_with_wall():
+    """
+    10 x 4 x 4 m tank with a wall at 3 m <= x < 3.5 m
+    """
+    return {"x_max": 10, "y_max": 4, "z_max": 4, "x_min": 0, "y_min": 0, "z_min": 0, "TileSize": 0.5,
+            "obstacleDict": {(r, 6, z) for r in range(8) for z in range(8)}}
+
+
+def test_non_finite_segments_collide():
+    occupancy = OccupancyMap(map_with_wall())
+    pointsA = np.array([[1.5, 2, 2], [np.nan, 2, 2], [8, 2, 2]])
+    pointsB = np.array([[0.5, 2, 2], [0.5, 2, 2], [np.inf, 2, 2]])
+
+    np.testing.assert_array_equal(occupancy.capsule_collides(pointsA, pointsB, 0.095), [False, True, True])
+
+
+def test_batch_matches_single_segments():
+    occupancy = OccupancyMap(map_with_wall())
+    rng = np.random.default_rng(0)
+    pointsA = rng.uniform([0, 0, 0], [10, 4, 4], (50, 3))
+    pointsB = pointsA + rng.normal(scale=0.7, size=(50, 3))
+    pointsB[0] = (9.5, 3.5, 3.5)
+    pointsA[0] = (0.5, 0.5, 0.5)
+
+    expected = [occupancy.capsule_collides(a, b, 0.095)[0] for a, b in zip(pointsA, pointsB)]
+    np.testing.assert_array_equal(occupancy.capsule_collides(pointsA, pointsB, 0.095), expected)
@@ -0,0 +1,64 @@
+"""
+Planner requests from several threads give the same results as the same requests one after the other.
+"""
+import threading
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+pytest.importorskip("casadi")
+pytest.importorskip("acados_template")
+
+from smarc_modelling.motion_planning.MotionPrimitives.Planner import Planner
+
+# Tank without obstacles (single tree search): (x_max, y_max, z_max, x_min, y_min, z_min)
+MAP_BOUNDARIES = (10, 4, 4, 0, 0, 0)
+MAP_RESOLUTION = 0.5
+
+
+def state(x, y, z):
+    """
+    SAM state at rest at (x, y, z), heading along x
+    """
+    x0 = np.zeros(19)
+    x0[0:3] = (x, y, z)
+    x0[3] = 1
+    return x0
+
+
+REQUESTS = [
+    (state(1.5, 2.0, 2.0), state(5.5, 2.0, 2.0)),
+    (state(2.0, 1.5, 1.5), state(6.0, 2.5, 2.5)),
+]
+
+
+def planner():
+    return Planner(MAP_BOUNDARIES, MAP_RESOLUTION, usePool=False)
+
+
+def test_parallel_plans_match_sequential_plans():
+    with planner() as sequential_planner:
+        expected = [sequential_planner.plan(start, goal) for start, goal in REQUESTS]
+
+    results = [None] * len(REQUESTS)
+    errors = []
+
+    def run(ii, shared_planner, start, goal):
+        try:
+            results[ii] = shared_planner.plan(start, goal)
+        except Exception as error:
+            errors.append(error)
+
+    with planner() as shared_planner:
+        threads = [threading.Thread(target=run, args=(ii, shared_planner, start, goal)) for ii, (start, goal) in enumerate(REQUESTS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert not errors
+    for (trajectory, success, notes), (expected_trajectory, expected_success, expected_notes) in zip(results, expected):
+        assert success == expected_success
+        assert notes == expected_notes
+        assert len(trajectory) == len(expected_trajectory)
+        np.testing.assert_allclose(np.array(trajectory, dtype=float), np.array(expected_trajectory, dtype=float), atol=1e-9)
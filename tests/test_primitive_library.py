@@ -0,0 +1,73 @@
+"""
+A built PrimitiveLibrary can be queried on a map with obstacles, also when some of its primitives diverged.
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+pytest.importorskip("torch")
+pytest.importorskip("matplotlib")
+
+from smarc_modelling.motion_planning.MotionPrimitives.MotionPrimitives import SAM_PRIMITIVES
+from smarc_modelling.motion_planning.MotionPrimitives.PrimitiveLibrary import PrimitiveLibrary
+import smarc_modelling.motion_planning.MotionPrimitives.MapGeneration as MapGen
+
+# Tank: (x_max, y_max, z_max, x_min, y_min, z_min)
+MAP_BOUNDARIES = (10, 4, 4, 0, 0, 0)
+MAP_RESOLUTION = 0.5
+
+# Wall at 3 m <= x < 3.5 m, cells (row=y, column=x, z)
+OBSTACLES = {(r, 6, z) for r in range(8) for z in range(8)}
+
+
+def input_pairs():
+    """
+    Inputs (rudder, rpm, stern, vbs, lcg) with their indices of u, including full deflections at full lcg
+    """
+    values = np.array(np.meshgrid([-7, 5], [-800, 0, 800], [-7, 0, 7], [50], [0, 100])).T.reshape(-1, 5)
+    return np.hstack((values, np.tile([3, 4, 2, 0, 1], (values.shape[0], 1))))
+
+
+def state_at_rest(x, y, z):
+    x0 = np.zeros(19)
+    x0[0:3] = (x, y, z)
+    x0[3] = 1
+    x0[13:15] = 50
+    return x0
+
+
+@pytest.fixture(scope="module")
+def library(tmp_path_factory):
+    sim = SAM_PRIMITIVES()
+    path = str(tmp_path_factory.mktemp("library"))
+    PrimitiveLibrary.build(path, sim, input_pairs(), grid={"u": [0, 0.5], "rpm1": [0, 400]}, n_validate=2)
+    return PrimitiveLibrary(path, sim)
+
+
+def test_lookup_on_a_map_with_obstacles(library):
+    start = state_at_rest(2, 2, 2)
+    map_instance = MapGen.generateMapInstance(start, state_at_rest(6, 2, 2), MAP_BOUNDARIES, MAP_RESOLUTION)
+    map_instance["obstacleDict"] = OBSTACLES
+
+    # At rest the start is on a seed
+    result = library.primitives(start, map_instance, 0.0, 1)
+    assert result is not None
+
+    data, costs, inObs, arrived = result
+    assert np.isfinite(data[~inObs]).all()
+    assert np.isfinite(costs[~inObs]).all()
+    assert library.meta["error_per_distance"] is not None
+    assert np.isfinite(library.meta["error_per_distance"])
+
+
+def test_diverged_primitives_are_rejected(library):
+    start = state_at_rest(2, 2, 2)
+    map_instance = MapGen.generateMapInstance(start, state_at_rest(6, 2, 2), MAP_BOUNDARIES, MAP_RESOLUTION)
+    map_instance["obstacleDict"] = OBSTACLES
+
+    data, _ = library.lookup(start, library.sim.primitiveLength(0.0))
+    data[0, :, 5:] = np.nan
+    costs, inObs, arrived = library.sim.checkPrimitives_batch(data, map_instance, 1)
+
+    assert inObs[0] and not arrived[0]
+    assert np.isfinite(costs[~inObs]).all()
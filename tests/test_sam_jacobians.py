@@ -0,0 +1,72 @@
+"""
+SAM.jacobians() agrees with central finite differences of SAM.dynamics().
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+pytest.importorskip("casadi")
+pytest.importorskip("torch")
+
+from smarc_modelling.vehicles.SAM import SAM
+
+
+def smooth_states(n, seed=0):
+    """
+    Random states and inputs away from the kinks of the model: the actuator
+    bounds, the rate limits of the VBS and LCG and the propeller direction
+    switch around 0 rpm
+    """
+    rng = np.random.default_rng(seed)
+    X = np.zeros((n, 19))
+    X[:, 0:3] = rng.normal(size=(n, 3))
+    q = rng.normal(size=(n, 4))
+    X[:, 3:7] = q / np.linalg.norm(q, axis=1, keepdims=True)
+    X[:, 7:13] = 0.5 * rng.normal(size=(n, 6))
+    X[:, 13:15] = rng.uniform(20, 80, (n, 2))
+    X[:, 15:17] = rng.uniform(-0.12, 0.12, (n, 2))
+    X[:, 17:19] = rng.choice([-1, 1], (n, 2)) * rng.uniform(300, 1500, (n, 2))
+
+    U = np.zeros((n, 6))
+    U[:, 0:2] = X[:, 13:15] + rng.choice([-1, 1], (n, 2)) * rng.uniform(2, 10, (n, 2))
+    U[:, 2:4] = rng.uniform(-0.12, 0.12, (n, 2))
+    U[:, 4:6] = rng.choice([-1, 1], (n, 2)) * rng.uniform(300, 1500, (n, 2))
+    return X, U
+
+
+def finite_differences(fun, z, rel_step=1e-6):
+    """
+    Central differences of fun at z, one column per entry of z
+    """
+    columns = []
+    for i in range(len(z)):
+        h = rel_step * max(1.0, abs(z[i]))
+        dz = np.zeros(len(z))
+        dz[i] = h
+        columns.append((fun(z + dz) - fun(z - dz)) / (2*h))
+    return np.stack(columns, axis=1)
+
+
+@pytest.mark.parametrize("V_current, beta_current", [(0, 0), (0.3, 40)])
+def test_jacobians_match_finite_differences(V_current, beta_current):
+    sam = SAM(dt=0.02, V_current=V_current, beta_current=beta_current)
+    X, U = smooth_states(10)
+
+    for x, u_ref in zip(X, U):
+        A, B = sam.jacobians(x, u_ref)
+        A_fd = finite_differences(lambda z: sam.dynamics(z, u_ref), x)
+        B_fd = finite_differences(lambda z: sam.dynamics(x, z), u_ref)
+
+        np.testing.assert_allclose(A, A_fd, rtol=1e-5, atol=1e-5)
+        np.testing.assert_allclose(B, B_fd, rtol=1e-5, atol=1e-5)
+
+
+def test_jacobians_batch_matches_jacobians():
+    sam = SAM(dt=0.02)
+    X, U = smooth_states(5, seed=1)
+
+    A_batch, B_batch = sam.jacobians_batch(X, U)
+    for x, u_ref, A_i, B_i in zip(X, U, A_batch, B_batch):
+        A, B = sam.jacobians(x, u_ref)
+        np.testing.assert_allclose(A_i, A, rtol=1e-12, atol=1e-12)
+        np.testing.assert_allclose(B_i, B, rtol=1e-12, atol=1e-12)
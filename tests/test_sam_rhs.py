@@ -0,0 +1,48 @@
+"""
+SAM.dynamics_rhs, and with it the source of the CasADi backend, evaluates the same model as SAM.dynamics().
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+pytest.importorskip("torch")
+
+from smarc_modelling.vehicles.SAM import SAM
+
+
+def random_states(n, seed=0):
+    """
+    Random states and inputs, with the actuators partly outside their bounds
+    """
+    rng = np.random.default_rng(seed)
+    X = np.zeros((n, 19))
+    X[:, 0:3] = rng.normal(size=(n, 3))
+    q = rng.normal(size=(n, 4))
+    X[:, 3:7] = q / np.linalg.norm(q, axis=1, keepdims=True)
+    X[:, 7:13] = 0.5 * rng.normal(size=(n, 6))
+    X[:, 13:15] = rng.uniform(-10, 110, (n, 2))
+    X[:, 15:17] = rng.uniform(-0.12, 0.12, (n, 2))
+    X[:, 17:19] = rng.uniform(-1500, 1500, (n, 2))
+
+    U = np.zeros((n, 6))
+    U[:, 0:2] = rng.uniform(-10, 110, (n, 2))
+    U[:, 2:4] = rng.uniform(-0.12, 0.12, (n, 2))
+    U[:, 4:6] = rng.uniform(-1500, 1500, (n, 2))
+    return X, U
+
+
+@pytest.mark.parametrize("V_current, beta_current", [(0, 0), (0.3, 40)])
+def test_dynamics_rhs_matches_dynamics(V_current, beta_current):
+    sam = SAM(dt=0.02, V_current=V_current, beta_current=beta_current)
+    X, U = random_states(200)
+    x_dot = np.empty(19)
+
+    for x, u_ref in zip(X, U):
+        np.testing.assert_allclose(sam.dynamics_rhs(x, u_ref, x_dot), sam.dynamics(x, u_ref), rtol=1e-9, atol=1e-9)
+
+
+def test_dynamics_rhs_refuses_piml_models():
+    sam = SAM(dt=0.02)
+    sam.piml_type = "nn"
+    with pytest.raises(ValueError):
+        sam.dynamics_rhs(np.zeros(19), np.zeros(6))
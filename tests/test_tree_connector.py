@@ -0,0 +1,42 @@
+"""
+TreeConnector returns node ids, a node replaced in place after the query is connected with its new state.
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+from smarc_modelling.motion_planning.MotionPrimitives.SpatialIndex import TreeConnector
+from smarc_modelling.motion_planning.MotionPrimitives.SearchGraph import SearchGraph
+
+
+class CellLattice():
+    """
+    One node per 1 m cell of the position
+    """
+    def key(self, state):
+        return tuple(np.floor(state[:3]).astype(int))
+
+
+def state_at(x, y, z):
+    state = np.zeros(19)
+    state[:3] = (x, y, z)
+    state[3] = 1
+    return state
+
+
+def test_connections_are_node_ids():
+    graph1 = SearchGraph(CellLattice())
+    graph2 = SearchGraph(CellLattice())
+    connector = TreeConnector(graph1, graph2)
+    id1 = graph1.set_node(state_at(0.2, 0.5, 0.5), -1, 1.0)
+    id2 = graph2.set_node(state_at(0.6, 0.5, 0.5), -1, 1.0)
+    connector.add_nodes(1, [id1])
+    connector.add_nodes(2, [id2])
+
+    assert connector.connections(1.0, 20) == [(id1, id2)]
+
+    # A cheaper node of the same cell replaces the first one, the pair now reads its state
+    replaced = graph1.set_node(state_at(0.4, 0.5, 0.5), -1, 0.5)
+    assert replaced == id1
+    np.testing.assert_array_equal(graph1.states[id1], state_at(0.4, 0.5, 0.5))